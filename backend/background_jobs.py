@@ -0,0 +1,81 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Background Jobs
+#
+# A small registry of per-task asyncio jobs that the agent graph runs off the
+# critical path (e.g. Memory Vault updates). Jobs are keyed by (kind, task_id):
+# one node schedules a job and a later node, possibly in a later turn,
+# collects its result and merges it into the graph state.
+#
+# Jobs live on the server's event loop, so they keep running between turns
+# of the same task. `cancel_task_jobs()` drops them when a task is deleted.
+# -----------------------------------------------------------------------------
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundJobs:
+    """Registry of at most one pending asyncio job per (kind, task_id)."""
+
+    def __init__(self):
+        self._jobs: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._stats = {"scheduled": 0, "collected": 0, "waited": 0, "failed": 0, "cancelled": 0}
+
+    def schedule(self, kind: str, task_id: str, coro: Awaitable[Any]) -> asyncio.Task:
+        """
+        Starts `coro` as the (kind, task_id) job. Callers are expected to
+        `collect()` the previous job first; one that is still registered is
+        cancelled, as its result would be based on stale state.
+        """
+        key = (kind, task_id)
+        previous = self._jobs.pop(key, None)
+        if previous is not None and not previous.done():
+            logger.warning(f"Task '{task_id}': Replacing unfinished '{kind}' background job.")
+            previous.cancel(); self._stats["cancelled"] += 1
+        job = asyncio.ensure_future(coro)
+        self._jobs[key] = job; self._stats["scheduled"] += 1
+        return job
+
+    def has_job(self, kind: str, task_id: str) -> bool:
+        return (kind, task_id) in self._jobs
+
+    def is_done(self, kind: str, task_id: str) -> bool:
+        job = self._jobs.get((kind, task_id))
+        return job is not None and job.done()
+
+    async def collect(self, kind: str, task_id: str) -> Optional[Any]:
+        """
+        Removes the (kind, task_id) job and returns its result, waiting for it
+        if it is still running. Returns None if there is no job or it failed.
+        """
+        job = self._jobs.pop((kind, task_id), None)
+        if job is None: return None
+        if not job.done():
+            self._stats["waited"] += 1
+            logger.info(f"Task '{task_id}': Waiting for the '{kind}' background job to finish.")
+        try:
+            result = await job
+            self._stats["collected"] += 1
+            return result
+        except asyncio.CancelledError:
+            if not job.cancelled(): raise
+            return None
+        except Exception as e:
+            self._stats["failed"] += 1
+            logger.error(f"Task '{task_id}': '{kind}' background job failed: {e}", exc_info=True)
+            return None
+
+    def cancel_task_jobs(self, task_id: str):
+        """Cancels and forgets every job belonging to `task_id`."""
+        for key in [key for key in self._jobs if key[1] == task_id]:
+            job = self._jobs.pop(key)
+            if not job.done(): job.cancel(); self._stats["cancelled"] += 1
+
+    def stats(self) -> dict:
+        return {**self._stats, "pending": sum(1 for job in self._jobs.values() if not job.done())}
+
+
+BACKGROUND_JOBS = BackgroundJobs()
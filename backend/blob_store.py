@@ -0,0 +1,76 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Blob Store for Large Tool Outputs
+#
+# Large tool outputs (long shell logs, extracted PDFs, scraped pages) used to
+# be copied verbatim into `tool_output`, `step_outputs`, `history` and
+# `messages`, and therefore into every checkpoint and every later prompt.
+#
+# Outputs above TOOL_OUTPUT_BLOB_THRESHOLD bytes are now written once to a
+# content-addressed store under the task workspace (`.blobs/<sha256>`), and
+# the graph state carries a short reference string instead:
+#
+#     [blob:sha256:<digest> <size> bytes]
+#     <first TOOL_OUTPUT_PREVIEW_CHARS characters of the output>
+#     ...
+#
+# The reference is a plain string, so prompts show the preview as-is and
+# checkpoints stay small. `resolve()` loads the full output only where it is
+# actually consumed (a later step's `{step_N_output}` placeholder).
+# -----------------------------------------------------------------------------
+
+import os
+import re
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR_NAME = ".blobs"
+TOOL_OUTPUT_BLOB_THRESHOLD = int(os.getenv("TOOL_OUTPUT_BLOB_THRESHOLD", "16384"))
+TOOL_OUTPUT_PREVIEW_CHARS = int(os.getenv("TOOL_OUTPUT_PREVIEW_CHARS", "2000"))
+
+_REFERENCE_PATTERN = re.compile(r"\[blob:sha256:([0-9a-f]{64}) (\d+) bytes\]\n")
+
+
+def _blob_path(workspace_path: str, digest: str) -> str:
+    return os.path.join(workspace_path, BLOB_DIR_NAME, digest[:2], digest)
+
+
+def externalize(workspace_path: str, text: str) -> str:
+    """
+    Returns `text` unchanged if it is small, otherwise stores it in the
+    workspace blob store and returns a reference with a preview.
+    """
+    data = text.encode("utf-8")
+    if len(data) <= TOOL_OUTPUT_BLOB_THRESHOLD or not workspace_path: return text
+    digest = hashlib.sha256(data).hexdigest(); path = _blob_path(workspace_path, digest)
+    try:
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f: f.write(data)
+            os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Could not store tool output in blob store at '{path}': {e}. Keeping it inline.")
+        return text
+    logger.info(f"Stored {len(data)}-byte tool output as blob {digest[:12]}.")
+    return (f"[blob:sha256:{digest} {len(data)} bytes]\n{text[:TOOL_OUTPUT_PREVIEW_CHARS]}\n"
+            f"... [output truncated; {len(data)} bytes in total. The full output is passed to steps that reference it.]")
+
+
+def is_reference(value) -> bool:
+    return isinstance(value, str) and _REFERENCE_PATTERN.match(value) is not None
+
+
+def resolve(workspace_path: str, value):
+    """Returns the full output behind a blob reference, or `value` itself if it is not one."""
+    if not isinstance(value, str): return value
+    match = _REFERENCE_PATTERN.match(value)
+    if not match: return value
+    path = _blob_path(workspace_path, match.group(1))
+    try:
+        with open(path, "rb") as f: return f.read().decode("utf-8")
+    except OSError as e:
+        logger.error(f"Blob '{match.group(1)[:12]}' could not be read from '{path}': {e}. Using its preview.")
+        return value
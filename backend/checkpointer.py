@@ -0,0 +1,328 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Durable Checkpointer
+#
+# A LangGraph checkpoint saver backed by a local SQLite file, replacing the
+# in-process `MemorySaver` so that tasks survive a restart (a plan waiting for
+# approval can still be resumed after a redeploy) and checkpoints no longer
+# accumulate in RAM.
+#
+# Storage Layout:
+# 1. `checkpoints`: One row per checkpoint, without its channel values.
+# 2. `blobs`: Channel values keyed by (channel, version). A value is only
+#    written when the channel's version changes (`new_versions`), so each
+#    checkpoint stores a delta and unchanged channels are shared between
+#    checkpoints. Large values are zlib-compressed.
+# 3. `writes`: Pending writes of the tasks of a checkpoint.
+# 4. `chunks`: Full chunks of `AppendOnlyLog` channels (`messages`,
+#    `history`), content-addressed. A log's blob only lists its chunk
+#    digests plus the partial tail, so the shared prefix of a growing log is
+#    stored once instead of once per checkpoint.
+#
+# Retention: `compact()` keeps the last CHECKPOINT_KEEP_LAST checkpoints of
+# every thread plus those pinned with `pin_checkpoint()` (plans paused for
+# human approval) and the direct parent of each, then drops the blobs no
+# remaining checkpoint references.
+# `run_compaction_loop()` runs it periodically from the server.
+#
+# Configuration (see `.env.example`):
+# - CHECKPOINT_BACKEND: "sqlite" (default) or "memory".
+# - CHECKPOINT_DB_PATH, CHECKPOINT_KEEP_LAST, CHECKPOINT_COMPACTION_INTERVAL
+# -----------------------------------------------------------------------------
+
+import os
+import json
+import zlib
+import hashlib
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+from .state_reducers import AppendOnlyLog, OverlayMapping
+
+try:
+    from langgraph.constants import TASKS
+except ImportError:
+    TASKS = "__pregel_tasks"
+
+logger = logging.getLogger(__name__)
+
+_COMPRESS_MIN_BYTES = 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '', checkpoint_id TEXT NOT NULL, parent_checkpoint_id TEXT,
+    type TEXT, checkpoint BLOB, compressed INTEGER, metadata_type TEXT, metadata BLOB, channel_versions TEXT,
+    has_pending_sends INTEGER DEFAULT 0, pinned INTEGER DEFAULT 0,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '', channel TEXT NOT NULL, version TEXT NOT NULL,
+    type TEXT, blob BLOB, compressed INTEGER,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '', checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT, blob BLOB, compressed INTEGER, task_path TEXT DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL DEFAULT '', digest TEXT NOT NULL,
+    type TEXT, blob BLOB, compressed INTEGER,
+    PRIMARY KEY (thread_id, checkpoint_ns, digest)
+);
+"""
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    """Checkpoint saver storing delta-encoded, compressed checkpoints in SQLite (WAL mode)."""
+
+    def __init__(self, db_path: str, keep_last: int = 20, *, serde=None):
+        super().__init__(serde=serde)
+        self.db_path = db_path
+        self.keep_last = keep_last
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._stored_chunks = set()
+        self._stats = {"puts": 0, "blobs_written": 0, "blobs_reused": 0, "chunks_written": 0, "chunks_reused": 0, "compactions": 0, "checkpoints_pruned": 0, "blobs_pruned": 0}
+        logger.info(f"Checkpoint database opened at '{db_path}' (keeping the last {keep_last} checkpoints per thread).")
+
+    # --- Serialization ---
+    @staticmethod
+    def _pack(data: bytes) -> Tuple[bytes, int]:
+        return (zlib.compress(data), 1) if len(data) >= _COMPRESS_MIN_BYTES else (data, 0)
+
+    def _dump(self, value: Any) -> Tuple[str, bytes, int]:
+        type_, data = self.serde.dumps_typed(value)
+        return (type_, *self._pack(data))
+
+    def _load(self, type_: str, data: bytes, compressed: int) -> Any:
+        return self.serde.loads_typed((type_, zlib.decompress(data) if compressed else data))
+
+    def _dump_channel_value(self, thread_id: str, checkpoint_ns: str, value: Any) -> Tuple[str, bytes, int]:
+        """Like `_dump`, but stores the full chunks of an `AppendOnlyLog` once, by digest."""
+        if isinstance(value, OverlayMapping): value = value.to_dict()
+        if not isinstance(value, AppendOnlyLog): return self._dump(value)
+        digests = []
+        for node in value.full_nodes():
+            digest = node.__dict__.get("_digest")
+            if digest is not None and (thread_id, checkpoint_ns, digest) in self._stored_chunks:
+                self._stats["chunks_reused"] += 1; digests.append(digest); continue
+            chunk_type, chunk_data = self.serde.dumps_typed(list(node.chunk))
+            digest = digest or hashlib.sha256(chunk_type.encode() + b"\0" + chunk_data).hexdigest()
+            self._conn.execute("INSERT OR IGNORE INTO chunks (thread_id, checkpoint_ns, digest, type, blob, compressed) VALUES (?, ?, ?, ?, ?, ?)", (thread_id, checkpoint_ns, digest, chunk_type, *self._pack(chunk_data)))
+            object.__setattr__(node, "_digest", digest); self._stored_chunks.add((thread_id, checkpoint_ns, digest)); self._stats["chunks_written"] += 1
+            digests.append(digest)
+        tail_type, tail_data = self.serde.dumps_typed(list(value.tail()))
+        return ("appendlog", *self._pack(json.dumps({"chunks": digests, "tail_type": tail_type}).encode() + b"\n" + tail_data))
+
+    def _load_channel_value(self, thread_id: str, checkpoint_ns: str, type_: str, data: bytes, compressed: int) -> Any:
+        if type_ != "appendlog": return self._load(type_, data, compressed)
+        header, _, tail_data = (zlib.decompress(data) if compressed else data).partition(b"\n"); header = json.loads(header)
+        full_chunks = []
+        for digest in header["chunks"]:
+            chunk_row = self._conn.execute("SELECT type, blob, compressed FROM chunks WHERE thread_id = ? AND checkpoint_ns = ? AND digest = ?", (thread_id, checkpoint_ns, digest)).fetchone()
+            if chunk_row is None: raise ValueError(f"Checkpoint chunk '{digest}' of thread '{thread_id}' is missing.")
+            full_chunks.append(self._load(*chunk_row))
+        log = AppendOnlyLog.from_chunks(full_chunks, self.serde.loads_typed((header["tail_type"], tail_data)))
+        for node, digest in zip(log.full_nodes(), header["chunks"]):
+            object.__setattr__(node, "_digest", digest); self._stored_chunks.add((thread_id, checkpoint_ns, digest))
+        return log
+
+    @staticmethod
+    def _log_chunk_digests(data: bytes, compressed: int) -> list:
+        return json.loads((zlib.decompress(data) if compressed else data).partition(b"\n")[0])["chunks"]
+
+    @staticmethod
+    def _config_keys(config: RunnableConfig) -> Tuple[str, str, Optional[str]]:
+        configurable = config["configurable"]
+        return configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable.get("checkpoint_id")
+
+    # --- Reads ---
+    def _row_to_tuple(self, row: Sequence[Any]) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, data, compressed, metadata_type, metadata, _, has_pending_sends, _ = row
+        checkpoint = self._load(type_, data, compressed)
+        channel_values = {}
+        for channel, version in checkpoint["channel_versions"].items():
+            blob_row = self._conn.execute("SELECT type, blob, compressed FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?", (thread_id, checkpoint_ns, channel, str(version))).fetchone()
+            if blob_row is not None and blob_row[0] != "empty": channel_values[channel] = self._load_channel_value(thread_id, checkpoint_ns, *blob_row)
+        checkpoint = {**checkpoint, "channel_values": channel_values}
+        if has_pending_sends:
+            sends = self._conn.execute("SELECT type, blob, compressed FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel = ? ORDER BY task_id, idx", (thread_id, checkpoint_ns, parent_checkpoint_id, TASKS)).fetchall() if parent_checkpoint_id else []
+            checkpoint["pending_sends"] = [self._load(*send) for send in sends]
+        pending_writes = [(task_id, channel, self._load(w_type, w_blob, w_compressed)) for task_id, channel, w_type, w_blob, w_compressed in self._conn.execute(
+            "SELECT task_id, channel, type, blob, compressed FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx", (thread_id, checkpoint_ns, checkpoint_id))]
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=checkpoint,
+            metadata=self._load(metadata_type, metadata, 0),
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}} if parent_checkpoint_id else None,
+            pending_writes=pending_writes,
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id, checkpoint_ns, checkpoint_id = self._config_keys(config)
+        with self._lock:
+            if checkpoint_id: row = self._conn.execute("SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id)).fetchone()
+            else: row = self._conn.execute("SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1", (thread_id, checkpoint_ns)).fetchone()
+            return self._row_to_tuple(row) if row is not None else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None, before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        query, params = "SELECT * FROM checkpoints WHERE 1 = 1", []
+        if config is not None:
+            thread_id, checkpoint_ns, checkpoint_id = config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns"), config["configurable"].get("checkpoint_id")
+            query += " AND thread_id = ?"; params.append(thread_id)
+            if checkpoint_ns is not None: query += " AND checkpoint_ns = ?"; params.append(checkpoint_ns)
+            if checkpoint_id: query += " AND checkpoint_id = ?"; params.append(checkpoint_id)
+        if before is not None and before["configurable"].get("checkpoint_id"): query += " AND checkpoint_id < ?"; params.append(before["configurable"]["checkpoint_id"])
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            results = []
+            for row in rows:
+                checkpoint_tuple = self._row_to_tuple(row)
+                if filter and not all(checkpoint_tuple.metadata.get(key) == value for key, value in filter.items()): continue
+                results.append(checkpoint_tuple)
+                if limit is not None and len(results) >= limit: break
+        yield from results
+
+    # --- Writes ---
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id, checkpoint_ns, parent_checkpoint_id = self._config_keys(config)
+        stored = dict(checkpoint); channel_values = stored.pop("channel_values", {}); has_pending_sends = stored.pop("pending_sends", None) is not None
+        type_, data, compressed = self._dump(stored); metadata_type, metadata_data = self.serde.dumps_typed(metadata)
+        channel_versions_json = json.dumps({channel: str(version) for channel, version in checkpoint["channel_versions"].items()})
+        with self._lock:
+            for channel, version in new_versions.items():
+                blob_type, blob, blob_compressed = self._dump_channel_value(thread_id, checkpoint_ns, channel_values[channel]) if channel in channel_values else ("empty", b"", 0)
+                self._conn.execute("INSERT OR REPLACE INTO blobs (thread_id, checkpoint_ns, channel, version, type, blob, compressed) VALUES (?, ?, ?, ?, ?, ?, ?)", (thread_id, checkpoint_ns, channel, str(version), blob_type, blob, blob_compressed))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, compressed, metadata_type, metadata, channel_versions, has_pending_sends) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_checkpoint_id, type_, data, compressed, metadata_type, metadata_data, channel_versions_json, int(has_pending_sends)))
+            self._conn.commit()
+            self._stats["puts"] += 1; self._stats["blobs_written"] += len(new_versions); self._stats["blobs_reused"] += len(checkpoint["channel_versions"]) - len(new_versions)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id, checkpoint_ns, checkpoint_id = self._config_keys(config)
+        with self._lock:
+            for idx, (channel, value) in enumerate(writes):
+                # Special channels (errors, interrupts, ...) overwrite their slot; regular writes are only stored once.
+                verb = "INSERT OR REPLACE" if channel in WRITES_IDX_MAP else "INSERT OR IGNORE"
+                w_type, w_blob, w_compressed = self._dump(value)
+                self._conn.execute(f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, blob, compressed, task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, w_type, w_blob, w_compressed, task_path))
+            self._conn.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for table in ("checkpoints", "blobs", "writes", "chunks"): self._conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self._conn.commit(); self._stored_chunks = {key for key in self._stored_chunks if key[0] != thread_id}
+        logger.info(f"Task '{thread_id}': Deleted all checkpoints.")
+
+    def pin_checkpoint(self, config: RunnableConfig) -> None:
+        """Exempts a checkpoint (e.g. a plan paused for approval) from retention."""
+        thread_id, checkpoint_ns, checkpoint_id = self._config_keys(config)
+        with self._lock:
+            self._conn.execute("UPDATE checkpoints SET pinned = 1 WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id)); self._conn.commit()
+
+    # --- Async API (SQLite calls are short; they run in a worker thread to keep the event loop free) ---
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None, before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        for checkpoint_tuple in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit))): yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # --- Retention ---
+    def compact(self, keep_last: Optional[int] = None) -> dict:
+        """
+        Keeps the newest `keep_last` checkpoints of every thread plus the pinned
+        ones and the direct parents of both, and drops the writes and blobs
+        that only pruned checkpoints used. The pending sends (TASKS writes) of
+        a pruned parent are kept, since its child loads `pending_sends` from
+        them.
+        """
+        # The newest checkpoint of a thread is always kept: it is the one a resumed or continued task starts from.
+        keep_last = max(1, self.keep_last if keep_last is None else keep_last); pruned_checkpoints = pruned_blobs = 0
+        with self._lock:
+            for thread_id, checkpoint_ns in self._conn.execute("SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoints").fetchall():
+                rows = self._conn.execute("SELECT checkpoint_id, pinned, channel_versions, parent_checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC", (thread_id, checkpoint_ns)).fetchall()
+                parents = {row[0]: row[3] for row in rows}
+                kept_ids = {row[0] for index, row in enumerate(rows) if index < keep_last or row[1]}
+                # The direct parent of every kept checkpoint is kept too, so its history can still be walked from there.
+                kept_ids |= {parents[checkpoint_id] for checkpoint_id in kept_ids if parents[checkpoint_id] in parents}
+                # A checkpoint's `pending_sends` are read from its parent's writes; keep those of the parents that are pruned.
+                send_sources = {parents[checkpoint_id] for checkpoint_id in kept_ids if parents[checkpoint_id]} - kept_ids
+                kept = [row for row in rows if row[0] in kept_ids]
+                dropped = [row[0] for row in rows if row[0] not in kept_ids]
+                if not dropped: continue
+                for checkpoint_id in dropped:
+                    self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id))
+                # Also sweeps the sends kept for a parent pruned in an earlier compaction once no kept checkpoint needs them.
+                for (checkpoint_id, channel) in self._conn.execute("SELECT DISTINCT checkpoint_id, channel FROM writes WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, checkpoint_ns)).fetchall():
+                    if checkpoint_id not in kept_ids and not (checkpoint_id in send_sources and channel == TASKS):
+                        self._conn.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel = ?", (thread_id, checkpoint_ns, checkpoint_id, channel))
+                referenced = {(channel, version) for row in kept for channel, version in json.loads(row[2]).items()}
+                for channel, version in self._conn.execute("SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, checkpoint_ns)).fetchall():
+                    if (channel, version) not in referenced:
+                        self._conn.execute("DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?", (thread_id, checkpoint_ns, channel, version)); pruned_blobs += 1
+                referenced_chunks = {digest for data, compressed in self._conn.execute("SELECT blob, compressed FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND type = 'appendlog'", (thread_id, checkpoint_ns)) for digest in self._log_chunk_digests(data, compressed)}
+                for (digest,) in self._conn.execute("SELECT digest FROM chunks WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, checkpoint_ns)).fetchall():
+                    if digest not in referenced_chunks:
+                        self._conn.execute("DELETE FROM chunks WHERE thread_id = ? AND checkpoint_ns = ? AND digest = ?", (thread_id, checkpoint_ns, digest)); self._stored_chunks.discard((thread_id, checkpoint_ns, digest))
+                pruned_checkpoints += len(dropped)
+            self._conn.commit()
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._stats["compactions"] += 1; self._stats["checkpoints_pruned"] += pruned_checkpoints; self._stats["blobs_pruned"] += pruned_blobs
+        if pruned_checkpoints: logger.info(f"Checkpoint compaction pruned {pruned_checkpoints} checkpoint(s) and {pruned_blobs} blob(s).")
+        return {"checkpoints_pruned": pruned_checkpoints, "blobs_pruned": pruned_blobs}
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("checkpoints", "blobs", "writes", "chunks")}
+            return {**self._stats, **counts}
+
+
+async def run_compaction_loop(saver: SqliteCheckpointSaver, interval: float):
+    """Periodically compacts the checkpoint database in a worker thread."""
+    while True:
+        await asyncio.sleep(interval)
+        try: await asyncio.to_thread(saver.compact)
+        except Exception as e: logger.error(f"Checkpoint compaction failed: {e}", exc_info=True)
+
+
+def create_checkpointer():
+    """Returns the checkpointer selected by CHECKPOINT_BACKEND, falling back to `MemorySaver`."""
+    backend = os.getenv("CHECKPOINT_BACKEND", "sqlite").lower()
+    if backend == "memory": return MemorySaver()
+    db_path = os.getenv("CHECKPOINT_DB_PATH", "/app/data/checkpoints.sqlite")
+    try: return SqliteCheckpointSaver(db_path, keep_last=int(os.getenv("CHECKPOINT_KEEP_LAST", "20")))
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Could not open checkpoint database '{db_path}': {e}. Falling back to in-memory checkpoints.")
+        return MemorySaver()
@@ -0,0 +1,98 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Rule-Based Step Evaluators
+#
+# Deterministic pre-evaluation for the Project_Supervisor. Many tool outputs
+# are unambiguous ("Error: Command failed with exit code 1", "Successfully
+# wrote 120 characters to 'report.md'."), so asking the LLM whether the step
+# succeeded is wasted latency and tokens.
+#
+# Each evaluator receives the executed tool call and the tool's output and
+# returns an evaluation ({"status": "success" | "failure", "reasoning": ...})
+# when the outcome is certain, or None when it is ambiguous, in which case
+# the Project_Supervisor falls back to the LLM.
+#
+# Evaluators are pluggable: any module (including a Tool Forge tool) can add
+# one for its tool with `@register_evaluator("tool_name")`.
+# -----------------------------------------------------------------------------
+
+import re
+import logging
+from typing import Callable, Dict, Optional
+
+from . import blob_store
+
+logger = logging.getLogger(__name__)
+
+Evaluator = Callable[[dict, str], Optional[dict]]
+
+EVALUATORS: Dict[str, Evaluator] = {}
+EVALUATOR_STATS = {"rule_based": 0, "llm_fallback": 0}
+
+# Prefixes the Worker and the built-in tools use for failed executions.
+_FAILURE_PREFIXES = ("Error:", "Error writing file:", "Error reading file:", "Error listing files:", "An error occurred while executing the tool:", "An unexpected error occurred:")
+
+
+def register_evaluator(tool_name: str) -> Callable[[Evaluator], Evaluator]:
+    """Decorator registering a deterministic evaluator for `tool_name`."""
+    def decorator(evaluator: Evaluator) -> Evaluator:
+        EVALUATORS[tool_name] = evaluator
+        return evaluator
+    return decorator
+
+
+def _success(reasoning: str) -> dict:
+    return {"status": "success", "reasoning": f"Rule-based check: {reasoning}"}
+
+
+def _failure(reasoning: str) -> dict:
+    return {"status": "failure", "reasoning": f"Rule-based check: {reasoning}"}
+
+
+def _visible_text(tool_output: str) -> str:
+    """The output itself, or the preview of an output kept in the blob store."""
+    if blob_store.is_reference(tool_output): return tool_output.split("\n", 1)[1]
+    return tool_output
+
+
+@register_evaluator("write_file")
+def _evaluate_write_file(tool_call: dict, tool_output: str) -> Optional[dict]:
+    match = re.match(r"Successfully wrote (\d+) characters to '(.+)'\.", tool_output)
+    if match and int(match.group(1)) > 0: return _success(f"{match.group(1)} characters were written to '{match.group(2)}'.")
+    return None
+
+
+# read_file and list_files have no evaluator: whether their content satisfies the step
+# ("check that report.md exists") is for the LLM to judge. Their errors are caught by the
+# failure-prefix rules in `evaluate_step`.
+
+
+@register_evaluator("workspace_shell")
+def _evaluate_workspace_shell(tool_call: dict, tool_output: str) -> Optional[dict]:
+    # Output of a successful command may or may not satisfy the step; only the silent case is certain.
+    if tool_output == "Command executed successfully with no output.": return _success("The command exited with status 0.")
+    return None
+
+
+@register_evaluator("pip_install")
+def _evaluate_pip_install(tool_call: dict, tool_output: str) -> Optional[dict]:
+    if tool_output.startswith("Successfully installed package"): return _success("The package was installed into the task's virtual environment.")
+    return None
+
+
+def evaluate_step(tool_call: Optional[dict], tool_output: Optional[str]) -> Optional[dict]:
+    """
+    Returns a deterministic evaluation of a step's outcome, or None if the
+    output is ambiguous and the LLM has to judge it.
+    """
+    tool_call = tool_call or {}; text = _visible_text(str(tool_output or ""))
+    tool_name = tool_call.get("tool_name")
+    if "error" in tool_call: evaluation = _failure(f"No valid tool call could be made: {tool_call['error']}")
+    elif (exit_code := re.match(r"Error: Command failed with exit code (-?\d+)", text)): evaluation = _failure(f"The command failed with exit code {exit_code.group(1)}.")
+    elif text.startswith(_FAILURE_PREFIXES): evaluation = _failure(f"The tool reported an error: {text.splitlines()[0][:300]}")
+    elif tool_name in EVALUATORS:
+        try: evaluation = EVALUATORS[tool_name](tool_call, text)
+        except Exception as e:
+            logger.error(f"Evaluator for '{tool_name}' raised an error: {e}", exc_info=True); evaluation = None
+    else: evaluation = None
+    EVALUATOR_STATS["rule_based" if evaluation is not None else "llm_fallback"] += 1
+    return evaluation
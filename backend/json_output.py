@@ -0,0 +1,209 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Structured LLM Output
+#
+# Every node that expects JSON from the LLM (Handyman, Chief_Architect,
+# Site_Foreman, Project_Supervisor, Correction_Planner, Memory_Updater, the
+# fused Router) used to recover it with a ```json fence regex and
+# `json.loads`. A single stray comma or a response cut off at the token limit
+# burned a whole Correction_Planner cycle or silently dropped a vault update.
+#
+# Components:
+# 1. `parse_json_output`: Tries the strict parse first. If that fails, a local
+#    repair pass extracts the JSON from fences or surrounding prose and drops
+#    trailing commas. Truncated strings, objects and lists are only closed for
+#    roles in TRUNCATION_REPAIR_ROLES; for tool calls and plans a cut-off
+#    value would run with partial arguments or lose steps, so it fails.
+# 2. `NODE_SCHEMAS`: The expected top-level type and required keys per role.
+#    A response that parses but does not match is rejected like a parse error.
+# 3. `JSON_OUTPUT_STATS`: Per-role counts of strict parses, repaired parses
+#    (parse failures avoided), schema rejections and unrecoverable failures.
+# 4. `StreamingJSONExtractor`: Detects the end of the first JSON value in a
+#    streamed response in one pass, and parses each element at `item_depth`
+#    (e.g. a plan step) once, as soon as it closes, for progress display.
+#
+# Provider-side JSON mode (see `llm_factory.get_llm_by_id(json_mode=True)`)
+# makes repairs rare; this module keeps working for providers without it.
+# -----------------------------------------------------------------------------
+
+import re
+import json
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class JSONOutputError(ValueError):
+    """Raised when an LLM response contains no usable JSON, or JSON of the wrong shape."""
+
+
+# role -> (accepted top-level type(s), required keys for objects)
+NODE_SCHEMAS: Dict[str, Tuple[Any, Tuple[str, ...]]] = {
+    "router": (dict, ("route",)),
+    "handyman": (dict, ("tool_name", "tool_input")),
+    "site_foreman": (dict, ("tool_name", "tool_input")),
+    "chief_architect": (dict, ("plan",)),
+    "project_supervisor": (dict, ("status",)),
+    "correction_planner": (dict, ("instruction",)),
+    "memory_updater": ((list, dict), ()),
+}
+
+# Roles whose truncated responses may be completed (closing strings and brackets, dropping
+# the cut-off element). A truncated tool call or plan is a failure instead.
+TRUNCATION_REPAIR_ROLES = {"project_supervisor", "correction_planner", "memory_updater"}
+
+JSON_OUTPUT_STATS: Dict[str, Dict[str, int]] = defaultdict(lambda: {"parsed": 0, "repaired": 0, "truncated": 0, "invalid": 0, "failed": 0})
+
+_FENCE_PATTERN = re.compile(r"```(?:json)?\s*([\s\S]*?)\s*```", re.IGNORECASE)
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _strict_candidate(text: str) -> str:
+    """What the nodes used to feed to `json.loads`: the fenced block, or the whole response."""
+    match = _FENCE_PATTERN.search(text)
+    return match.group(1).strip() if match else text.strip()
+
+
+def _scan(text: str) -> Tuple[str, List[str], bool, List[Tuple[int, List[str]]]]:
+    """
+    Copies the first JSON value in `text`, dropping trailing commas and
+    anything after the value. Returns the copy, the brackets still open at the
+    end, whether a string is still open, and the positions (with the open
+    brackets at that point) of the commas seen, for cutting back truncations.
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0: return "", [], False, []
+    out: List[str] = []; stack: List[str] = []; commas: List[Tuple[int, List[str]]] = []
+    in_string = escaped = False
+    for char in text[start:]:
+        if in_string:
+            out.append(char)
+            if escaped: escaped = False
+            elif char == "\\": escaped = True
+            elif char == '"': in_string = False
+            continue
+        if char == '"': in_string = True
+        elif char in _CLOSERS: stack.append(_CLOSERS[char])
+        elif char in "}]":
+            while out and out[-1] in " \t\r\n,": out.pop()
+            if not stack or stack[-1] != char: break
+            stack.pop(); out.append(char)
+            if not stack: break
+            continue
+        elif char == ",": commas.append((len(out), list(stack)))
+        out.append(char)
+    return "".join(out), stack, in_string, commas
+
+
+def _close(fragment: str, stack: List[str]) -> str:
+    fragment = fragment.rstrip().rstrip(",").rstrip()
+    if fragment.endswith(":"): fragment += " null"
+    return fragment + "".join(reversed(stack))
+
+
+def _repair(text: str, allow_truncated: bool = True) -> Tuple[Any, bool]:
+    """
+    Best-effort recovery of a fenced, wrapped, trailing-comma or (with
+    `allow_truncated`) truncated JSON value. Returns (value, was_truncated).
+    """
+    fenced = _FENCE_PATTERN.search(text)
+    fragment, stack, in_string, commas = _scan(fenced.group(1) if fenced else text)
+    if not fragment: raise JSONOutputError("The response contains no JSON object or array.")
+    truncated = bool(stack) or in_string
+    if truncated and not allow_truncated: raise JSONOutputError("The response JSON is truncated.")
+    candidates = [_close(fragment + ('"' if in_string else ""), stack)]
+    # A value cut off mid-key or mid-literal cannot be completed; fall back to the last complete element.
+    candidates += [_close(fragment[:position], open_brackets) for position, open_brackets in reversed(commas[-8:])]
+    last_error: Optional[Exception] = None
+    for candidate in candidates:
+        try: return json.loads(candidate), truncated
+        except json.JSONDecodeError as e: last_error = e
+    raise JSONOutputError(f"The response JSON could not be repaired: {last_error}")
+
+
+def _validate(value: Any, role: Optional[str]) -> None:
+    if role not in NODE_SCHEMAS: return
+    expected_type, required_keys = NODE_SCHEMAS[role]
+    if not isinstance(value, expected_type): raise JSONOutputError(f"Expected {getattr(expected_type, '__name__', 'an object or a list')} for '{role}', got {type(value).__name__}.")
+    missing = [key for key in required_keys if isinstance(value, dict) and key not in value]
+    if missing: raise JSONOutputError(f"The '{role}' response is missing required key(s): {', '.join(missing)}.")
+
+
+def parse_json_output(text: str, role: Optional[str] = None) -> Any:
+    """
+    Returns the JSON value in an LLM response, repairing it if needed, and
+    checks it against the role's schema. Raises `JSONOutputError`.
+    """
+    stats = JSON_OUTPUT_STATS[role or "unknown"]
+    try: value = json.loads(_strict_candidate(text)); outcome = "parsed"
+    except json.JSONDecodeError as strict_error:
+        try: value, truncated = _repair(text, allow_truncated=role in TRUNCATION_REPAIR_ROLES); outcome = "truncated" if truncated else "repaired"
+        except JSONOutputError as repair_error:
+            stats["failed"] += 1; raise JSONOutputError(f"Invalid JSON: {strict_error} ({repair_error})")
+    try: _validate(value, role)
+    except JSONOutputError:
+        stats["invalid"] += 1; raise
+    stats[outcome] += 1
+    if outcome == "repaired": logger.info(f"Repaired malformed JSON from '{role}' ({stats['repaired']} parse failure(s) avoided for this role).")
+    elif outcome == "truncated": logger.warning(f"Completed a truncated JSON response from '{role}'; its last element may be missing.")
+    return value
+
+
+class StreamingJSONExtractor:
+    """
+    Consumes a streamed LLM response chunk by chunk. `feed` returns the text of
+    the first top-level JSON value as soon as its closing bracket arrives, so a
+    caller can act on it while the model is still generating.
+
+    With `item_depth`, every object or list that opens at that nesting depth
+    (1 = the top-level value, 3 = the steps in `{"plan": [...]}`) is parsed
+    once when it closes and appended to `items`. The scan is incremental, so
+    the whole stream costs linear time however often the caller checks.
+    """
+
+    def __init__(self, item_depth: Optional[int] = None):
+        self._parts: List[str] = []; self._length = 0; self._start: Optional[int] = None
+        self._depth = 0; self._in_string = self._escaped = False
+        self._item_depth = item_depth; self._item_chars: List[str] = []
+        self.items: List[Any] = []
+        self.value_text: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.value_text is not None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def _close_item(self):
+        try: self.items.append(json.loads("".join(self._item_chars)))
+        except json.JSONDecodeError: pass
+        self._item_chars = []
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Appends a chunk. Returns the complete JSON text once (on the chunk that completes it), else None."""
+        offset = self._length; self._parts.append(chunk); self._length += len(chunk)
+        if self.done: return None
+        for i, char in enumerate(chunk):
+            if self._start is None:
+                if char in _CLOSERS: self._start = offset + i; self._depth = 1
+                else: continue
+            elif self._in_string:
+                if self._escaped: self._escaped = False
+                elif char == "\\": self._escaped = True
+                elif char == '"': self._in_string = False
+            elif char == '"': self._in_string = True
+            elif char in _CLOSERS: self._depth += 1
+            elif char in "}]": self._depth -= 1
+            if self._item_depth is not None and (self._depth >= self._item_depth or (self._item_chars and char in "}]")):
+                self._item_chars.append(char)
+                if self._depth == self._item_depth - 1: self._close_item()
+            if self._depth == 0:
+                self.value_text = self.text[self._start:offset + i + 1]; return self.value_text
+        return None
+
+
+def json_output_stats() -> Dict[str, Dict[str, int]]:
+    return {role: dict(counts) for role, counts in JSON_OUTPUT_STATS.items()}
@@ -1,20 +1,20 @@
 # -----------------------------------------------------------------------------
-# Mentor::i Core Agent (Phase 17 - Correction Insertion)
+# Mentor::i Core Agent (Phase 29 - Streaming JSON Dispatch)
 #
-# This version significantly improves the self-correction mechanism. Instead of
-# overwriting a failed step, the agent now inserts a new corrective step
-# before it, preserving the original intent of the plan.
+# This version stops waiting for the end of an LLM response once the JSON in
+# it is complete.
 #
 # Key Architectural Changes:
-# 1. Smarter `correction_planner_node`:
-#    - It now uses `list.insert()` to add a new corrective step at the
-#      current index rather than overwriting it.
-#    - After insertion, it iterates through the rest of the plan and
-#      updates the `step_id` of all subsequent steps to maintain sequential
-#      numbering. This is critical for the UI and for data piping.
-# 2. Preserved Intent: This change ensures that after fixing a problem (like
-#    installing a missing library), the agent will then retry the original
-#    step that failed, making the process more logical and robust.
+# 1. `_astream_json_output`: Handyman, Site_Foreman and Chief_Architect
+#    stream their LLM calls through `StreamingJSONExtractor` and return as
+#    soon as the top-level JSON value closes, so the Worker starts while the
+#    model would otherwise still be writing trailing prose.
+# 2. Live Plans: Each plan step is parsed once as soon as it closes, and the
+#    Chief_Architect dispatches `plan_partial` custom events with the steps
+#    so far, which the server forwards so the UI can render the plan as it
+#    is written.
+# 3. If the early JSON is unusable, the full response is parsed (and repaired)
+#    as before.
 # -----------------------------------------------------------------------------
 
 import os
@@ -22,19 +22,35 @@ import logging
 import json
 import re
 import asyncio
-from typing import TypedDict, Annotated, Sequence, List, Optional, Dict, Any
+from typing import TypedDict, Annotated, Sequence, Mapping, List, Optional, Dict, Any
 
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.chat_models import ChatOllama
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.callbacks.manager import adispatch_custom_event
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
-from google.api_core.exceptions import ResourceExhausted
 
 
-from .tools import get_available_tools
+from .tools import get_available_tools, get_tool_map, TOOL_REGISTRY
+from .llm_factory import (
+    LLM_CACHE,
+    get_llm_for_role,
+    set_llm_context,
+    reset_llm_context,
+    invoke_llm_with_fallback as _invoke_llm_with_fallback,
+    ainvoke_llm_with_fallback as _ainvoke_llm_with_fallback,
+    astream_llm_with_fallback as _astream_llm_with_fallback
+)
+from .background_jobs import BACKGROUND_JOBS
+from .checkpointer import create_checkpointer
+from . import blob_store
+from .state_reducers import append_reducer, merge_reducer
+from .memory_patch import apply_patch, validate_document
+from .rate_limiting import estimate_tokens
+from .evaluators import evaluate_step, EVALUATOR_STATS
+from .json_output import parse_json_output, JSONOutputError, StreamingJSONExtractor
 from .prompts import (
     router_prompt_template,
+    fused_router_prompt_template,
     handyman_prompt_template,
     structured_planner_prompt_template,
     controller_prompt_template,
@@ -51,9 +67,22 @@ logging.basicConfig(level=log_level, format='%(asctime)s - %(name)s - %(levelnam
 logger = logging.getLogger(__name__)
 
 # --- Constants ---
-HISTORY_SUMMARY_THRESHOLD = 10
+# Once the unsummarized chat history exceeds this many (estimated) tokens, older messages are folded into the rolling summary.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
 HISTORY_SUMMARY_KEEP_RECENT = 4
 SANDBOXED_TOOLS = {"write_file", "read_file", "list_files", "workspace_shell", "pip_install", "query_files", "critique_document"}
+# Max number of independent plan steps run concurrently by the Step_Scheduler (1 = strictly sequential).
+PLAN_PARALLEL_WIDTH = max(1, int(os.getenv("PLAN_PARALLEL_WIDTH", "1")))
+# Read-only tools whose steps may share a batch. Every other tool (file writes, shell, pip, Tool Forge
+# `custom_*` tools, anything unknown) and steps without a declared tool always run alone, in plan order.
+PARALLEL_SAFE_TOOLS = {"web_search", "read_file", "list_files", "query_files", "critique_document"}
+# When the Memory Vault is updated: "inline" (before routing), "concurrent" (alongside routing and
+# planning, merged by the Editor) or "background" (after the answer, merged at the start of the next turn).
+MEMORY_UPDATE_MODE = os.getenv("MEMORY_UPDATE_MODE", "inline").lower()
+# Opt-in: the Router also produces the tool call for SIMPLE_TOOL_USE requests, which then go straight to the Worker.
+FUSED_ROUTER = os.getenv("FUSED_ROUTER", "false").lower() == "true"
+# Whether the Project_Supervisor tries the deterministic evaluators before asking the LLM.
+RULE_BASED_EVALUATION = os.getenv("RULE_BASED_EVALUATION", "true").lower() == "true"
 
 
 # (Memory Vault Schemas remain unchanged)
@@ -70,14 +99,14 @@ class GraphState(TypedDict):
     input: str
     task_id: str
     plan: List[dict]
-    messages: Annotated[Sequence[BaseMessage], lambda x, y: x + y]
+    messages: Annotated[Sequence[BaseMessage], append_reducer]
     llm_config: Dict[str, str]
     current_step_index: int
     current_tool_call: Optional[dict]
     tool_output: Optional[str]
-    history: Annotated[List[str], lambda x, y: x + y]
+    history: Annotated[Sequence[str], append_reducer]
     workspace_path: str
-    step_outputs: Annotated[Dict[int, str], lambda x, y: {**x, **y}]
+    step_outputs: Annotated[Mapping[int, str], merge_reducer]
     step_evaluation: Optional[dict]
     answer: str
     max_retries: int
@@ -85,63 +114,50 @@ class GraphState(TypedDict):
     plan_retries: int
     user_feedback: Optional[str]
     memory_vault: MemoryVault
+    memory_vault_version: int
+    history_summary: str
+    summarized_upto: int
     route: str
     current_track: str
     enabled_tools: List[str]
 
-LLM_CACHE = {}
-def get_llm(state: GraphState, role_env_var: str, default_llm_id: str):
-    run_config = state.get("llm_config", {}); llm_id = run_config.get(role_env_var) or os.getenv(role_env_var, default_llm_id)
-    if llm_id in LLM_CACHE: return LLM_CACHE[llm_id]
-    provider, model_name = llm_id.split("::"); logger.info(f"Task '{state.get('task_id')}': Initializing LLM for '{role_env_var}': {llm_id}")
-    if provider == "gemini": llm = ChatGoogleGenerativeAI(model=model_name, google_api_key=os.getenv("GOOGLE_API_KEY"))
-    elif provider == "ollama": llm = ChatOllama(model=model_name, base_url=os.getenv("OLLAMA_BASE_URL"))
-    else: raise ValueError(f"Unsupported LLM provider: {provider}")
-    LLM_CACHE[llm_id] = llm; return llm
-
-def _invoke_llm_with_fallback(llm, prompt: str, state: GraphState):
-    """
-    Invokes the given LLM with a prompt. If a ResourceExhausted error
-    (Google API rate limit) is caught, it retries the call once using the
-    globally defined DEFAULT_LLM_ID.
-    """
-    try:
-        return llm.invoke(prompt)
-    except ResourceExhausted as e:
-        task_id = state.get("task_id", "N/A")
-        logger.warning(f"Task '{task_id}': LLM call failed with rate limit error: {e}. Attempting fallback.")
-        
-        fallback_llm_id = os.getenv("DEFAULT_LLM_ID", "gemini::gemini-1.5-flash-latest")
-        logger.info(f"Task '{task_id}': Switching to fallback LLM: {fallback_llm_id}")
-        
-        try:
-            provider, model_name = fallback_llm_id.split("::")
-            if provider == "gemini":
-                fallback_llm = ChatGoogleGenerativeAI(model=model_name, google_api_key=os.getenv("GOOGLE_API_KEY"))
-            elif provider == "ollama":
-                fallback_llm = ChatOllama(model=model_name, base_url=os.getenv("OLLAMA_BASE_URL"))
-            else:
-                return AIMessage(content=f"LLM call failed due to rate limits, and the fallback model '{fallback_llm_id}' is not a valid configuration. Original error: {e}")
-            
-            return fallback_llm.invoke(prompt)
-        except Exception as fallback_e:
-            logger.error(f"Task '{task_id}': Fallback LLM call also failed: {fallback_e}")
-            return AIMessage(content=f"LLM call failed due to rate limits, and the fallback attempt also failed. Original error: {e}")
+def get_llm(state: GraphState, role_env_var: str, default_llm_id: str, json_mode: bool = False):
+    return get_llm_for_role(role_env_var, default_llm_id, state.get("llm_config", {}), state.get("task_id"), json_mode=json_mode)
+
+
+# --- Tool Prompt Cache: rendered tool blocks keyed by (registry version, enabled tools) ---
+_TOOL_PROMPT_CACHE: Dict[tuple, str] = {}
+_TOOL_DESCRIPTION_CACHE: Dict[str, str] = {}
+_TOOL_PROMPT_CACHE_VERSION = None
 
+def _render_tool_description(tool) -> str:
+    tool_string = f"  - {tool.name}: {tool.description}"
+    if tool.args_schema:
+        schema_props = tool.args_schema.schema().get('properties', {}); args_info = []
+        for arg_name, arg_props in schema_props.items(): args_info.append(f"{arg_name} ({arg_props.get('type', 'any')}): {arg_props.get('description', '')}")
+        if args_info: tool_string += " Arguments: [" + ", ".join(args_info) + "]"
+    return tool_string
 
 def format_tools_for_prompt(state: GraphState):
-    all_tools = get_available_tools(); enabled_tool_names = state.get("enabled_tools")
+    """
+    Returns the pre-rendered tool block for the prompt. The block is memoized
+    per (tool registry version, enabled tool set), so the Pydantic schema of
+    each tool is only generated once per registry version.
+    """
+    global _TOOL_PROMPT_CACHE_VERSION
+    all_tools = get_available_tools(); registry_version = TOOL_REGISTRY.version; enabled_tool_names = state.get("enabled_tools")
+    cache_key = (registry_version, frozenset(enabled_tool_names) if enabled_tool_names is not None else None)
+    if _TOOL_PROMPT_CACHE_VERSION != registry_version:
+        _TOOL_PROMPT_CACHE.clear(); _TOOL_DESCRIPTION_CACHE.clear(); _TOOL_PROMPT_CACHE_VERSION = registry_version
+    elif cache_key in _TOOL_PROMPT_CACHE: return _TOOL_PROMPT_CACHE[cache_key]
     if enabled_tool_names is None: active_tools = all_tools
     else: active_tools = [tool for tool in all_tools if tool.name in enabled_tool_names]
     tool_strings = []
     for tool in active_tools:
-        tool_string = f"  - {tool.name}: {tool.description}"
-        if tool.args_schema:
-            schema_props = tool.args_schema.schema().get('properties', {}); args_info = []
-            for arg_name, arg_props in schema_props.items(): args_info.append(f"{arg_name} ({arg_props.get('type', 'any')}): {arg_props.get('description', '')}")
-            if args_info: tool_string += " Arguments: [" + ", ".join(args_info) + "]"
-        tool_strings.append(tool_string)
-    return "\n".join(tool_strings) if tool_strings else "No tools are available for this task."
+        if tool.name not in _TOOL_DESCRIPTION_CACHE: _TOOL_DESCRIPTION_CACHE[tool.name] = _render_tool_description(tool)
+        tool_strings.append(_TOOL_DESCRIPTION_CACHE[tool.name])
+    rendered = "\n".join(tool_strings) if tool_strings else "No tools are available for this task."
+    _TOOL_PROMPT_CACHE[cache_key] = rendered; return rendered
 
 def _format_messages(messages: Sequence[BaseMessage], is_for_summary=False) -> str:
     formatted_messages = []; start_index = 0
@@ -158,6 +174,17 @@ def _format_messages(messages: Sequence[BaseMessage], is_for_summary=False) -> s
     if not is_for_summary: return "\n".join(formatted_messages[:-1]) if len(formatted_messages) > 1 else "No prior conversation history."
     return "\n".join(formatted_messages)
 
+def _format_chat_history(state: GraphState) -> str:
+    """Renders the rolling history summary followed by the messages it does not cover yet."""
+    summary = state.get("history_summary")
+    if not summary: return _format_messages(state['messages'])
+    # The last message is the current input, which the prompts show separately.
+    recent_history = _format_messages(state['messages'][state.get("summarized_upto", 0):-1], is_for_summary=True)
+    return f"System Summary: {summary}\n{recent_history}" if recent_history else f"System Summary: {summary}"
+
+def _unsummarized_tokens(state: GraphState) -> int:
+    return sum(estimate_tokens(str(msg.content)) for msg in state['messages'][state.get("summarized_upto", 0):])
+
 async def _create_venv_if_not_exists(workspace_path: str, task_id: str):
     venv_path = os.path.join(workspace_path, ".venv");
     if os.path.isdir(venv_path): logger.info(f"Task '{task_id}': Venv exists."); return
@@ -172,25 +199,86 @@ async def task_setup_node(state: GraphState):
     task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Executing Task_Setup"); user_message = state['messages'][-1].content
     workspace_path = f"/app/workspace/{task_id}"; os.makedirs(workspace_path, exist_ok=True); await _create_venv_if_not_exists(workspace_path, task_id)
     initial_vault = {"user_profile": {"persona": {},"preferences": {"formatting_style": "Markdown"}}, "knowledge_graph": {"concepts": [],"relationships": []},"events_and_tasks": [],"workspace_summary": [],"key_observations_and_facts": []}
-    return {"input": user_message, "history": [], "current_step_index": 0, "step_outputs": {}, "workspace_path": workspace_path, "llm_config": state.get("llm_config", {}), "max_retries": 3, "step_retries": 0, "plan_retries": 0, "user_feedback": None, "memory_vault": initial_vault, "enabled_tools": state.get("enabled_tools")}
+    return {"input": user_message, "history": [], "current_step_index": 0, "step_outputs": {}, "workspace_path": workspace_path, "llm_config": state.get("llm_config", {}), "max_retries": 3, "step_retries": 0, "plan_retries": 0, "user_feedback": None, "memory_vault": state.get("memory_vault") or initial_vault, "memory_vault_version": state.get("memory_vault_version", 0), "enabled_tools": state.get("enabled_tools")}
+
+async def _compute_memory_update(state: GraphState, memory_vault: dict, memory_vault_version: int, recent_conversation: str) -> dict:
+    """
+    Asks the LLM for RFC 6902 patch operations against the vault and applies
+    them. A full vault object is still accepted as a fallback. The result is
+    validated against `MemoryVault`; an invalid update keeps the old vault.
+    """
+    task_id = state.get("task_id"); llm = get_llm(state, "EDITOR_LLM_ID", "gemini::gemini-1.5-pro-latest", json_mode=True)
+    prompt = memory_updater_prompt_template.format(memory_vault_json=json.dumps(memory_vault, indent=2), recent_conversation=recent_conversation)
+    try:
+        response = await _ainvoke_llm_with_fallback(llm, prompt, state, role="memory_updater"); update = parse_json_output(response.content, "memory_updater")
+        if isinstance(update, list):
+            if not update: logger.info(f"Task '{task_id}': Memory Vault unchanged."); return {}
+            updated_vault = apply_patch(memory_vault, update)
+        else: logger.warning(f"Task '{task_id}': Memory updater returned a full vault instead of a patch."); updated_vault = update
+        validate_document(updated_vault, MemoryVault)
+        logger.info(f"Task '{task_id}': Memory Vault updated to version {memory_vault_version + 1} ({len(update) if isinstance(update, list) else 'full'} change(s)).")
+        return {"memory_vault": updated_vault, "memory_vault_version": memory_vault_version + 1}
+    except Exception as e: logger.error(f"Task '{task_id}': Failed to apply memory vault update. Error: {e}. Keeping old vault."); return {}
+
+async def memory_updater_node(state: GraphState):
+    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Executing memory_updater_node (mode: {MEMORY_UPDATE_MODE}).")
+    if MEMORY_UPDATE_MODE not in ("concurrent", "background"): return await _compute_memory_update(state, state['memory_vault'], state.get("memory_vault_version", 0), f"Human: {state['input']}")
+    # Merge the update left behind by the previous turn (background mode) or by an interrupted turn.
+    previous_update = await BACKGROUND_JOBS.collect("memory", task_id) or {}
+    memory_vault = previous_update.get("memory_vault", state['memory_vault']); memory_vault_version = previous_update.get("memory_vault_version", state.get("memory_vault_version", 0))
+    if MEMORY_UPDATE_MODE == "concurrent": BACKGROUND_JOBS.schedule("memory", task_id, _compute_memory_update(state, memory_vault, memory_vault_version, f"Human: {state['input']}"))
+    return previous_update
+
+async def _compute_rolling_summary(state: GraphState, existing_summary: str, evicted_messages: Sequence[BaseMessage], summarized_upto: int) -> dict:
+    task_id = state.get("task_id"); llm = get_llm(state, "EDITOR_LLM_ID", "gemini::gemini-1.5-pro-latest")
+    prompt = summarizer_prompt_template.format(existing_summary=existing_summary or "No summary yet.", conversation=_format_messages(evicted_messages, is_for_summary=True))
+    try:
+        response = await _ainvoke_llm_with_fallback(llm, prompt, state, role="summarizer")
+        logger.info(f"Task '{task_id}': Rolling summary now covers {summarized_upto} message(s)."); return {"history_summary": response.content, "summarized_upto": summarized_upto}
+    except Exception as e: logger.error(f"Task '{task_id}': Failed to update rolling summary. Error: {e}. Keeping the previous summary."); return {}
 
-def memory_updater_node(state: GraphState):
-    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Executing memory_updater_node."); llm = get_llm(state, "EDITOR_LLM_ID", "gemini::gemini-1.5-pro-latest")
-    prompt = memory_updater_prompt_template.format(memory_vault_json=json.dumps(state['memory_vault'], indent=2), recent_conversation=f"Human: {state['input']}")
+async def summarize_history_node(state: GraphState):
+    """
+    Commits a finished background summary, then, if the unsummarized history
+    is over HISTORY_TOKEN_BUDGET, starts a job folding the messages that fall
+    out of the recent window into the summary. This never waits on the LLM:
+    the turn proceeds with the last committed summary.
+    """
+    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Executing summarize_history_node."); updates = {}
+    if BACKGROUND_JOBS.is_done("summary", task_id): updates = await BACKGROUND_JOBS.collect("summary", task_id) or {}
+    committed = {**state, **updates}; summarized_upto = committed.get("summarized_upto", 0); evict_upto = len(state['messages']) - HISTORY_SUMMARY_KEEP_RECENT
+    if not BACKGROUND_JOBS.has_job("summary", task_id) and evict_upto > summarized_upto and _unsummarized_tokens(committed) > HISTORY_TOKEN_BUDGET:
+        logger.info(f"Task '{task_id}': History over budget. Summarizing messages {summarized_upto}-{evict_upto} in the background.")
+        BACKGROUND_JOBS.schedule("summary", task_id, _compute_rolling_summary(state, committed.get("history_summary", ""), state['messages'][summarized_upto:evict_upto], evict_upto))
+    return updates
+
+# --- Streaming JSON Output: act on a JSON response as soon as its top-level value is complete ---
+async def _astream_json_output(llm, prompt: str, state: GraphState, role: str, on_items=None, item_depth: Optional[int] = None) -> Any:
+    """
+    Streams a JSON-producing LLM call and returns the parsed value as soon as
+    its closing bracket arrives, without waiting for any trailing text. If
+    given, `on_items` is awaited with the elements completed so far at
+    `item_depth` each time a new one closes.
+    Raises `JSONOutputError` like `parse_json_output`.
+    """
+    extractor = StreamingJSONExtractor(item_depth=item_depth if on_items is not None else None); published_items = 0
+    # Returning early closes the stream; the response is cached only if its JSON value was complete.
+    stream = _astream_llm_with_fallback(llm, prompt, state, role=role, is_complete=lambda text: extractor.done)
     try:
-        response = _invoke_llm_with_fallback(llm, prompt, state); match = re.search(r"```json\s*([\s\S]*?)\s*```", response.content, re.DOTALL); json_str = match.group(1).strip() if match else response.content.strip()
-        updated_vault = json.loads(json_str); logger.info(f"Task '{task_id}': Memory Vault updated."); return {"memory_vault": updated_vault}
-    except Exception as e: logger.error(f"Task '{task_id}': Failed to parse memory vault JSON. Error: {e}. Keeping old vault."); return {}
-
-def summarize_history_node(state: GraphState):
-    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Executing summarize_history_node."); messages = state['messages']; to_summarize = messages[:-HISTORY_SUMMARY_KEEP_RECENT]; to_keep = messages[-HISTORY_SUMMARY_KEEP_RECENT:]
-    conversation_str = _format_messages(to_summarize, is_for_summary=True); llm = get_llm(state, "EDITOR_LLM_ID", "gemini::gemini-1.5-pro-latest"); prompt = summarizer_prompt_template.format(conversation=conversation_str)
-    response = _invoke_llm_with_fallback(llm, prompt, state); summary_text = response.content; summary_message = SystemMessage(content=f"Summary of conversation:\n{summary_text}"); new_messages = [summary_message] + to_keep; logger.info(f"Task '{task_id}': History summarized."); return {"messages": new_messages}
-
-def initial_router_node(state: GraphState):
-    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Executing Three-Track Router."); llm = get_llm(state, "ROUTER_LLM_ID", "gemini::gemini-1.5-flash-latest")
-    router_prompt = router_prompt_template.format(chat_history=_format_messages(state['messages']), memory_vault=json.dumps(state.get('memory_vault', {}), indent=2), input=state["input"], tools=format_tools_for_prompt(state))
-    response = _invoke_llm_with_fallback(llm, router_prompt, state); decision = response.content.strip(); logger.info(f"Task '{task_id}': Initial routing decision from LLM: {decision}")
+        async for text in stream:
+            if (value_text := extractor.feed(text)) is not None:
+                try: return parse_json_output(value_text, role)
+                except JSONOutputError: logger.warning(f"Task '{state.get('task_id')}': Early JSON from '{role}' was unusable; waiting for the full response.")
+            if on_items is not None and not extractor.done and len(extractor.items) > published_items:
+                published_items = len(extractor.items); await on_items(list(extractor.items))
+    finally: await stream.aclose()
+    return parse_json_output(extractor.text, role)
+
+async def initial_router_node(state: GraphState):
+    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Executing Three-Track Router."); llm = get_llm(state, "ROUTER_LLM_ID", "gemini::gemini-1.5-flash-latest", json_mode=FUSED_ROUTER)
+    if FUSED_ROUTER: return await _fused_route(state, llm)
+    router_prompt = router_prompt_template.format(chat_history=_format_chat_history(state), memory_vault=json.dumps(state.get('memory_vault', {}), indent=2), input=state["input"], tools=format_tools_for_prompt(state))
+    response = await _ainvoke_llm_with_fallback(llm, router_prompt, state, role="router"); decision = response.content.strip(); logger.info(f"Task '{task_id}': Initial routing decision from LLM: {decision}")
     
     if "SIMPLE_TOOL_USE" in decision:
         return {"route": "Handyman", "current_track": "SIMPLE_TOOL_USE"}
@@ -200,22 +288,48 @@ def initial_router_node(state: GraphState):
     logger.info(f"Task '{task_id}': Routing to DIRECT_QA."); 
     return {"route": "Editor", "current_track": "DIRECT_QA"}
 
-def handyman_node(state: GraphState):
-    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Track 2 -> Handyman"); llm = get_llm(state, "SITE_FOREMAN_LLM_ID", "gemini::gemini-1.5-flash-latest")
-    prompt = handyman_prompt_template.format(chat_history=_format_messages(state['messages']), memory_vault=json.dumps(state.get('memory_vault', {}), indent=2), input=state["input"], tools=format_tools_for_prompt(state))
-    response = _invoke_llm_with_fallback(llm, prompt, state)
+def _is_tool_call(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get("tool_name"), str) and isinstance(value.get("tool_input"), dict)
+
+async def _fused_route(state: GraphState, llm) -> dict:
+    """
+    One LLM call for routing and, for SIMPLE_TOOL_USE, the tool call. Falls
+    back to the Handyman if the tool call is missing or malformed, and to
+    plain keyword routing if the response is not JSON.
+    """
+    task_id = state.get("task_id")
+    prompt = fused_router_prompt_template.format(chat_history=_format_chat_history(state), memory_vault=json.dumps(state.get('memory_vault', {}), indent=2), input=state["input"], tools=format_tools_for_prompt(state))
+    response = await _ainvoke_llm_with_fallback(llm, prompt, state, role="router")
+    try:
+        parsed = parse_json_output(response.content, "router"); decision = str(parsed.get("route", "")) if isinstance(parsed, dict) else ""; tool_call = parsed.get("tool_call") if isinstance(parsed, dict) else None
+    except Exception as e:
+        logger.warning(f"Task '{task_id}': Fused Router returned invalid JSON ({e}); using keyword routing."); decision, tool_call = response.content.strip(), None
+    logger.info(f"Task '{task_id}': Fused routing decision from LLM: {decision}")
+    if "SIMPLE_TOOL_USE" in decision:
+        if _is_tool_call(tool_call):
+            logger.info(f"Task '{task_id}': Fused Router produced a call to '{tool_call['tool_name']}'; skipping the Handyman.")
+            return {"route": "Worker", "current_track": "SIMPLE_TOOL_USE", "current_tool_call": {"tool_name": tool_call["tool_name"], "tool_input": tool_call["tool_input"]}}
+        return {"route": "Handyman", "current_track": "SIMPLE_TOOL_USE"}
+    if "COMPLEX_PROJECT" in decision: return {"route": "Chief_Architect", "current_track": "COMPLEX_PROJECT"}
+    return {"route": "Editor", "current_track": "DIRECT_QA"}
+
+async def handyman_node(state: GraphState):
+    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Track 2 -> Handyman"); llm = get_llm(state, "SITE_FOREMAN_LLM_ID", "gemini::gemini-1.5-flash-latest", json_mode=True)
+    prompt = handyman_prompt_template.format(chat_history=_format_chat_history(state), memory_vault=json.dumps(state.get('memory_vault', {}), indent=2), input=state["input"], tools=format_tools_for_prompt(state))
     try:
-        match = re.search(r"```json\s*([\s\S]*?)\s*```", response.content, re.DOTALL); json_str = match.group(1).strip() if match else response.content.strip()
-        tool_call = json.loads(json_str); return {"current_tool_call": tool_call}
+        tool_call = await _astream_json_output(llm, prompt, state, "handyman"); return {"current_tool_call": tool_call}
     except Exception as e: logger.error(f"Task '{task_id}': Error parsing Handyman tool call: {e}"); return {"current_tool_call": {"error": f"Invalid JSON from Handyman: {e}"}}
 
-def chief_architect_node(state: GraphState):
-    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Track 3 -> Chief_Architect"); llm = get_llm(state, "CHIEF_ARCHITECT_LLM_ID", "gemini::gemini-1.5-flash-latest")
-    prompt = structured_planner_prompt_template.format(chat_history=_format_messages(state['messages']), memory_vault=json.dumps(state.get('memory_vault', {}), indent=2), input=state["input"], tools=format_tools_for_prompt(state))
-    response = _invoke_llm_with_fallback(llm, prompt, state)
+async def chief_architect_node(state: GraphState, config: RunnableConfig):
+    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Track 3 -> Chief_Architect"); llm = get_llm(state, "CHIEF_ARCHITECT_LLM_ID", "gemini::gemini-1.5-flash-latest", json_mode=True)
+    prompt = structured_planner_prompt_template.format(chat_history=_format_chat_history(state), memory_vault=json.dumps(state.get('memory_vault', {}), indent=2), input=state["input"], tools=format_tools_for_prompt(state))
+    async def publish_partial_plan(completed_steps):
+        # The UI shows the plan while it is being written, one completed step at a time.
+        steps = [{**step, "step_id": i + 1} for i, step in enumerate(completed_steps) if isinstance(step, dict)]
+        if steps: await adispatch_custom_event("plan_partial", {"plan": steps}, config=config)
     try:
-        match = re.search(r"```json\s*([\s\S]*?)\s*```", response.content, re.DOTALL); json_str = match.group(1).strip() if match else response.content.strip()
-        parsed_json = json.loads(json_str); return {"plan": parsed_json.get("plan", [])}
+        # Depth 3: the step objects inside {"plan": [...]}.
+        parsed_json = await _astream_json_output(llm, prompt, state, "chief_architect", on_items=publish_partial_plan, item_depth=3); return {"plan": parsed_json.get("plan", [])}
     except Exception as e: logger.error(f"Task '{task_id}': Error parsing structured plan: {e}"); return {"plan": [{"error": f"Failed to create plan: {e}"}]}
 
 def plan_expander_node(state: GraphState):
@@ -230,34 +344,68 @@ def plan_expander_node(state: GraphState):
 def human_in_the_loop_node(state: GraphState):
     logger.info(f"Task '{state.get('task_id')}': Reached HITL node."); return {"enabled_tools": state.get("enabled_tools")}
 
-def _substitute_step_outputs(data: Any, step_outputs: Dict[int, str]) -> Any:
+def _substitute_step_outputs(data: Any, step_outputs: Dict[int, str], workspace_path: Optional[str] = None) -> Any:
+    """Replaces `{step_N_output}` placeholders, loading outputs kept in the blob store only when they are consumed."""
     if isinstance(data, str):
         match = re.fullmatch(r"\{step_(\d+)_output\}", data)
-        if match: step_num = int(match.group(1)); return step_outputs.get(step_num, f"Error: Output for step {step_num} not found.")
+        if match:
+            step_num = int(match.group(1))
+            if step_num not in step_outputs: return f"Error: Output for step {step_num} not found."
+            return blob_store.resolve(workspace_path, step_outputs[step_num]) if workspace_path else step_outputs[step_num]
         return data
-    if isinstance(data, dict): return {k: _substitute_step_outputs(v, step_outputs) for k, v in data.items()}
-    if isinstance(data, list): return [_substitute_step_outputs(item, step_outputs) for item in data]
+    if isinstance(data, dict): return {k: _substitute_step_outputs(v, step_outputs, workspace_path) for k, v in data.items()}
+    if isinstance(data, list): return [_substitute_step_outputs(item, step_outputs, workspace_path) for item in data]
     return data
 
-def site_foreman_node(state: GraphState):
+# --- Site_Foreman Fast Path: counts of steps dispatched directly vs. through the LLM ---
+FOREMAN_STATS = {"direct_dispatch": 0, "llm_calls": 0}
+
+def _schema_fields(args_schema) -> set:
+    return set(getattr(args_schema, "model_fields", None) or getattr(args_schema, "__fields__", {}))
+
+def _direct_tool_call(state: GraphState, step: dict) -> Optional[dict]:
+    """
+    Returns the step's own tool call, with step outputs substituted, if it
+    names an enabled tool and its `tool_input` validates against the tool's
+    `args_schema`. Returns None if the step needs the LLM to fill it in.
+    """
+    tool_name, tool_input = step.get("tool_name"), step.get("tool_input")
+    enabled_tool_names = state.get("enabled_tools")
+    tool = get_tool_map().get(tool_name) if tool_name and (enabled_tool_names is None or tool_name in enabled_tool_names) else None
+    if tool is None or tool.args_schema is None or not isinstance(tool_input, dict): return None
+    tool_input = _substitute_step_outputs(tool_input, state.get("step_outputs", {}), state.get("workspace_path"))
+    fields = _schema_fields(tool.args_schema); args = dict(tool_input)
+    if set(args) - fields: return None
+    if "workspace_path" in fields and tool_name in SANDBOXED_TOOLS: args["workspace_path"] = state["workspace_path"]
+    try:
+        if hasattr(tool.args_schema, "model_validate"): tool.args_schema.model_validate(args)
+        else: tool.args_schema.parse_obj(args)
+    except Exception: return None
+    return {"tool_name": tool_name, "tool_input": tool_input}
+
+async def site_foreman_node(state: GraphState):
     task_id = state.get("task_id"); step_index = state["current_step_index"]; plan = state["plan"]
     if not plan or step_index >= len(plan): return {"current_tool_call": {"error": "Plan finished or empty."}}
     logger.info(f"Task '{task_id}': Site_Foreman executing step {step_index + 1}/{len(plan)}"); current_step_details = plan[step_index]
+    # Fast path: the plan already carries a valid tool call for this step, so no LLM round-trip is needed.
+    if (direct_tool_call := _direct_tool_call(state, current_step_details)) is not None:
+        FOREMAN_STATS["direct_dispatch"] += 1
+        logger.info(f"Task '{task_id}': Step {step_index + 1} dispatched directly to '{direct_tool_call['tool_name']}' ({FOREMAN_STATS['direct_dispatch']} Foreman LLM call(s) skipped, {FOREMAN_STATS['llm_calls']} made).")
+        return {"current_tool_call": direct_tool_call}
+    FOREMAN_STATS["llm_calls"] += 1
     history_summary = "\n".join([f"Step {s['step_id']}: {s['instruction']}" for s in plan[:step_index]])
-    llm = get_llm(state, "SITE_FOREMAN_LLM_ID", "gemini::gemini-1.5-flash-latest")
+    llm = get_llm(state, "SITE_FOREMAN_LLM_ID", "gemini::gemini-1.5-flash-latest", json_mode=True)
     prompt = controller_prompt_template.format(tools=format_tools_for_prompt(state), plan=json.dumps(plan, indent=2), history=history_summary, current_step=current_step_details.get("instruction", ""))
     try:
-        response = _invoke_llm_with_fallback(llm, prompt, state); match = re.search(r"```json\s*([\s\S]*?)\s*```", response.content, re.DOTALL); json_str = match.group(1).strip() if match else response.content.strip()
-        tool_call = json.loads(json_str); substituted_tool_call = _substitute_step_outputs(tool_call, state.get("step_outputs", {})); return {"current_tool_call": substituted_tool_call}
+        tool_call = await _astream_json_output(llm, prompt, state, "site_foreman"); substituted_tool_call = _substitute_step_outputs(tool_call, state.get("step_outputs", {}), state.get("workspace_path")); return {"current_tool_call": substituted_tool_call}
     except Exception as e: logger.error(f"Task '{task_id}': Error in Foreman: {e}"); return {"current_tool_call": {"error": f"Invalid JSON or substitution error: {e}"}}
 
 async def worker_node(state: GraphState):
-    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Worker executing tool call."); all_tools = get_available_tools(); enabled_tool_names = state.get("enabled_tools")
-    active_tools = [tool for tool in all_tools if tool.name in enabled_tool_names] if enabled_tool_names is not None else all_tools
-    tool_map = {tool.name: tool for tool in active_tools}
+    task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Worker executing tool call."); tool_map = get_tool_map(); enabled_tool_names = state.get("enabled_tools")
     tool_call = state.get("current_tool_call")
     if not tool_call or "error" in tool_call or not tool_call.get("tool_name"): return {"tool_output": f"Error: {tool_call.get('error', 'No tool call provided.')}"}
-    tool_name = tool_call["tool_name"]; tool_input = tool_call.get("tool_input", {}); tool = tool_map.get(tool_name)
+    tool_name = tool_call["tool_name"]; tool_input = tool_call.get("tool_input", {})
+    tool = tool_map.get(tool_name) if enabled_tool_names is None or tool_name in enabled_tool_names else None
     if not tool: logger.error(f"Task '{task_id}': Tool '{tool_name}' not found or disabled."); return {"tool_output": f"Error: Tool '{tool_name}' not found or disabled."}
     final_args = {};
     if isinstance(tool_input, dict): final_args.update(tool_input)
@@ -265,8 +413,10 @@ async def worker_node(state: GraphState):
         tool_args_schema = tool.args
         if tool_args_schema: final_args[next(iter(tool_args_schema))] = tool_input
     if tool_name in SANDBOXED_TOOLS: final_args["workspace_path"] = state["workspace_path"]
+    llm_context_token = set_llm_context(task_id, state.get("llm_config", {}))
     try:
-        output = await tool.ainvoke(final_args); output_str = str(output)
+        # Large outputs are kept in the workspace blob store; state, checkpoints and prompts only carry a reference with a preview.
+        output = await tool.ainvoke(final_args); output_str = blob_store.externalize(state.get("workspace_path"), str(output))
         
         if state.get("current_track") == "COMPLEX_PROJECT":
             current_step_id = state["plan"][state["current_step_index"]]["step_id"]
@@ -281,38 +431,108 @@ async def worker_node(state: GraphState):
 
     except Exception as e:
         logger.error(f"Task '{task_id}': Error executing tool '{tool_name}': {e}", exc_info=True); return {"tool_output": f"An error occurred while executing the tool: {e}"}
+    finally:
+        reset_llm_context(llm_context_token)
 
-def project_supervisor_node(state: GraphState):
+async def project_supervisor_node(state: GraphState):
     task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Executing Project_Supervisor"); current_step_details = state["plan"][state["current_step_index"]]
-    tool_output = state.get("tool_output", "No output."); tool_call = state.get("current_tool_call", {}); llm = get_llm(state, "PROJECT_SUPERVISOR_LLM_ID", "gemini::gemini-1.5-flash-latest")
-    prompt = evaluator_prompt_template.format(current_step=current_step_details.get('instruction', ''), tool_call=json.dumps(tool_call), tool_output=tool_output)
-    try:
-        response = _invoke_llm_with_fallback(llm, prompt, state); match = re.search(r"```json\s*([\s\S]*?)\s*```", response.content, re.DOTALL); json_str = match.group(1).strip() if match else response.content.strip()
-        evaluation = json.loads(json_str)
-    except Exception as e: evaluation = {"status": "failure", "reasoning": f"Could not parse evaluation: {e}"}
+    tool_output = state.get("tool_output", "No output."); tool_call = state.get("current_tool_call", {})
+    # Fast path: unambiguous outputs (tool errors, non-zero exit codes, confirmed writes) are judged without the LLM.
+    evaluation = evaluate_step(tool_call, tool_output) if RULE_BASED_EVALUATION else None
+    if evaluation is not None:
+        logger.info(f"Task '{task_id}': Step {state['current_step_index'] + 1} evaluated by rule as '{evaluation['status']}' ({EVALUATOR_STATS['rule_based']} Supervisor LLM call(s) skipped, {EVALUATOR_STATS['llm_fallback']} made).")
+    else:
+        llm = get_llm(state, "PROJECT_SUPERVISOR_LLM_ID", "gemini::gemini-1.5-flash-latest", json_mode=True)
+        prompt = evaluator_prompt_template.format(current_step=current_step_details.get('instruction', ''), tool_call=json.dumps(tool_call), tool_output=tool_output)
+        try:
+            response = await _ainvoke_llm_with_fallback(llm, prompt, state, role="project_supervisor"); evaluation = parse_json_output(response.content, "project_supervisor")
+        except Exception as e: evaluation = {"status": "failure", "reasoning": f"Could not parse evaluation: {e}"}
     history_record = (f"--- Step {state['current_step_index'] + 1} ---\nInstruction: {current_step_details.get('instruction')}\nAction: {json.dumps(tool_call)}\nOutput: {tool_output}\nEvaluation: {evaluation.get('status', 'unknown')} - {evaluation.get('reasoning', 'N/A')}")
     updates = {"step_evaluation": evaluation, "history": [history_record]}
     if evaluation.get("status") == "success": updates["step_retries"] = 0 
     else: updates["step_retries"] = state.get("step_retries", 0) + 1
     return updates
 
+# --- Dependency-Aware Parallel Step Execution ---
+def _step_dependencies(step: dict) -> set:
+    """Returns the step ids a plan step consumes through `{step_N_output}` placeholders."""
+    step_body = {k: v for k, v in step.items() if k != "step_id"}
+    return {int(n) for n in re.findall(r"\{step_(\d+)_output\}", json.dumps(step_body))}
+
+def _next_parallel_batch(plan: List[dict], start_index: int, width: int) -> List[int]:
+    """
+    Returns the indices of the contiguous run of steps, starting at
+    `start_index`, that can execute concurrently: no step consumes the output
+    of another step in the batch, and only read-only tools (PARALLEL_SAFE_TOOLS)
+    share a batch; any other step runs alone.
+    """
+    batch, batch_step_ids = [], set()
+    for index in range(start_index, len(plan)):
+        step = plan[index]
+        is_barrier = step.get("tool_name") not in PARALLEL_SAFE_TOOLS
+        if len(batch) >= width or (batch and is_barrier) or _step_dependencies(step) & batch_step_ids: break
+        batch.append(index); batch_step_ids.add(step.get("step_id"))
+        if is_barrier: break
+    return batch
+
+async def _run_plan_step(state: GraphState, step_index: int, config: RunnableConfig) -> dict:
+    """Runs Site_Foreman -> Worker -> Project_Supervisor for one step on a private copy of the state."""
+    step_state = {**state, "current_step_index": step_index}
+    foreman_update = await RunnableLambda(site_foreman_node, name="Site_Foreman").ainvoke(step_state, config); step_state.update(foreman_update)
+    worker_update = await RunnableLambda(worker_node, name="Worker").ainvoke(step_state, config); step_state["tool_output"] = worker_update.get("tool_output")
+    supervisor_update = await RunnableLambda(project_supervisor_node, name="Project_Supervisor").ainvoke(step_state, config)
+    return {"current_tool_call": step_state.get("current_tool_call"), "tool_output": step_state["tool_output"], "step_outputs": worker_update.get("step_outputs", {}),
+            "history": supervisor_update["history"], "step_evaluation": supervisor_update["step_evaluation"], "step_retries": supervisor_update["step_retries"]}
+
+async def step_scheduler_node(state: GraphState, config: RunnableConfig):
+    """
+    Runs the next batch of independent plan steps concurrently and merges their
+    results in plan order. The batch is cut at the first failed step: its
+    evaluation drives the usual correction/advance routing, and later results
+    of the batch are discarded so those (side-effect free) steps re-run after
+    the correction.
+    """
+    task_id = state.get("task_id"); plan = state.get("plan", []); start_index = state.get("current_step_index", 0)
+    if not plan or start_index >= len(plan): return {"step_evaluation": {"status": "failure", "reasoning": "Plan finished or empty."}, "step_retries": state.get("max_retries", 3)}
+    width = PLAN_PARALLEL_WIDTH if state.get("step_retries", 0) == 0 else 1
+    batch = _next_parallel_batch(plan, start_index, width)
+    logger.info(f"Task '{task_id}': Step_Scheduler running step(s) {[plan[i].get('step_id', i + 1) for i in batch]} concurrently (width {width}).")
+    results = await asyncio.gather(*[_run_plan_step(state, index, config) for index in batch])
+    merged_outputs, merged_history = {}, []
+    for index, result in zip(batch, results):
+        merged_outputs.update(result["step_outputs"]); merged_history.extend(result["history"])
+        updates = {"current_step_index": index, "current_tool_call": result["current_tool_call"], "tool_output": result["tool_output"], "step_evaluation": result["step_evaluation"], "step_retries": result["step_retries"]}
+        if result["step_evaluation"].get("status") != "success":
+            if index != batch[-1]: logger.info(f"Task '{task_id}': Step {index + 1} failed. Discarding the results of the {batch[-1] - index} later step(s) in its batch.")
+            break
+    return {**updates, "step_outputs": merged_outputs, "history": merged_history}
+
 def advance_to_next_step_node(state: GraphState): return {"current_step_index": state.get("current_step_index", 0) + 1}
 
-def editor_node(state: GraphState):
+async def editor_node(state: GraphState, config: RunnableConfig):
     task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Unified Editor generating final answer."); llm = get_llm(state, "EDITOR_LLM_ID", "gemini::gemini-1.5-pro-latest")
-    chat_history_str = _format_messages(state['messages']); execution_log_str = "\n".join(state.get("history", [])); memory_vault_str = json.dumps(state.get('memory_vault', {}), indent=2)
+    # In concurrent mode, the vault update started by the Memory_Updater is merged here, before the answer is written.
+    memory_update = (await BACKGROUND_JOBS.collect("memory", task_id) or {}) if MEMORY_UPDATE_MODE == "concurrent" else {}
+    memory_vault = memory_update.get("memory_vault", state.get('memory_vault', {})); memory_vault_version = memory_update.get("memory_vault_version", state.get("memory_vault_version", 0))
+    chat_history_str = _format_chat_history(state); execution_log_str = "\n".join(state.get("history", [])); memory_vault_str = json.dumps(memory_vault, indent=2)
     prompt = final_answer_prompt_template.format(input=state["input"], chat_history=chat_history_str, execution_log=execution_log_str or "No tool actions taken.", memory_vault=memory_vault_str)
-    response = _invoke_llm_with_fallback(llm, prompt, state); response_content = response.content; return {"answer": response_content, "messages": [AIMessage(content=response_content)]}
+    # Stream the answer: each chunk is surfaced to the server as a custom event, the assembled answer is stored in state.
+    answer_parts = []
+    async for text in _astream_llm_with_fallback(llm, prompt, state, role="editor"):
+        await adispatch_custom_event("final_answer_chunk", {"content": text, "seq": len(answer_parts)}, config=config); answer_parts.append(text)
+    response_content = "".join(answer_parts)
+    # In background mode, the vault is updated from the finished turn while the user reads the answer.
+    if MEMORY_UPDATE_MODE == "background": BACKGROUND_JOBS.schedule("memory", task_id, _compute_memory_update(state, memory_vault, memory_vault_version, f"Human: {state['input']}\nAI: {response_content}"))
+    return {"answer": response_content, "messages": [AIMessage(content=response_content)], **memory_update}
 
 # --- MODIFIED: The correction planner now inserts a step instead of replacing it ---
-def correction_planner_node(state: GraphState):
+async def correction_planner_node(state: GraphState):
     task_id = state.get("task_id"); logger.info(f"Task '{task_id}': Executing Correction_Planner."); failed_step_details = state["plan"][state["current_step_index"]]
-    failure_reason = state["step_evaluation"].get("reasoning", "N/A"); history_str = "\n".join(state["history"]); llm = get_llm(state, "CHIEF_ARCHITECT_LLM_ID", "gemini::gemini-1.5-flash-latest")
+    failure_reason = state["step_evaluation"].get("reasoning", "N/A"); history_str = "\n".join(state["history"]); llm = get_llm(state, "CHIEF_ARCHITECT_LLM_ID", "gemini::gemini-1.5-flash-latest", json_mode=True)
     prompt = correction_planner_prompt_template.format(plan=json.dumps(state["plan"]), history=history_str, failed_step=failed_step_details.get("instruction"), failure_reason=failure_reason, tools=format_tools_for_prompt(state))
-    response = _invoke_llm_with_fallback(llm, prompt, state)
+    response = await _ainvoke_llm_with_fallback(llm, prompt, state, role="correction_planner")
     try:
-        match = re.search(r"```json\s*([\s\S]*?)\s*```", response.content, re.DOTALL); json_str = match.group(1).strip() if match else response.content.strip()
-        new_step = json.loads(json_str)
+        new_step = parse_json_output(response.content, "correction_planner")
         
         # Create a copy of the plan to modify
         new_plan = state["plan"][:]
@@ -351,7 +571,7 @@ def after_plan_step_router(state: GraphState) -> str:
     # If successful and not at the end, advance to the next step
     return "Advance_To_Next_Step"
 
-def history_management_router(state: GraphState) -> str: return "summarize_history_node" if len(state['messages']) > HISTORY_SUMMARY_THRESHOLD else "initial_router_node"
+def history_management_router(state: GraphState) -> str: return "summarize_history_node" if BACKGROUND_JOBS.has_job("summary", state.get("task_id")) or _unsummarized_tokens(state) > HISTORY_TOKEN_BUDGET else "initial_router_node"
 def route_logic(state: GraphState) -> str: return state.get("route", "Editor")
 def after_worker_router(state: GraphState) -> str: return "Editor" if state.get("current_track") == "SIMPLE_TOOL_USE" else "Project_Supervisor"
 def after_plan_creation_router(state: GraphState) -> str: return "Site_Foreman" if state.get("user_feedback") == "approve" else "Editor"
@@ -363,23 +583,27 @@ def create_agent_graph():
     workflow.add_node("Plan_Expander", plan_expander_node); workflow.add_node("human_in_the_loop_node", human_in_the_loop_node); workflow.add_node("Site_Foreman", site_foreman_node)
     workflow.add_node("Worker", worker_node); workflow.add_node("Project_Supervisor", project_supervisor_node); workflow.add_node("Advance_To_Next_Step", advance_to_next_step_node)
     workflow.add_node("Editor", editor_node); workflow.add_node("Correction_Planner", correction_planner_node)
+    # With PLAN_PARALLEL_WIDTH > 1, plan steps are driven by the Step_Scheduler instead of the Site_Foreman loop.
+    plan_step_entry = "Step_Scheduler" if PLAN_PARALLEL_WIDTH > 1 else "Site_Foreman"
+    if PLAN_PARALLEL_WIDTH > 1: workflow.add_node("Step_Scheduler", step_scheduler_node)
     workflow.set_entry_point("Task_Setup"); workflow.add_edge("Task_Setup", "Memory_Updater")
     workflow.add_conditional_edges("Memory_Updater", history_management_router, {"summarize_history_node": "summarize_history_node", "initial_router_node": "initial_router_node"})
     workflow.add_edge("summarize_history_node", "initial_router_node")
-    workflow.add_conditional_edges("initial_router_node", route_logic, {"Editor": "Editor", "Handyman": "Handyman", "Chief_Architect": "Chief_Architect"})
+    workflow.add_conditional_edges("initial_router_node", route_logic, {"Editor": "Editor", "Handyman": "Handyman", "Worker": "Worker", "Chief_Architect": "Chief_Architect"})
     workflow.add_edge("Handyman", "Worker"); workflow.add_conditional_edges("Worker", after_worker_router, {"Editor": "Editor", "Project_Supervisor": "Project_Supervisor"})
     workflow.add_edge("Chief_Architect", "Plan_Expander"); workflow.add_edge("Plan_Expander", "human_in_the_loop_node")
-    workflow.add_conditional_edges("human_in_the_loop_node", after_plan_creation_router, {"Site_Foreman": "Site_Foreman", "Editor": "Editor"})
+    workflow.add_conditional_edges("human_in_the_loop_node", after_plan_creation_router, {"Site_Foreman": plan_step_entry, "Editor": "Editor"})
     workflow.add_edge("Site_Foreman", "Worker")
     
     # --- MODIFIED: The edge from the Correction Planner goes directly back to the Foreman ---
     # This ensures the newly inserted step is executed immediately without advancing the index.
-    workflow.add_edge("Correction_Planner", "Site_Foreman")
+    workflow.add_edge("Correction_Planner", plan_step_entry)
     
-    workflow.add_edge("Advance_To_Next_Step", "Site_Foreman")
+    workflow.add_edge("Advance_To_Next_Step", plan_step_entry)
     workflow.add_conditional_edges("Project_Supervisor", after_plan_step_router, {"Editor": "Editor", "Advance_To_Next_Step": "Advance_To_Next_Step", "Correction_Planner": "Correction_Planner"})
+    if PLAN_PARALLEL_WIDTH > 1: workflow.add_conditional_edges("Step_Scheduler", after_plan_step_router, {"Editor": "Editor", "Advance_To_Next_Step": "Advance_To_Next_Step", "Correction_Planner": "Correction_Planner"})
     workflow.add_edge("Editor", END)
-    agent = workflow.compile(checkpointer=MemorySaver(), interrupt_before=["human_in_the_loop_node"])
+    agent = workflow.compile(checkpointer=create_checkpointer(), interrupt_before=["human_in_the_loop_node"])
     logger.info("Mentor::i agent graph compiled with improved correction logic."); return agent
 
 agent_graph = create_agent_graph()
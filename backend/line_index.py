@@ -0,0 +1,162 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Sparse Line Index for Large Text Previews
+#
+# The file explorer used to read a whole file into memory to preview it,
+# which froze both the backend and the browser on a 500 MB CSV or log.
+#
+# Components:
+# 1. `LineIndex`: For every LINE_INDEX_BLOCK_BYTES block of a file, the number
+#    of lines that start before it. Built once with a streaming pass (one
+#    `bytes.count` per block) and persisted under PREVIEW_INDEX_DIR, keyed by
+#    the file's path and validated by its inode, mtime and size, so it is
+#    rebuilt only when the file changes. A 500 MB file needs ~8k entries.
+# 2. `read_lines`: Returns a window of lines. The index narrows the start to a
+#    single block, so any window costs at most one block scan plus the window
+#    itself, regardless of the file size or the line offset.
+# 3. `read_bytes`: Returns a raw byte window (seek + read).
+#
+# Configuration (optional, see `.env.example`):
+# - PREVIEW_INDEX_DIR: Where indexes are persisted.
+# - PREVIEW_MAX_WINDOW_BYTES: Upper bound on the bytes returned by one window.
+# - PREVIEW_PAGE_LINES: Default window size in lines.
+# - PREVIEW_FULL_FILE_MAX_BYTES: Files up to this size are previewed whole when
+#   no window is requested; larger files get the first page.
+# -----------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LINE_INDEX_BLOCK_BYTES = 64 * 1024
+PREVIEW_INDEX_DIR = os.getenv("PREVIEW_INDEX_DIR", "/app/.cache/line_index")
+PREVIEW_MAX_WINDOW_BYTES = int(os.getenv("PREVIEW_MAX_WINDOW_BYTES", str(4 * 1024 * 1024)))
+PREVIEW_PAGE_LINES = int(os.getenv("PREVIEW_PAGE_LINES", "1000"))
+PREVIEW_FULL_FILE_MAX_BYTES = int(os.getenv("PREVIEW_FULL_FILE_MAX_BYTES", str(1024 * 1024)))
+_INDEX_FORMAT_VERSION = 1
+_MEMORY_CACHE_SIZE = 64
+
+
+@dataclass(frozen=True)
+class LineIndex:
+    """`block_lines[i]` is the number of newlines before byte `i * LINE_INDEX_BLOCK_BYTES`."""
+    inode: int
+    mtime_ns: int
+    size: int
+    total_lines: int
+    block_lines: array
+
+    def matches(self, stat_result) -> bool:
+        return (self.inode, self.mtime_ns, self.size) == (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+
+
+_memory_cache: "OrderedDict[str, LineIndex]" = OrderedDict()
+_memory_cache_lock = threading.Lock()
+
+
+def _index_file_path(path: str) -> str:
+    return os.path.join(PREVIEW_INDEX_DIR, hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest() + ".idx")
+
+
+def _build(path: str, stat_result) -> LineIndex:
+    block_lines, newlines, last_byte = array("Q"), 0, b""
+    with open(path, "rb") as f:
+        while (block := f.read(LINE_INDEX_BLOCK_BYTES)):
+            block_lines.append(newlines); newlines += block.count(b"\n"); last_byte = block[-1:]
+    total_lines = newlines + (1 if last_byte not in (b"", b"\n") else 0)
+    return LineIndex(stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size, total_lines, block_lines)
+
+
+def _load(path: str, stat_result) -> Optional[LineIndex]:
+    try:
+        with open(_index_file_path(path), "rb") as f:
+            header = json.loads(f.readline()); data = f.read()
+    except (OSError, ValueError): return None
+    if header.get("version") != _INDEX_FORMAT_VERSION or header.get("byteorder") != sys.byteorder or header.get("path") != os.path.abspath(path): return None
+    block_lines = array("Q"); block_lines.frombytes(data)
+    index = LineIndex(header["inode"], header["mtime_ns"], header["size"], header["total_lines"], block_lines)
+    return index if index.matches(stat_result) else None
+
+
+def _persist(path: str, index: LineIndex):
+    header = {"version": _INDEX_FORMAT_VERSION, "byteorder": sys.byteorder, "path": os.path.abspath(path), "inode": index.inode,
+              "mtime_ns": index.mtime_ns, "size": index.size, "total_lines": index.total_lines}
+    try:
+        os.makedirs(PREVIEW_INDEX_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=PREVIEW_INDEX_DIR, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f: f.write(json.dumps(header).encode("utf-8") + b"\n"); f.write(index.block_lines.tobytes())
+        os.replace(tmp_path, _index_file_path(path))
+    except OSError as e: logger.warning(f"Could not persist the line index for '{path}': {e}")
+
+
+def get_line_index(path: str, stat_result=None) -> LineIndex:
+    """Returns the line index of `path`, from memory, from disk, or by building (and persisting) it."""
+    stat_result = stat_result or os.stat(path); key = os.path.abspath(path)
+    with _memory_cache_lock:
+        index = _memory_cache.get(key)
+        if index is not None and index.matches(stat_result):
+            _memory_cache.move_to_end(key); return index
+    index = _load(path, stat_result)
+    if index is None:
+        index = _build(path, stat_result)
+        # Single-block files are cheaper to rescan than to read an index for.
+        if len(index.block_lines) > 1: _persist(path, index); logger.info(f"Built line index for '{path}' ({index.total_lines} lines, {len(index.block_lines)} blocks).")
+    with _memory_cache_lock:
+        _memory_cache[key] = index; _memory_cache.move_to_end(key)
+        while len(_memory_cache) > _MEMORY_CACHE_SIZE: _memory_cache.popitem(last=False)
+    return index
+
+
+def _line_start(f, index: LineIndex, line: int) -> int:
+    """Byte offset where `line` (0-based) starts. Scans at most one block."""
+    if line <= 0: return 0
+    # The last block starting before the line's preceding newline; the newline lies inside it.
+    block = bisect_left(index.block_lines, line) - 1
+    position = block * LINE_INDEX_BLOCK_BYTES; f.seek(position)
+    data = f.read(LINE_INDEX_BLOCK_BYTES); remaining = line - index.block_lines[block]; cursor = -1
+    while remaining:
+        cursor = data.find(b"\n", cursor + 1); remaining -= 1
+    return position + cursor + 1
+
+
+def read_lines(path: str, offset: int, limit: int, stat_result=None) -> Tuple[bytes, int, int, bool]:
+    """
+    Returns (data, first_line, line_count, truncated) for up to `limit` lines
+    starting at line `offset`. `truncated` is set when the window was cut at
+    PREVIEW_MAX_WINDOW_BYTES before reaching `limit` lines or the end of file.
+    """
+    index = get_line_index(path, stat_result); offset = max(0, min(offset, index.total_lines))
+    limit = max(0, min(limit, index.total_lines - offset))
+    if not limit: return b"", offset, 0, False
+    with open(path, "rb") as f:
+        f.seek(_line_start(f, index, offset)); parts, size, lines_seen = [], 0, 0
+        while lines_seen < limit and size < PREVIEW_MAX_WINDOW_BYTES:
+            block = f.read(min(LINE_INDEX_BLOCK_BYTES, PREVIEW_MAX_WINDOW_BYTES - size))
+            if not block: break
+            cursor = -1
+            while lines_seen < limit and (cursor := block.find(b"\n", cursor + 1)) != -1: lines_seen += 1
+            if lines_seen == limit and cursor != -1: block = block[:cursor + 1]
+            parts.append(block); size += len(block)
+    data = b"".join(parts)
+    complete_lines = lines_seen + (1 if lines_seen < limit and data and not data.endswith(b"\n") and offset + lines_seen + 1 == index.total_lines else 0)
+    truncated = complete_lines < limit
+    if truncated and lines_seen:
+        # Only whole lines are returned, so the next window can start at `first_line + line_count`.
+        data = data[:data.rfind(b"\n") + 1]; complete_lines = lines_seen
+    elif truncated: complete_lines = 1  # A single line longer than the window is returned cut off.
+    return data, offset, complete_lines, truncated
+
+
+def read_bytes(path: str, offset: int, limit: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(max(0, offset)); return f.read(max(0, min(limit, PREVIEW_MAX_WINDOW_BYTES)))
@@ -0,0 +1,251 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Shared LLM Client Factory
+#
+# The single place where LLM clients are created and invoked. Both the agent
+# graph (`langgraph_agent.py`) and the tools (`query_files`,
+# `critique_document`, Tool Forge generated tools) go through this module, so
+# every LLM call shares the same behavior:
+#
+# 1. Client Reuse: Clients are cached per "provider::model" in `LLM_CACHE`
+#    and reused for the life of the process, together with their underlying
+#    HTTP/gRPC transport, instead of being built (and re-handshaking TLS) on
+#    every call.
+# 2. Resilience: Calls wait for the per-model rate limiter, are answered from
+#    the response cache when enabled, and fall back to DEFAULT_LLM_ID on rate
+#    limits or while a model's circuit breaker is open.
+# 3. JSON Mode: Nodes that parse JSON use a separate client per model with
+#    the provider's JSON output mode (`get_llm_by_id(json_mode=True)`).
+# 4. Per-Task Overrides: The Worker publishes the running task's id and
+#    `llm_config` in a context variable before calling a tool, so tools
+#    resolve the same per-task model selection as the graph nodes.
+# -----------------------------------------------------------------------------
+
+import os
+import logging
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from langchain_core.messages import AIMessage
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_community.chat_models import ChatOllama
+from google.api_core.exceptions import ResourceExhausted
+
+from .response_cache import RESPONSE_CACHE
+from .rate_limiting import get_rate_limiter, get_circuit_breaker, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE = {}
+# Clients created with the provider's JSON output mode, keyed by the same "provider::model" ids.
+JSON_LLM_CACHE = {}
+_JSON_MODE_UNSUPPORTED = set()
+# Whether nodes that parse JSON ask the provider for JSON output (Gemini `response_mime_type`, Ollama `format`).
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() == "true"
+
+# --- Per-Task LLM Context (task_id + llm_config), set by the Worker for tools ---
+_LLM_CONTEXT: ContextVar[Dict[str, Any]] = ContextVar("mentor_llm_context", default={})
+
+
+def set_llm_context(task_id: Optional[str], llm_config: Optional[Dict[str, str]]):
+    """Publishes the running task's id and `llm_config` to tools. Returns a reset token."""
+    return _LLM_CONTEXT.set({"task_id": task_id, "llm_config": llm_config or {}})
+
+
+def reset_llm_context(token):
+    _LLM_CONTEXT.reset(token)
+
+
+def _get_json_llm_by_id(llm_id: str):
+    """Returns the shared JSON-mode client for 'provider::model', or the plain client if the provider lacks JSON mode."""
+    if llm_id in JSON_LLM_CACHE: return JSON_LLM_CACHE[llm_id]
+    if llm_id in _JSON_MODE_UNSUPPORTED: return get_llm_by_id(llm_id)
+    provider, model_name = llm_id.split("::")
+    try:
+        if provider == "gemini": llm = ChatGoogleGenerativeAI(model=model_name, google_api_key=os.getenv("GOOGLE_API_KEY"), response_mime_type="application/json")
+        elif provider == "ollama": llm = ChatOllama(model=model_name, base_url=os.getenv("OLLAMA_BASE_URL"), format="json")
+        else: raise ValueError(f"Unsupported LLM provider: {provider}")
+    except Exception as e:
+        logger.warning(f"JSON output mode is not available for '{llm_id}': {e}. Using the plain client."); _JSON_MODE_UNSUPPORTED.add(llm_id)
+        return get_llm_by_id(llm_id)
+    JSON_LLM_CACHE[llm_id] = llm; return llm
+
+
+def get_llm_by_id(llm_id: str, json_mode: bool = False):
+    """Returns the shared client for 'provider::model', creating it on first use."""
+    if json_mode and LLM_JSON_MODE: return _get_json_llm_by_id(llm_id)
+    if llm_id in LLM_CACHE: return LLM_CACHE[llm_id]
+    provider, model_name = llm_id.split("::")
+    if provider == "gemini": llm = ChatGoogleGenerativeAI(model=model_name, google_api_key=os.getenv("GOOGLE_API_KEY"))
+    elif provider == "ollama": llm = ChatOllama(model=model_name, base_url=os.getenv("OLLAMA_BASE_URL"))
+    else: raise ValueError(f"Unsupported LLM provider: {provider}")
+    LLM_CACHE[llm_id] = llm; return llm
+
+
+def resolve_llm_id(role_env_var: str, default_llm_id: str, llm_config: Optional[Dict[str, str]] = None) -> str:
+    """Per-task `llm_config` wins over the role's environment variable, which wins over the default."""
+    return (llm_config or {}).get(role_env_var) or os.getenv(role_env_var, default_llm_id)
+
+
+def get_llm_for_role(role_env_var: str, default_llm_id: str, llm_config: Optional[Dict[str, str]] = None, task_id: Optional[str] = None, json_mode: bool = False):
+    llm_id = resolve_llm_id(role_env_var, default_llm_id, llm_config)
+    if llm_id not in (JSON_LLM_CACHE if json_mode else LLM_CACHE): logger.info(f"Task '{task_id}': Initializing {'JSON-mode ' if json_mode else ''}LLM for '{role_env_var}': {llm_id}")
+    return get_llm_by_id(llm_id, json_mode=json_mode)
+
+
+def llm_id_of(llm) -> str:
+    """Returns the 'provider::model' id under which a client is cached in LLM_CACHE or JSON_LLM_CACHE."""
+    return next((llm_id for cache in (LLM_CACHE, JSON_LLM_CACHE) for llm_id, cached_llm in cache.items() if cached_llm is llm), type(llm).__name__)
+
+
+def is_json_mode(llm) -> bool:
+    return any(cached_llm is llm for cached_llm in JSON_LLM_CACHE.values())
+
+
+def _response_cache_id(llm_id: str, json_mode: bool) -> str:
+    """
+    JSON-mode and plain responses to the same prompt are cached separately.
+    Responses are cached under the model that produced them, so a fallback
+    answer is never served as the primary model's.
+    """
+    return f"{llm_id}#json" if json_mode else llm_id
+
+
+def _cached_llm_response(llm_id: str, role: Optional[str], prompt: str, state: dict) -> Optional[AIMessage]:
+    cached_content = RESPONSE_CACHE.get(llm_id, role, prompt)
+    if cached_content is None: return None
+    logger.info(f"Task '{state.get('task_id', 'N/A')}': LLM response cache hit for role '{role}' ({llm_id}).")
+    return AIMessage(content=cached_content)
+
+
+async def _acached_llm_response(llm_id: str, role: Optional[str], prompt: str, state: dict) -> Optional[AIMessage]:
+    cached_content = await RESPONSE_CACHE.aget(llm_id, role, prompt)
+    if cached_content is None: return None
+    logger.info(f"Task '{state.get('task_id', 'N/A')}': LLM response cache hit for role '{role}' ({llm_id}).")
+    return AIMessage(content=cached_content)
+
+
+def _llm_attempt_order(llm_id: str, state: dict) -> List[str]:
+    """
+    Returns the LLM ids to try, in order. The primary is skipped while its
+    circuit breaker is open, sending traffic straight to DEFAULT_LLM_ID. A
+    primary that is DEFAULT_LLM_ID itself is tried only once.
+    """
+    fallback_llm_id = os.getenv("DEFAULT_LLM_ID", "gemini::gemini-1.5-flash-latest")
+    if not get_circuit_breaker(llm_id).allow_request():
+        logger.info(f"Task '{state.get('task_id', 'N/A')}': Circuit for '{llm_id}' is open. Routing directly to fallback LLM: {fallback_llm_id}")
+        return [fallback_llm_id]
+    return list(dict.fromkeys([llm_id, fallback_llm_id]))
+
+
+def invoke_llm_with_fallback(llm, prompt: str, state: dict, role: Optional[str] = None):
+    """
+    Invokes the given LLM with a prompt. Each call first waits for the shared
+    per-model rate limiter. If a ResourceExhausted error (Google API rate
+    limit) is caught, or the model's circuit breaker is open, the call goes to
+    the cached client for the globally defined DEFAULT_LLM_ID. When `role` is
+    given and caching is enabled for it, identical prompts are answered from
+    RESPONSE_CACHE.
+    """
+    llm_id = llm_id_of(llm); task_id = state.get("task_id", "N/A"); json_mode = is_json_mode(llm); cache_id = _response_cache_id(llm_id, json_mode)
+    if (cached_response := _cached_llm_response(cache_id, role, prompt, state)) is not None: return cached_response
+    attempt_order = _llm_attempt_order(llm_id, state); last_error = None
+    for attempt_index, target_llm_id in enumerate(attempt_order):
+        is_fallback = attempt_index > 0 or target_llm_id != llm_id
+        try:
+            target_llm = llm if target_llm_id == llm_id else get_llm_by_id(target_llm_id, json_mode=json_mode)
+            get_rate_limiter(target_llm_id).acquire_blocking(estimate_tokens(prompt))
+            response = target_llm.invoke(prompt)
+            get_circuit_breaker(target_llm_id).record_success(); RESPONSE_CACHE.put(_response_cache_id(target_llm_id, json_mode), role, prompt, response.content)
+            return response
+        except ResourceExhausted as e:
+            get_circuit_breaker(target_llm_id).record_failure(); last_error = e
+            logger.warning(f"Task '{task_id}': LLM call to '{target_llm_id}' failed with rate limit error: {e}. Attempting fallback.")
+        except Exception as e:
+            if not is_fallback: raise
+            logger.error(f"Task '{task_id}': Fallback LLM call also failed: {e}"); last_error = last_error or e; break
+    return AIMessage(content=f"LLM call failed due to rate limits, and the fallback attempt also failed. Original error: {last_error}")
+
+
+async def ainvoke_llm_with_fallback(llm, prompt: str, state: dict, role: Optional[str] = None):
+    """
+    Async counterpart of `invoke_llm_with_fallback`. Uses `ainvoke` so that a
+    caller waiting on the LLM (or queued behind the rate limiter) yields the
+    event loop to other running tasks instead of blocking it.
+    """
+    llm_id = llm_id_of(llm); task_id = state.get("task_id", "N/A"); json_mode = is_json_mode(llm); cache_id = _response_cache_id(llm_id, json_mode)
+    if (cached_response := await _acached_llm_response(cache_id, role, prompt, state)) is not None: return cached_response
+    attempt_order = _llm_attempt_order(llm_id, state); last_error = None
+    for attempt_index, target_llm_id in enumerate(attempt_order):
+        is_fallback = attempt_index > 0 or target_llm_id != llm_id
+        try:
+            target_llm = llm if target_llm_id == llm_id else get_llm_by_id(target_llm_id, json_mode=json_mode)
+            await get_rate_limiter(target_llm_id).acquire(estimate_tokens(prompt))
+            response = await target_llm.ainvoke(prompt)
+            get_circuit_breaker(target_llm_id).record_success(); RESPONSE_CACHE.put_nowait(_response_cache_id(target_llm_id, json_mode), role, prompt, response.content)
+            return response
+        except ResourceExhausted as e:
+            get_circuit_breaker(target_llm_id).record_failure(); last_error = e
+            logger.warning(f"Task '{task_id}': LLM call to '{target_llm_id}' failed with rate limit error: {e}. Attempting fallback.")
+        except Exception as e:
+            if not is_fallback: raise
+            logger.error(f"Task '{task_id}': Fallback LLM call also failed: {e}"); last_error = last_error or e; break
+    return AIMessage(content=f"LLM call failed due to rate limits, and the fallback attempt also failed. Original error: {last_error}")
+
+
+async def astream_llm_with_fallback(llm, prompt: str, state: dict, role: Optional[str] = None,
+                                    is_complete: Optional[Callable[[str], bool]] = None) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of `ainvoke_llm_with_fallback`: yields the response
+    text chunk by chunk as the model produces it. Falling back to
+    DEFAULT_LLM_ID is only possible before the first chunk was yielded. A
+    cached response is yielded as a single chunk.
+
+    A consumer may stop early (`aclose()`) once it has what it needs. The call
+    still counts as a success for the circuit breaker, and the text received
+    so far is cached if `is_complete(text)` confirms it is a usable response.
+    """
+    llm_id = llm_id_of(llm); task_id = state.get("task_id", "N/A"); json_mode = is_json_mode(llm); cache_id = _response_cache_id(llm_id, json_mode)
+    if (cached_response := await _acached_llm_response(cache_id, role, prompt, state)) is not None:
+        yield cached_response.content; return
+    attempt_order = _llm_attempt_order(llm_id, state); last_error = None
+    for attempt_index, target_llm_id in enumerate(attempt_order):
+        is_fallback = attempt_index > 0 or target_llm_id != llm_id; streamed_parts = []
+        try:
+            target_llm = llm if target_llm_id == llm_id else get_llm_by_id(target_llm_id, json_mode=json_mode)
+            await get_rate_limiter(target_llm_id).acquire(estimate_tokens(prompt))
+            async for chunk in target_llm.astream(prompt):
+                text = chunk.content if isinstance(chunk.content, str) else str(chunk.content)
+                if not text: continue
+                streamed_parts.append(text)
+                try: yield text
+                except GeneratorExit:
+                    get_circuit_breaker(target_llm_id).record_success()
+                    if is_complete is not None and is_complete("".join(streamed_parts)): RESPONSE_CACHE.put_nowait(_response_cache_id(target_llm_id, json_mode), role, prompt, "".join(streamed_parts))
+                    raise
+            get_circuit_breaker(target_llm_id).record_success(); RESPONSE_CACHE.put_nowait(_response_cache_id(target_llm_id, json_mode), role, prompt, "".join(streamed_parts))
+            return
+        except ResourceExhausted as e:
+            get_circuit_breaker(target_llm_id).record_failure(); last_error = e
+            if streamed_parts: raise
+            logger.warning(f"Task '{task_id}': LLM stream from '{target_llm_id}' failed with rate limit error: {e}. Attempting fallback.")
+        except Exception as e:
+            if not is_fallback or streamed_parts: raise
+            logger.error(f"Task '{task_id}': Fallback LLM call also failed: {e}"); last_error = last_error or e; break
+    yield f"LLM call failed due to rate limits, and the fallback attempt also failed. Original error: {last_error}"
+
+
+# --- Tool-Facing Helpers ---
+
+def get_tool_llm(role_env_var: str = "EDITOR_LLM_ID", default_llm_id: str = "gemini::gemini-1.5-pro-latest"):
+    """Returns the shared client a tool should use, honoring the running task's `llm_config`."""
+    context = _LLM_CONTEXT.get()
+    return get_llm_for_role(role_env_var, default_llm_id, context.get("llm_config"), context.get("task_id"))
+
+
+def invoke_tool_llm(prompt: str, role: str, role_env_var: str = "EDITOR_LLM_ID", default_llm_id: str = "gemini::gemini-1.5-pro-latest") -> str:
+    """
+    Runs a tool's prompt through the shared client with the same rate
+    limiting, caching and fallback as the graph. Returns the response text.
+    """
+    llm = get_tool_llm(role_env_var, default_llm_id)
+    return invoke_llm_with_fallback(llm, prompt, _LLM_CONTEXT.get(), role=role).content
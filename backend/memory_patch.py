@@ -0,0 +1,155 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Memory Vault Patching
+#
+# Applies RFC 6902 (JSON Patch) operations to the Memory Vault so the Memory
+# Updater only has to describe what changed instead of re-emitting the whole
+# vault.
+#
+# Components:
+# 1. `apply_patch`: Applies `add`, `remove`, `replace`, `move`, `copy` and
+#    `test` operations, addressed with RFC 6901 JSON Pointers. The patch is
+#    atomic: the input document is never modified and any failing operation
+#    rejects the whole patch.
+# 2. `validate_document`: Checks a document against a TypedDict schema (the
+#    `MemoryVault` TypedDicts in `langgraph_agent.py`), rejecting unknown keys
+#    and values of the wrong type.
+# -----------------------------------------------------------------------------
+
+import copy
+import typing
+from typing import Any, List, Union, get_args, get_origin
+
+
+class PatchError(ValueError):
+    """Raised when a patch is malformed, cannot be applied, or yields an invalid document."""
+
+
+def _parse_pointer(pointer: str) -> List[str]:
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith("/")):
+        raise PatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer.split("/")[1:]]
+
+
+def _list_index(container: list, token: str, allow_end: bool = False) -> int:
+    if allow_end and token == "-": return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise PatchError(f"Invalid list index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"List index out of range: {index}")
+    return index
+
+
+def _resolve_parent(document: Any, tokens: List[str]) -> Any:
+    """Returns the container holding the value addressed by `tokens`."""
+    current = document
+    for token in tokens[:-1]:
+        if isinstance(current, dict):
+            if token not in current: raise PatchError(f"Path segment not found: {token!r}")
+            current = current[token]
+        elif isinstance(current, list): current = current[_list_index(current, token)]
+        else: raise PatchError(f"Cannot traverse into a {type(current).__name__} at {token!r}")
+    return current
+
+
+def _get(document: Any, pointer: str) -> Any:
+    tokens = _parse_pointer(pointer)
+    if not tokens: return document
+    parent = _resolve_parent(document, tokens); token = tokens[-1]
+    if isinstance(parent, dict):
+        if token not in parent: raise PatchError(f"Path not found: {pointer}")
+        return parent[token]
+    if isinstance(parent, list): return parent[_list_index(parent, token)]
+    raise PatchError(f"Path not found: {pointer}")
+
+
+def _add(document: Any, pointer: str, value: Any) -> Any:
+    tokens = _parse_pointer(pointer)
+    if not tokens: return value
+    parent = _resolve_parent(document, tokens); token = tokens[-1]
+    if isinstance(parent, dict): parent[token] = value
+    elif isinstance(parent, list): parent.insert(_list_index(parent, token, allow_end=True), value)
+    else: raise PatchError(f"Cannot add to a {type(parent).__name__} at {pointer}")
+    return document
+
+
+def _remove(document: Any, pointer: str) -> Any:
+    tokens = _parse_pointer(pointer)
+    if not tokens: raise PatchError("Cannot remove the document root.")
+    parent = _resolve_parent(document, tokens); token = tokens[-1]
+    if isinstance(parent, dict):
+        if token not in parent: raise PatchError(f"Path not found: {pointer}")
+        del parent[token]
+    elif isinstance(parent, list): del parent[_list_index(parent, token)]
+    else: raise PatchError(f"Path not found: {pointer}")
+    return document
+
+
+def _replace(document: Any, pointer: str, value: Any) -> Any:
+    tokens = _parse_pointer(pointer)
+    if not tokens: return value
+    parent = _resolve_parent(document, tokens); token = tokens[-1]
+    if isinstance(parent, dict):
+        if token not in parent: raise PatchError(f"Path not found: {pointer}")
+        parent[token] = value
+    elif isinstance(parent, list): parent[_list_index(parent, token)] = value
+    else: raise PatchError(f"Path not found: {pointer}")
+    return document
+
+
+def apply_patch(document: Any, operations: List[dict]) -> Any:
+    """Returns a patched copy of `document`. Raises `PatchError` if any operation fails."""
+    if not isinstance(operations, list): raise PatchError("A patch must be a list of operations.")
+    result = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict) or "op" not in operation or "path" not in operation:
+            raise PatchError(f"Malformed patch operation: {operation!r}")
+        op, path = operation["op"], operation["path"]
+        if op in ("add", "replace", "test") and "value" not in operation: raise PatchError(f"'{op}' operation at {path} is missing a value.")
+        if op in ("move", "copy") and "from" not in operation: raise PatchError(f"'{op}' operation at {path} is missing 'from'.")
+        if op == "add": result = _add(result, path, copy.deepcopy(operation["value"]))
+        elif op == "remove": result = _remove(result, path)
+        elif op == "replace": result = _replace(result, path, copy.deepcopy(operation["value"]))
+        elif op == "move":
+            if path != operation["from"] and path.startswith(operation["from"] + "/"): raise PatchError(f"Cannot move {operation['from']} into its own child {path}.")
+            value = _get(result, operation["from"]); result = _add(_remove(result, operation["from"]), path, value)
+        elif op == "copy": result = _add(result, path, copy.deepcopy(_get(result, operation["from"])))
+        elif op == "test":
+            if _get(result, path) != operation["value"]: raise PatchError(f"Test failed at {path}.")
+        else: raise PatchError(f"Unsupported patch operation: {op!r}")
+    return result
+
+
+def _is_typeddict(schema: Any) -> bool:
+    return isinstance(schema, type) and issubclass(schema, dict) and hasattr(schema, "__annotations__") and hasattr(schema, "__total__")
+
+
+def validate_document(document: Any, schema: Any, path: str = "") -> None:
+    """Raises `PatchError` if `document` does not match `schema` (a TypedDict or typing annotation)."""
+    if schema is Any: return
+    if _is_typeddict(schema):
+        if not isinstance(document, dict): raise PatchError(f"{path or '/'} must be an object.")
+        fields = typing.get_type_hints(schema)
+        for key, value in document.items():
+            if key not in fields: raise PatchError(f"Unknown key {path}/{key}.")
+            validate_document(value, fields[key], f"{path}/{key}")
+        missing = [key for key in getattr(schema, "__required_keys__", ()) if key not in document]
+        if missing: raise PatchError(f"{path or '/'} is missing required key(s): {', '.join(missing)}.")
+        return
+    origin = get_origin(schema)
+    if origin is Union:
+        for option in get_args(schema):
+            try: validate_document(document, option, path); return
+            except PatchError: continue
+        raise PatchError(f"{path or '/'} does not match {schema}.")
+    if origin in (list, List):
+        if not isinstance(document, list): raise PatchError(f"{path or '/'} must be a list.")
+        item_schema = (get_args(schema) or (Any,))[0]
+        for index, item in enumerate(document): validate_document(item, item_schema, f"{path}/{index}")
+        return
+    if schema is type(None):
+        if document is not None: raise PatchError(f"{path or '/'} must be null.")
+        return
+    expected = origin or schema
+    if isinstance(expected, type) and not isinstance(document, expected):
+        raise PatchError(f"{path or '/'} must be of type {expected.__name__}.")
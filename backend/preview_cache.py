@@ -0,0 +1,68 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Text Preview Cache
+#
+# The file explorer re-opens the same files over and over (every
+# `refresh_workspace` after a final answer). `/file-content` used to re-read
+# and re-encode the file each time.
+#
+# `PreviewCache` is a small, thread-safe LRU of encoded previews keyed by the
+# file's path and validated by its ETag (inode, mtime, size), so a changed
+# file is never served stale. It is bounded by total bytes, and files larger
+# than PREVIEW_CACHE_MAX_FILE_BYTES are not cached at all.
+#
+# Configuration (optional, see `.env.example`):
+# - PREVIEW_CACHE_MAX_BYTES: Total size of cached previews (0 disables it).
+# - PREVIEW_CACHE_MAX_FILE_BYTES: Largest preview that is cached.
+# -----------------------------------------------------------------------------
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class PreviewCache:
+    """LRU of (etag, encoded preview) per file path, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int, max_file_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._entries: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, path: str, etag: str) -> Optional[bytes]:
+        """Returns the cached preview if it was stored for this exact version of the file."""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != etag:
+                self._stats["misses"] += 1; return None
+            self._entries.move_to_end(path); self._stats["hits"] += 1
+            return entry[1]
+
+    def put(self, path: str, etag: str, body: bytes):
+        if len(body) > min(self.max_file_bytes, self.max_bytes): return
+        with self._lock:
+            self._discard(path)
+            self._entries[path] = (etag, body); self._size += len(body)
+            while self._size > self.max_bytes: self._discard(next(iter(self._entries)))
+
+    def invalidate(self, path: str):
+        """Drops the preview of `path` and of everything below it (for deletes, renames and uploads)."""
+        prefix = path.rstrip(os.sep) + os.sep
+        with self._lock:
+            for cached_path in [p for p in self._entries if p == path or p.startswith(prefix)]: self._discard(cached_path)
+
+    def _discard(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None: self._size -= len(entry[1])
+
+    def stats(self) -> dict:
+        with self._lock: return {**self._stats, "entries": len(self._entries), "bytes": self._size}
+
+
+PREVIEW_CACHE = PreviewCache(
+    max_bytes=int(os.getenv("PREVIEW_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    max_file_bytes=int(os.getenv("PREVIEW_CACHE_MAX_FILE_BYTES", str(1024 * 1024))),
+)
@@ -1,10 +1,9 @@
 # -----------------------------------------------------------------------------
-# Mentor::i Prompts (Phase 15 - Data Piping FIX)
+# Mentor::i Prompts (Phase 18 - Fused Router)
 #
-# This version updates the planner's prompt to explicitly teach it how to
-# use the `{step_N_output}` placeholder for piping data between steps. This
-# will fix the bug where a placeholder was written to a file instead of the
-# actual summary.
+# This version adds a fused Router prompt that returns the route and, for
+# SIMPLE_TOOL_USE requests, the tool call in a single JSON response, so the
+# Handyman call can be skipped.
 # -----------------------------------------------------------------------------
 
 from langchain_core.prompts import PromptTemplate
@@ -15,14 +14,14 @@ memory_updater_prompt_template = PromptTemplate.from_template(
 You are an expert memory administrator AI. Your sole responsibility is to maintain a structured JSON "Memory Vault" for an ongoing session.
 
 **Your Task:**
-You will be given the current state of the Memory Vault and the most recent turn of the conversation. Your job is to analyze the conversation and return a new, updated JSON object representing the new state of the Memory Vault.
+You will be given the current state of the Memory Vault and the most recent turn of the conversation. Your job is to analyze the conversation and describe the changes to the Memory Vault as a list of JSON Patch (RFC 6902) operations.
 
 **CRITICAL RULES:**
-1.  **Maintain Existing Data:** NEVER delete information from the vault unless the user explicitly asks to forget something. Your goal is to augment and update, not to replace.
-2.  **Update Existing Fields:** If the new information provides a value for a field that is currently `null` or empty, update it. For singleton preferences like `formatting_style`, you MUST overwrite the existing value.
-3.  **Add to Lists:** If the new information represents a new entity (like a new project, a new concept, or a new fact), add it to the end of the appropriate list. Do NOT overwrite the entire list.
+1.  **Maintain Existing Data:** NEVER remove information from the vault unless the user explicitly asks to forget something. Your goal is to augment and update, not to replace.
+2.  **Update Existing Fields:** If the new information provides a value for a field that is currently `null` or empty, use a `replace` (or `add`) operation. For singleton preferences like `formatting_style`, you MUST `replace` the existing value.
+3.  **Add to Lists:** If the new information represents a new entity (like a new project, a new concept, or a new fact), append it with an `add` operation whose path ends in `/-`. Do NOT replace the entire list.
 4.  **Be Precise:** Only add or modify information that is explicitly stated in the recent conversation. Do not infer or invent details.
-5.  **Return Full JSON:** You must always return the *entire*, updated JSON object for the memory vault.
+5.  **Return Only Changes:** Use only the `add`, `remove`, `replace`, `move`, `copy` and `test` operations with JSON Pointer paths into the existing vault structure. Do not invent new top-level keys. If nothing needs to change, return an empty list `[]`.
 ---
 **Current Memory Vault:**
 ```json
@@ -34,7 +33,15 @@ You will be given the current state of the Memory Vault and the most recent turn
 {recent_conversation}
 ---
 
-**Your Output (must be only a single, valid JSON object with the updated Memory Vault):**
+**Example Output:**
+```json
+[
+  {{"op": "replace", "path": "/user_profile/preferences/formatting_style", "value": "plain text"}},
+  {{"op": "add", "path": "/key_observations_and_facts/-", "value": "The user is writing a thesis on coral reefs."}}
+]
+```
+
+**Your Output (must be only a single, valid JSON array of patch operations):**
 """
 )
 
@@ -42,7 +49,7 @@ You will be given the current state of the Memory Vault and the most recent turn
 # 2. Summarizer Prompt
 summarizer_prompt_template = PromptTemplate.from_template(
     """
-You are an expert conversation summarizer. Your task is to read the following conversation history and create a concise summary.
+You are an expert conversation summarizer. You maintain a rolling summary of a long conversation. Your task is to fold the newest part of the conversation into the existing summary and return the updated summary.
 
 The summary must capture all critical information, including:
 - Key facts that were discovered or mentioned.
@@ -51,9 +58,14 @@ The summary must capture all critical information, including:
 - The outcomes of any tools that were used.
 - Any specific data points, figures, or names that were part of the conversation.
 
-The goal is to produce a summary that is dense with information, so a new AI agent can read it and have all the necessary context to continue the conversation without having access to the full history.
+The goal is to produce a summary that is dense with information, so a new AI agent can read it and have all the necessary context to continue the conversation without having access to the full history. Keep everything important from the existing summary; do not drop earlier facts just because the new messages do not mention them.
+
+Existing Summary:
+---
+{existing_summary}
+---
 
-Conversation to Summarize:
+New Conversation Messages to Fold In:
 ---
 {conversation}
 ---
@@ -98,6 +110,60 @@ You are an expert request router. Your job is to classify the user's latest requ
 """
 )
 
+# 3b. Fused Router Prompt (used instead of 3 + 4 when FUSED_ROUTER=true)
+fused_router_prompt_template = PromptTemplate.from_template(
+    """
+You are an expert request router. Your job is to classify the user's latest request into one of three categories based on the conversation history, the agent's structured memory, and the available tools. If the request needs exactly one tool call, you also produce that tool call.
+
+**Agent's Structured Memory (Memory Vault):**
+```json
+{memory_vault}
+```
+
+**Recent Conversation History:**
+{chat_history}
+
+**Available Tools:**
+{tools}
+
+**Categories:**
+1.  **DIRECT_QA**: For simple knowledge-based questions, conversational interactions, or direct commands to store or retrieve information from memory.
+    -   Examples: "What is the capital of France?", "What is my favorite dessert?", "Remember my project is called Helios.", "That's all for now, thank you."
+2.  **SIMPLE_TOOL_USE**: For requests that can be fulfilled with a single tool call.
+    -   Examples: "list the files in the current directory", "read the file 'main.py'", "search the web for the latest news on AI"
+3.  **COMPLEX_PROJECT**: For requests that require multiple steps, planning, or the use of several tools in a sequence.
+    -   Examples: "Research the market for electric vehicles and write a summary report.", "Create a python script to fetch data from an API and save it to a CSV file.", "Find the top 3 competitors to LangChain and create a feature comparison table."
+
+**User's Latest Request:**
+{input}
+
+**Instructions:**
+- Analyze the user's latest request in the context of the structured memory and conversation history.
+- Your output must be a single, valid JSON object with the keys "route" and "tool_call".
+- "route" must be one of "DIRECT_QA", "SIMPLE_TOOL_USE" or "COMPLEX_PROJECT".
+- If "route" is "SIMPLE_TOOL_USE", "tool_call" must be the tool call, with the "tool_name" of the single most appropriate tool and the precise "tool_input" for it. Otherwise "tool_call" must be `null`.
+- Do not add any conversational fluff or explanation. Your output must be ONLY the JSON object.
+
+---
+**Example Request:** "list all the files in the workspace"
+**Example Output:**
+```json
+{{
+  "route": "SIMPLE_TOOL_USE",
+  "tool_call": {{
+    "tool_name": "list_files",
+    "tool_input": {{
+      "directory": "."
+    }}
+  }}
+}}
+```
+---
+
+**Your Output:**
+"""
+)
+
 # 4. Handyman Prompt
 handyman_prompt_template = PromptTemplate.from_template(
     """
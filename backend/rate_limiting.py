@@ -0,0 +1,177 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Client-Side Rate Limiting & Circuit Breaking
+#
+# Shared, process-wide guards for LLM traffic, keyed by LLM id
+# ("provider::model"). They are used by the agent's LLM invocation helpers so
+# that many tasks planning at once queue up behind a limiter instead of
+# triggering a storm of 429 / ResourceExhausted errors.
+#
+# Components:
+# 1. `TokenBucket`: A thread-safe bucket that hands out reservations. Callers
+#    wait for their reservation instead of failing, so requests queue in
+#    arrival order.
+# 2. `RateLimiter`: Combines a requests-per-minute and a tokens-per-minute
+#    bucket. Offers both `await acquire(...)` and `acquire_blocking(...)`.
+# 3. `CircuitBreaker`: After `failure_threshold` consecutive rate-limit
+#    failures the breaker opens and traffic is routed straight to the fallback
+#    model for `reset_timeout` seconds. One probe request is then let through
+#    (half-open) to decide whether to close it again.
+#
+# Configuration (see `.env.example`):
+# - LLM_RATE_LIMITS: "llm_id=rpm:tpm" pairs, comma-separated. The model part
+#   may be a wildcard ("gemini::*=15:1000000"). 0 means unlimited.
+# - LLM_CIRCUIT_FAILURE_THRESHOLD / LLM_CIRCUIT_RESET_SECONDS
+# -----------------------------------------------------------------------------
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for TPM budgeting."""
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at `rate_per_second` up to `capacity`."""
+
+    def __init__(self, capacity: float, rate_per_second: float):
+        self.capacity = capacity
+        self.rate_per_second = rate_per_second
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Reserves `amount` tokens and returns how many seconds the caller must
+        wait before using them. The balance may go negative, which is what
+        makes later callers queue behind earlier ones.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+            self._updated_at = now
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate_per_second
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one LLM id."""
+
+    def __init__(self, llm_id: str, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.llm_id = llm_id
+        self._request_bucket = TokenBucket(requests_per_minute, requests_per_minute / 60.0) if requests_per_minute > 0 else None
+        self._token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0) if tokens_per_minute > 0 else None
+        self.queued_seconds = 0.0
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        wait = 0.0
+        if self._request_bucket: wait = max(wait, self._request_bucket.reserve(1))
+        if self._token_bucket: wait = max(wait, self._token_bucket.reserve(estimated_tokens))
+        if wait > 0:
+            self.queued_seconds += wait
+            logger.info(f"Rate limiter for '{self.llm_id}': queueing request for {wait:.2f}s.")
+        return wait
+
+    async def acquire(self, estimated_tokens: int = 1):
+        wait = self._reserve(estimated_tokens)
+        if wait > 0: await asyncio.sleep(wait)
+
+    def acquire_blocking(self, estimated_tokens: int = 1):
+        wait = self._reserve(estimated_tokens)
+        if wait > 0: time.sleep(wait)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, llm_id: str, failure_threshold: int = 3, reset_timeout: float = 60.0):
+        self.llm_id = llm_id
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED: return True
+            # A probe is let through once per `reset_timeout`, even if an earlier
+            # probe never reported back.
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN; self._opened_at = time.monotonic()
+                logger.info(f"Circuit for '{self.llm_id}' is half-open. Letting a probe request through.")
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED: logger.info(f"Circuit for '{self.llm_id}' closed again.")
+            self.state = self.CLOSED; self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN: logger.warning(f"Circuit for '{self.llm_id}' opened after {self._failures} consecutive failure(s).")
+                self.state = self.OPEN; self._opened_at = time.monotonic()
+
+
+def _parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    limits = {}
+    for part in spec.split(","):
+        part = part.strip()
+        if not part or "=" not in part: continue
+        llm_id, _, values = part.rpartition("=")
+        rpm, _, tpm = values.partition(":")
+        try: limits[llm_id.strip()] = (float(rpm or 0), float(tpm or 0))
+        except ValueError: logger.warning(f"Ignoring invalid LLM_RATE_LIMITS entry: '{part}'")
+    return limits
+
+
+RATE_LIMITS = _parse_rate_limits(os.getenv("LLM_RATE_LIMITS", ""))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "60"))
+
+_LIMITERS: Dict[str, RateLimiter] = {}
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _limits_for(llm_id: str) -> Tuple[float, float]:
+    if llm_id in RATE_LIMITS: return RATE_LIMITS[llm_id]
+    provider = llm_id.split("::")[0]
+    return RATE_LIMITS.get(f"{provider}::*", (0, 0))
+
+
+def get_rate_limiter(llm_id: str) -> RateLimiter:
+    with _REGISTRY_LOCK:
+        if llm_id not in _LIMITERS:
+            rpm, tpm = _limits_for(llm_id)
+            _LIMITERS[llm_id] = RateLimiter(llm_id, rpm, tpm)
+        return _LIMITERS[llm_id]
+
+
+def get_circuit_breaker(llm_id: str) -> CircuitBreaker:
+    with _REGISTRY_LOCK:
+        if llm_id not in _BREAKERS: _BREAKERS[llm_id] = CircuitBreaker(llm_id, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS)
+        return _BREAKERS[llm_id]
+
+
+def resilience_stats() -> dict:
+    with _REGISTRY_LOCK:
+        return {
+            "limiters": {llm_id: {"queued_seconds": round(l.queued_seconds, 3)} for llm_id, l in _LIMITERS.items()},
+            "circuits": {llm_id: b.state for llm_id, b in _BREAKERS.items()},
+        }
@@ -0,0 +1,202 @@
+# -----------------------------------------------------------------------------
+# Mentor::i LLM Response Cache
+#
+# An opt-in, two-tier cache mapping (llm_id, role, prompt hash) to the text
+# of a previous LLM response. It is used by the agent's LLM invocation helpers
+# so that identical prompts (regression runs, retries after the
+# Correction_Planner rebuilt a nearly identical prompt, repeated router
+# decisions) are not paid for twice.
+#
+# Tiers:
+# 1. Memory: A bounded LRU (`OrderedDict`) in front of everything.
+# 2. Disk: A SQLite file that survives restarts. Entries are promoted into the
+#    memory tier on a disk hit. The disk tier is trimmed by last access time.
+#
+# Async callers use `aget` / `put_nowait`: the memory tier is consulted
+# inline, while SQLite reads and writes run in worker threads so they do not
+# block the event loop.
+#
+# Configuration (all optional, see `.env.example`):
+# - LLM_RESPONSE_CACHE_ENABLED: "true" to turn the cache on.
+# - LLM_RESPONSE_CACHE_ROLES: Comma-separated roles to cache, each with an
+#   optional TTL in seconds (e.g. "router:3600,memory_updater"). Empty means
+#   every role.
+# - LLM_RESPONSE_CACHE_TTL: Default TTL in seconds.
+# - LLM_RESPONSE_CACHE_SIZE: Maximum entries in the memory tier.
+# - LLM_RESPONSE_CACHE_PATH: SQLite file for the disk tier ("" disables it).
+# - LLM_RESPONSE_CACHE_DISK_MAX_ENTRIES: Maximum entries in the disk tier.
+# -----------------------------------------------------------------------------
+
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_roles(roles_str: str) -> Dict[str, Optional[float]]:
+    """Parses "role[:ttl],role[:ttl]" into a {role: ttl_or_None} mapping."""
+    roles = {}
+    for part in roles_str.split(","):
+        part = part.strip()
+        if not part: continue
+        role, _, ttl = part.partition(":")
+        try: roles[role.strip()] = float(ttl) if ttl.strip() else None
+        except ValueError:
+            logger.warning(f"Invalid TTL '{ttl}' for cached role '{role}'. Using the default TTL.")
+            roles[role.strip()] = None
+    return roles
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + SQLite) cache of LLM response texts."""
+
+    def __init__(self, enabled: bool = False, roles: Optional[Dict[str, Optional[float]]] = None, default_ttl: float = 86400.0,
+                 max_entries: int = 512, db_path: Optional[str] = None, disk_max_entries: int = 10000):
+        self.enabled = enabled
+        self.roles = roles or {}
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # SQLite work has its own lock, so memory-tier lookups never wait for disk I/O.
+        self._db_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "expired": 0}
+        self._db = None
+        if enabled and db_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, llm_id TEXT, role TEXT, content TEXT, expires_at REAL, last_access REAL)")
+                self._db.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+                self._db.commit()
+                logger.info(f"LLM response cache disk tier opened at '{db_path}'.")
+            except sqlite3.Error as e:
+                logger.error(f"Could not open LLM response cache database '{db_path}': {e}. Using the memory tier only.")
+                self._db = None
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            enabled=os.getenv("LLM_RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes"),
+            roles=_parse_roles(os.getenv("LLM_RESPONSE_CACHE_ROLES", "")),
+            default_ttl=float(os.getenv("LLM_RESPONSE_CACHE_TTL", "86400")),
+            max_entries=int(os.getenv("LLM_RESPONSE_CACHE_SIZE", "512")),
+            db_path=os.getenv("LLM_RESPONSE_CACHE_PATH", "/app/cache/llm_responses.sqlite") or None,
+            disk_max_entries=int(os.getenv("LLM_RESPONSE_CACHE_DISK_MAX_ENTRIES", "10000")),
+        )
+
+    def is_enabled_for(self, role: Optional[str]) -> bool:
+        if not self.enabled or not role: return False
+        return not self.roles or role in self.roles
+
+    def _ttl_for(self, role: str) -> float:
+        ttl = self.roles.get(role)
+        return ttl if ttl is not None else self.default_ttl
+
+    @staticmethod
+    def make_key(llm_id: str, role: str, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{llm_id}|{role}|{prompt_hash}"
+
+    def get(self, llm_id: str, role: str, prompt: str) -> Optional[str]:
+        """Returns the cached response text, or None on a miss."""
+        if not self.is_enabled_for(role): return None
+        key = self.make_key(llm_id, role, prompt); now = time.time()
+        content, expired = self._get_memory(key, now)
+        return content if content is not None else self._get_disk(key, now, expired)
+
+    async def aget(self, llm_id: str, role: str, prompt: str) -> Optional[str]:
+        """`get` for coroutines: the memory tier is checked inline, the disk tier in a worker thread."""
+        if not self.is_enabled_for(role): return None
+        key = self.make_key(llm_id, role, prompt); now = time.time()
+        content, expired = self._get_memory(key, now)
+        if content is not None: return content
+        if self._db is None: return self._get_disk(key, now, expired)
+        return await asyncio.to_thread(self._get_disk, key, now, expired)
+
+    def put(self, llm_id: str, role: str, prompt: str, content: str):
+        if not self.is_enabled_for(role) or not content: return
+        key, expires_at, now = self._put_memory(llm_id, role, prompt, content)
+        self._put_disk(key, llm_id, role, content, expires_at, now)
+
+    def put_nowait(self, llm_id: str, role: str, prompt: str, content: str):
+        """
+        `put` for coroutines: stores in the memory tier inline and hands the
+        disk write to the event loop's default executor without waiting for it.
+        """
+        if not self.is_enabled_for(role) or not content: return
+        key, expires_at, now = self._put_memory(llm_id, role, prompt, content)
+        if self._db is not None: asyncio.get_running_loop().run_in_executor(None, self._put_disk, key, llm_id, role, content, expires_at, now)
+
+    def _get_memory(self, key: str, now: float) -> Tuple[Optional[str], bool]:
+        """Returns (content, expired) from the memory tier."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None: return None, False
+            content, expires_at = entry
+            if expires_at > now:
+                self._memory.move_to_end(key); self._stats["memory_hits"] += 1
+                return content, False
+            del self._memory[key]
+            return None, True
+
+    def _get_disk(self, key: str, now: float, expired: bool) -> Optional[str]:
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    row = self._db.execute("SELECT content, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+                    if row is not None and row[1] > now: self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                    elif row is not None: self._db.execute("DELETE FROM responses WHERE key = ?", (key,)); expired = True
+                    self._db.commit()
+                if row is not None and row[1] > now:
+                    with self._lock: self._remember(key, row[0], row[1]); self._stats["disk_hits"] += 1
+                    return row[0]
+            except sqlite3.Error as e:
+                logger.warning(f"LLM response cache disk lookup failed: {e}")
+        return self._count_miss(expired)
+
+    def _count_miss(self, expired: bool) -> None:
+        with self._lock:
+            if expired: self._stats["expired"] += 1
+            self._stats["misses"] += 1
+
+    def _put_memory(self, llm_id: str, role: str, prompt: str, content: str) -> Tuple[str, float, float]:
+        key = self.make_key(llm_id, role, prompt); now = time.time(); expires_at = now + self._ttl_for(role)
+        with self._lock: self._remember(key, content, expires_at); self._stats["stores"] += 1
+        return key, expires_at, now
+
+    def _put_disk(self, key: str, llm_id: str, role: str, content: str, expires_at: float, now: float):
+        if self._db is None: return
+        try:
+            with self._db_lock:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, llm_id, role, content, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?)", (key, llm_id, role, content, expires_at, now))
+                self._db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.disk_max_entries,))
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM response cache disk write failed: {e}")
+
+    def _remember(self, key: str, content: str, expires_at: float):
+        self._memory[key] = (content, expires_at); self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries: self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock: self._memory.clear()
+        if self._db is not None:
+            with self._db_lock: self._db.execute("DELETE FROM responses"); self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]; lookups = hits + self._stats["misses"]
+            return {**self._stats, "entries": len(self._memory), "hit_rate": (hits / lookups) if lookups else 0.0}
+
+
+RESPONSE_CACHE = ResponseCache.from_env()
@@ -1,15 +1,24 @@
 # -----------------------------------------------------------------------------
-# Mentor::i Backend Server (Phase 17 - Download Header FIX)
+# Mentor::i Backend Server (Phase 23 - Paginated Listings)
 #
-# This version fixes the file download functionality. Previously, clicking the
-# download button would open the file in a new tab instead of triggering a
-# download prompt.
+# This version makes workspace listings cheap on large workspaces.
 #
 # Key Architectural Changes:
-# 1. Added `Content-Disposition` Header: The `_handle_get_raw_file` method
-#    now sends the `Content-Disposition: attachment` header. This is the
-#    standard way to instruct browsers to treat the response as a file to be
-#    downloaded, rather than content to be displayed, fixing the bug.
+# 1. `/api/workspace/items` lists with one `os.scandir` pass and accepts
+#    `offset`/`limit`, `sort` (type, name, size, mtime) and `order`. With
+#    `recursive=true` it returns the tree up to `depth` levels as a flat list
+#    of relative paths, skipping ignore patterns such as `.venv` and
+#    `__pycache__` (`workspace_listing.py`).
+# 2. Listings are cached for a few seconds and invalidated by every write the
+#    server performs (create, delete, rename, upload).
+# 3. `/upload` checks size limits and the workspace quota up front and
+#    streams files into place; large files use resumable chunked upload
+#    sessions under `/api/uploads` (Phase 22).
+# 4. `/file-content` serves large files one window of lines (or bytes) at a
+#    time through a persisted sparse line index (Phase 21).
+# 5. Responses carry `ETag`/`Last-Modified` and honor conditional requests
+#    (Phase 20); downloads are streamed with `Range` support (Phase 19) by a
+#    keep-alive thread pool (Phase 18).
 # -----------------------------------------------------------------------------
 
 import asyncio
@@ -20,6 +29,10 @@ import threading
 import shutil
 import mimetypes
 import re
+import time
+import select
+from email.utils import formatdate, parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
@@ -32,7 +45,14 @@ from langgraph.checkpoint.memory import MemorySaver
 # --- Local Imports ---
 from .langgraph_agent import agent_graph
 from .tools.file_system import _resolve_path
-from .tools import get_available_tools
+from .tools import get_available_tools, TOOL_REGISTRY
+from .background_jobs import BACKGROUND_JOBS
+from .checkpointer import SqliteCheckpointSaver, run_compaction_loop
+from .blob_store import BLOB_DIR_NAME
+from .preview_cache import PREVIEW_CACHE
+from .uploads import UploadError, StagedFileFactory, check_upload_size, workspace_quota, create_session, get_session, write_chunk, cancel_session
+from .workspace_listing import list_directory, LISTING_CACHE, WORKSPACE_LISTING_IGNORE
+from .line_index import get_line_index, read_lines, read_bytes, PREVIEW_PAGE_LINES, PREVIEW_FULL_FILE_MAX_BYTES, PREVIEW_MAX_WINDOW_BYTES
 
 # --- Configuration & Globals ---
 load_dotenv()
@@ -55,11 +75,9 @@ TOOL_TEMPLATE = """
 # -----------------------------------------------------------------------------
 
 import logging
-import os
 from langchain_core.tools import StructuredTool
 from pydantic import BaseModel, Field
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.chat_models import ChatOllama
+from ..llm_factory import invoke_tool_llm
 
 logger = logging.getLogger(__name__)
 
@@ -89,19 +107,7 @@ You must now execute this tool with the following input arguments:
 Based on the tool's description and the provided arguments, perform the task and return a concise, direct answer.
 \"\"\"
 
-        llm_id = os.getenv("EDITOR_LLM_ID", "gemini::gemini-1.5-pro-latest")
-        provider, model_name = llm_id.split("::")
-        logger.info(f"Custom tool '{tool_name}' is using LLM: {{llm_id}}")
-
-        if provider == "gemini":
-            llm = ChatGoogleGenerativeAI(model=model_name, google_api_key=os.getenv("GOOGLE_API_KEY"))
-        elif provider == "ollama":
-            llm = ChatOllama(model=model_name, base_url=os.getenv("OLLAMA_BASE_URL"))
-        else:
-            return f"Error: Unsupported LLM provider '{{provider}}' specified in EDITOR_LLM_ID."
-
-        response = llm.invoke(prompt)
-        return response.content
+        return invoke_tool_llm(prompt, role="custom_tool")
         
     except Exception as e:
         logger.error(f"Error executing custom tool '{tool_name}': {{e}}", exc_info=True)
@@ -128,8 +134,74 @@ def _safe_delete_workspace(task_id: str):
         else: logger.warning(f"Task '{task_id}': Workspace directory not found for deletion.")
     except Exception as e: logger.error(f"Task '{task_id}': Error deleting workspace: {e}", exc_info=True)
 
+def _workspace_root(workspace_relative_path: str) -> str:
+    """The task workspace that contains `<task_id>/...`; quotas are accounted per task workspace."""
+    return _resolve_path("/app/workspace", workspace_relative_path.strip("/").split("/")[0])
+
+def _parse_byte_range(range_header, file_size: int):
+    """
+    Parses a single `Range: bytes=first-last` (or suffix `bytes=-n`) header
+    into an inclusive (start, end) pair. Returns None if there is no usable
+    header (malformed or multi-range requests get the whole file) and raises
+    ValueError if the range cannot be satisfied.
+    """
+    if not range_header: return None
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", range_header)
+    if not match or not (match.group(1) or match.group(2)): return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start: return None
+        if start >= file_size: raise ValueError(f"Range start {start} is beyond the end of a {file_size}-byte file.")
+        return start, min(int(last), file_size - 1) if last else file_size - 1
+    suffix_length = int(last)
+    if suffix_length == 0 or file_size == 0: raise ValueError("Empty suffix range.")
+    return max(0, file_size - suffix_length), file_size - 1
+
+
+def _file_validators(stat_result):
+    """Returns the (ETag, Last-Modified) pair for a file: the ETag changes with its inode, mtime or size."""
+    etag = f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    return etag, formatdate(stat_result.st_mtime, usegmt=True)
+
+
 # --- HTTP File Server Class ---
 class WorkspaceHTTPHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests; every response must therefore send a Content-Length.
+    protocol_version = "HTTP/1.1"
+    # Seconds a client may take to send a request (socket timeout while a request is being read).
+    timeout = float(os.getenv("FILE_SERVER_REQUEST_TIMEOUT", "30"))
+    # Seconds an idle keep-alive connection may hold a worker thread between requests. It gives the
+    # worker up earlier if other connections are waiting for one.
+    keepalive_timeout = float(os.getenv("FILE_SERVER_KEEPALIVE_TIMEOUT", "2"))
+    _KEEPALIVE_POLL_SECONDS = 0.25
+
+    def handle(self):
+        self.handle_one_request()
+        while not self.close_connection and self._wait_for_next_request(): self.handle_one_request()
+
+    def _wait_for_next_request(self) -> bool:
+        """True once the next request on this keep-alive connection has started to arrive."""
+        deadline = time.monotonic() + self.keepalive_timeout
+        try:
+            # Non-blocking peeks see both bytes already buffered by `rfile` and newly arrived ones.
+            self.connection.settimeout(0.0)
+            while not self.rfile.peek(1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.server.has_waiting_connections(): return False
+                if select.select([self.connection], [], [], min(remaining, self._KEEPALIVE_POLL_SECONDS))[0]:
+                    return bool(self.rfile.peek(1))  # Readable but empty: the client closed the connection.
+            return True
+        except OSError: return False
+        finally:
+            try: self.connection.settimeout(self.timeout)
+            except OSError: pass
+
+    def end_headers(self):
+        # While connections queue for a worker, finish keep-alive connections after their current response.
+        if not self.close_connection and self.server.has_waiting_connections(): self.send_header('Connection', 'close')
+        super().end_headers()
+
     def do_GET(self):
         parsed_path = urlparse(self.path)
         path = parsed_path.path.rstrip('/')
@@ -138,6 +210,7 @@ class WorkspaceHTTPHandler(BaseHTTPRequestHandler):
         elif path == '/api/workspace/items': self._handle_get_workspace_items(parsed_path)
         elif path == '/file-content': self._handle_get_file_content(parsed_path)
         elif path == '/api/workspace/raw': self._handle_get_raw_file(parsed_path)
+        elif path.startswith('/api/uploads/'): self._handle_get_upload_session(path.rsplit('/', 1)[-1])
         else: self._send_json_response(404, {'error': f"Not Found: The path '{path}' does not match any known API routes."})
     
     def do_POST(self):
@@ -146,34 +219,64 @@ class WorkspaceHTTPHandler(BaseHTTPRequestHandler):
         if path == '/api/tools': self._handle_create_tool()
         elif path == '/api/workspace/folders': self._handle_create_folder()
         elif path == '/api/workspace/files': self._handle_create_file()
-        elif path == '/upload': self._handle_file_upload()
-        else: self._send_json_response(404, {'error': f"Not Found: The POST path '{path}' does not match any known API routes."})
+        elif path == '/upload': self._handle_file_upload(parsed_path)
+        elif path == '/api/uploads': self._handle_create_upload_session()
+        else: self.close_connection = True; self._send_json_response(404, {'error': f"Not Found: The POST path '{path}' does not match any known API routes."})
 
     def do_DELETE(self):
         parsed_path = urlparse(self.path)
         path = parsed_path.path.rstrip('/')
         if path == '/api/workspace/items': self._handle_delete_workspace_item(parsed_path)
+        elif path.startswith('/api/uploads/'): self._handle_cancel_upload_session(path.rsplit('/', 1)[-1])
         else: self._send_json_response(404, {'error': f"Not Found: The path '{path}' does not match any known DELETE routes."})
     
     def do_PUT(self):
         parsed_path = urlparse(self.path)
         path = parsed_path.path.rstrip('/')
         if path == '/api/workspace/items': self._handle_rename_workspace_item()
-        else: self._send_json_response(404, {'error': f"Not Found: The path '{path}' does not match any known PUT routes."})
+        elif path.startswith('/api/uploads/'): self._handle_upload_chunk(path.rsplit('/', 1)[-1], parsed_path)
+        else: self.close_connection = True; self._send_json_response(404, {'error': f"Not Found: The path '{path}' does not match any known PUT routes."})
     
     def do_OPTIONS(self):
         self.send_response(204)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS, PUT, DELETE')
-        self.send_header('Access-Control-Allow-Headers', 'X-Requested-With, Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'X-Requested-With, Content-Type, Range, If-Range, If-None-Match, If-Modified-Since')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _is_not_modified(self, etag, stat_result):
+        """Evaluates If-None-Match (which takes precedence) or If-Modified-Since against the file's validators."""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            candidates = [candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')]
+            return '*' in candidates or etag in candidates
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try: return int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError): return False
+        return False
+
+    def _send_validator_headers(self, etag, last_modified):
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        # Clients may keep a copy but must revalidate it, which is a cheap 304 while the file is unchanged.
+        self.send_header('Cache-Control', 'no-cache')
+
+    def _send_not_modified(self, etag, last_modified):
+        self.send_response(304)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self._send_validator_headers(etag, last_modified)
         self.end_headers()
 
     def _send_json_response(self, status_code, data):
+        body = json.dumps(data).encode('utf-8')
         self.send_response(status_code)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
+        self.wfile.write(body)
 
     def _handle_create_tool(self):
         try:
@@ -227,6 +330,7 @@ class WorkspaceHTTPHandler(BaseHTTPRequestHandler):
                 f.write(tool_code)
             
             logger.info(f"Successfully generated intelligent custom tool file: {file_path}")
+            TOOL_REGISTRY.invalidate()
             
             self._send_json_response(201, {'message': f"Tool '{tool_name}' was created successfully as '{os.path.basename(file_path)}'."})
 
@@ -282,20 +386,25 @@ class WorkspaceHTTPHandler(BaseHTTPRequestHandler):
             self._send_json_response(500, {"error": "Could not retrieve tools."})
 
     def _handle_get_workspace_items(self, parsed_path):
-        query_components = parse_qs(parsed_path.query)
+        # Blank values are kept so that `ignore=` can switch the ignore patterns off.
+        query_components = parse_qs(parsed_path.query, keep_blank_values=True)
         subdir = query_components.get("path", [None])[0]
         if not subdir: return self._send_json_response(400, {"error": "Missing 'path' query parameter."})
-        base_workspace, items = "/app/workspace", []
+        option = lambda name, default=None: query_components.get(name, [default])[0]
         try:
-            full_path = _resolve_path(base_workspace, subdir)
+            # --- MODIFIED: Single scandir pass, server-side sorting and pagination, optional recursive mode ---
+            options = {
+                "offset": int(option("offset", "0")), "limit": int(option("limit")) if option("limit") is not None else None,
+                "sort": option("sort", "type"), "descending": option("order", "asc") == "desc",
+                "recursive": option("recursive", "false").lower() in ("1", "true", "yes"), "depth": int(option("depth", "1")),
+                "ignore_patterns": tuple(p.strip() for p in option("ignore", "").split(",") if p.strip()) if "ignore" in query_components else WORKSPACE_LISTING_IGNORE,
+            }
+        except ValueError: return self._send_json_response(400, {"error": "'offset', 'limit' and 'depth' must be integers."})
+        try:
+            full_path = _resolve_path("/app/workspace", subdir)
             if not os.path.isdir(full_path): return self._send_json_response(404, {"error": f"Directory not found: '{subdir}'"})
-            for item_name in os.listdir(full_path):
-                item_path = os.path.join(full_path, item_name)
-                item_type = 'directory' if os.path.isdir(item_path) else 'file'
-                try: item_size = os.path.getsize(item_path) if item_type == 'file' else 0
-                except OSError: item_size = 0
-                items.append({"name": item_name, "type": item_type, "size": item_size})
-            self._send_json_response(200, {"items": items})
+            self._send_json_response(200, list_directory(full_path, **options))
+        except ValueError as e: self._send_json_response(400, {"error": str(e)})
         except Exception as e:
             logger.error(f"Error listing workspace items for path '{subdir}': {e}", exc_info=True)
             self._send_json_response(500, {"error": str(e)})
@@ -310,6 +419,7 @@ class WorkspaceHTTPHandler(BaseHTTPRequestHandler):
             if not os.path.exists(full_path): return self._send_json_response(404, {"error": f"Item not found: '{item_path_str}'"})
             if os.path.isdir(full_path): shutil.rmtree(full_path)
             else: os.remove(full_path)
+            PREVIEW_CACHE.invalidate(full_path); LISTING_CACHE.invalidate(full_path)
             logger.info(f"Successfully deleted item: {full_path}")
             self._send_json_response(200, {"message": f"Successfully deleted item: '{item_path_str}'"})
         except Exception as e:
@@ -325,7 +435,7 @@ class WorkspaceHTTPHandler(BaseHTTPRequestHandler):
             if not new_path_str: return self._send_json_response(400, {'error': "Request body must contain a 'path' key."})
             full_path = _resolve_path("/app/workspace", new_path_str)
             if os.path.exists(full_path): return self._send_json_response(409, {'error': f"Conflict: An item already exists at '{new_path_str}'."})
-            os.makedirs(full_path)
+            os.makedirs(full_path); LISTING_CACHE.invalidate(full_path)
             logger.info(f"Successfully created directory: {full_path}")
             self._send_json_response(201, {'message': f"Folder '{new_path_str}' created successfully."})
         except Exception as e:
@@ -345,6 +455,7 @@ class WorkspaceHTTPHandler(BaseHTTPRequestHandler):
 
             with open(full_path, 'w') as f:
                 pass
+            LISTING_CACHE.invalidate(full_path)
             
             logger.info(f"Successfully created empty file: {full_path}")
             self._send_json_response(201, {'message': f"File '{new_path_str}' created successfully."})
@@ -365,6 +476,7 @@ class WorkspaceHTTPHandler(BaseHTTPRequestHandler):
             if not os.path.exists(old_full_path): return self._send_json_response(404, {'error': f"Source item not found: '{old_path_str}'."})
             if os.path.exists(new_full_path): return self._send_json_response(409, {'error': f"Destination already exists: '{new_path_str}'."})
             os.rename(old_full_path, new_full_path)
+            PREVIEW_CACHE.invalidate(old_full_path); LISTING_CACHE.invalidate(old_full_path); LISTING_CACHE.invalidate(new_full_path)
             logger.info(f"Successfully renamed '{old_full_path}' to '{new_full_path}'")
             self._send_json_response(200, {'message': f"Item renamed successfully to '{new_path_str}'."})
         except Exception as e:
@@ -375,78 +487,220 @@ class WorkspaceHTTPHandler(BaseHTTPRequestHandler):
         query_components = parse_qs(parsed_path.query)
         workspace_id, filename = query_components.get("path", [None])[0], query_components.get("filename", [None])[0]
         if not workspace_id or not filename: return self._send_json_response(400, {"error": "Missing 'path' or 'filename' parameter."})
+        unit = query_components.get("unit", ["lines"])[0]
+        try:
+            offset = int(query_components.get("offset", ["0"])[0])
+            limit = int(query_components["limit"][0]) if "limit" in query_components else None
+        except ValueError: return self._send_json_response(400, {"error": "'offset' and 'limit' must be integers."})
+        if unit not in ("lines", "bytes") or offset < 0 or (limit is not None and limit < 0):
+            return self._send_json_response(400, {"error": "'unit' must be 'lines' or 'bytes', and 'offset'/'limit' must not be negative."})
         try:
             full_path = _resolve_path(f"/app/workspace/{workspace_id}", filename)
-            with open(full_path, 'r', encoding='utf-8') as f: content = f.read()
+            stat_result = os.stat(full_path); etag, last_modified = _file_validators(stat_result)
+            if self._is_not_modified(etag, stat_result): return self._send_not_modified(etag, last_modified)
+            window_headers = {'X-Total-Bytes': stat_result.st_size}
+            if limit is None and not offset and stat_result.st_size <= PREVIEW_FULL_FILE_MAX_BYTES:
+                if (body := PREVIEW_CACHE.get(full_path, etag)) is None:
+                    with open(full_path, 'r', encoding='utf-8') as f: body = f.read().encode('utf-8')
+                    PREVIEW_CACHE.put(full_path, etag, body)
+                total_lines = body.count(b'\n') + (1 if body and not body.endswith(b'\n') else 0)
+                window_headers.update({'X-Total-Lines': total_lines, 'X-Line-Offset': 0, 'X-Line-Count': total_lines, 'X-Preview-Truncated': 'false'})
+            elif unit == 'lines':
+                # --- MODIFIED: Large files are served one window at a time through the sparse line index ---
+                data, first_line, line_count, truncated = read_lines(full_path, offset, PREVIEW_PAGE_LINES if limit is None else limit, stat_result)
+                body = data.decode('utf-8', errors='replace').encode('utf-8')
+                window_headers.update({'X-Total-Lines': get_line_index(full_path, stat_result).total_lines, 'X-Line-Offset': first_line, 'X-Line-Count': line_count, 'X-Preview-Truncated': str(truncated).lower()})
+            else:
+                data = read_bytes(full_path, offset, PREVIEW_MAX_WINDOW_BYTES if limit is None else limit)
+                body = data.decode('utf-8', errors='replace').encode('utf-8')
+                window_headers.update({'X-Byte-Offset': offset, 'X-Byte-Count': len(data), 'X-Preview-Truncated': str(offset + len(data) < stat_result.st_size).lower()})
             self.send_response(200)
             self.send_header('Content-type', 'text/plain; charset=utf-8')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Access-Control-Expose-Headers', ', '.join(['ETag', 'Last-Modified', *window_headers]))
+            self._send_validator_headers(etag, last_modified)
+            for header, value in window_headers.items(): self.send_header(header, str(value))
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(content.encode('utf-8'))
+            self.wfile.write(body)
         except Exception as e: self._send_json_response(500, {"error": f"Error reading file: {e}"})
 
     def _handle_get_raw_file(self, parsed_path):
         query_components = parse_qs(parsed_path.query)
         file_path_str = query_components.get("path", [None])[0]
         if not file_path_str: return self.send_error(400, "Missing 'path' query parameter.")
+        headers_sent = False
         try:
             full_path = _resolve_path("/app/workspace", file_path_str)
             if not os.path.isfile(full_path): return self.send_error(404, "File not found.")
             
             filename = os.path.basename(full_path)
             content_type, _ = mimetypes.guess_type(full_path)
+            stat_result = os.stat(full_path); file_size = stat_result.st_size; etag, last_modified = _file_validators(stat_result)
+            if self._is_not_modified(etag, stat_result): return self._send_not_modified(etag, last_modified)
+            # A range is only valid for the version of the file named by If-Range; otherwise the whole file is sent.
+            if_range = self.headers.get('If-Range')
+            range_header = self.headers.get('Range') if not if_range or if_range in (etag, last_modified) else None
+            try: byte_range = _parse_byte_range(range_header, file_size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{file_size}')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('Content-Length', '0')
+                return self.end_headers()
+            start, end = byte_range or (0, file_size - 1)
             
-            self.send_response(200)
+            self.send_response(206 if byte_range else 200)
             self.send_header('Content-type', content_type or 'application/octet-stream')
             self.send_header('Access-Control-Allow-Origin', '*')
-            # --- THIS IS THE FIX ---
+            self.send_header('Access-Control-Expose-Headers', 'Content-Length, Content-Range, Accept-Ranges, Content-Disposition, ETag, Last-Modified')
+            self._send_validator_headers(etag, last_modified)
             # This header tells the browser to download the file instead of displaying it.
             self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
-            self.end_headers()
+            self.send_header('Accept-Ranges', 'bytes')
+            if byte_range: self.send_header('Content-Range', f'bytes {start}-{end}/{file_size}')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers(); headers_sent = True
             
-            with open(full_path, 'rb') as f: self.wfile.write(f.read())
+            # --- MODIFIED: Stream with sendfile(2) (chunked copy where unavailable) so memory per download stays bounded ---
+            with open(full_path, 'rb') as f:
+                if end >= start: self.connection.sendfile(f, offset=start, count=end - start + 1)
+        except (BrokenPipeError, ConnectionResetError) as e:
+            logger.info(f"Download of '{file_path_str}' aborted by the client: {e}"); self.close_connection = True
         except Exception as e:
             logger.error(f"Error serving raw file '{file_path_str}': {e}", exc_info=True)
-            self.send_error(500, "Internal Server Error")
+            if headers_sent: self.close_connection = True
+            else: self.send_error(500, "Internal Server Error")
     
-    def _handle_file_upload(self):
+    def _handle_file_upload(self, parsed_path):
+        # --- MODIFIED: Limits are checked before the body is read, and file parts are streamed straight into place ---
+        workspace_id, staging = parse_qs(parsed_path.query).get("workspace_id", [None])[0], None
         try:
+            if self.headers.get('Content-Length') is None:
+                self.close_connection = True; return self._send_json_response(411, {'error': 'Uploads require a Content-Length header.'})
+            upload_dir = _resolve_path("/app/workspace", workspace_id) if workspace_id else "/app/workspace"
+            if not os.path.isdir(upload_dir):
+                self.close_connection = True; return self._send_json_response(404, {'error': f"Directory not found: '{workspace_id}'"})
+            check_upload_size(_workspace_root(workspace_id) if workspace_id else None, int(self.headers['Content-Length']))
+
             environ = {
                 'wsgi.input': self.rfile,
                 'CONTENT_LENGTH': self.headers.get('Content-Length'),
                 'CONTENT_TYPE': self.headers.get('Content-Type'),
                 'REQUEST_METHOD': 'POST'
             }
-            
-            stream, form, files = parse_form_data(environ)
+            staging = StagedFileFactory(upload_dir)
+            stream, form, files = parse_form_data(environ, stream_factory=staging)
 
-            workspace_id = form.get('workspace_id')
+            workspace_id = workspace_id or form.get('workspace_id')
             if not workspace_id:
                 return self._send_json_response(400, {'error': 'Missing workspace_id field.'})
 
-            uploaded_files = files.getlist('file')
+            uploaded_files = [file_storage for file_storage in files.getlist('file') if file_storage.filename]
             if not uploaded_files:
                 return self._send_json_response(400, {'error': 'No file(s) uploaded.'})
 
-            for file_storage in uploaded_files:
-                filename = file_storage.filename
-                if not filename:
-                    continue
-
-                full_path = _resolve_path(f"/app/workspace/{workspace_id}", os.path.basename(filename))
-                file_storage.save(full_path)
-                logger.info(f"Uploaded '{filename}' to workspace '{workspace_id}'")
+            target_paths = [_resolve_path(f"/app/workspace/{workspace_id}", os.path.basename(file_storage.filename)) for file_storage in uploaded_files]
+            staged_sizes = [staging.staged_size(file_storage) for file_storage in uploaded_files]
+            with workspace_quota(_workspace_root(workspace_id)) as usage:
+                # Checked again with the actual sizes: other uploads may have finished while this one streamed, and
+                # older clients send the workspace only as a form field, so nothing was checked before parsing.
+                usage.check(sum(staged_sizes), replaced_paths=target_paths)
+                for file_storage, full_path, size in zip(uploaded_files, target_paths, staged_sizes):
+                    usage.record_write(full_path, size); staging.commit(file_storage, full_path)
+                    PREVIEW_CACHE.invalidate(full_path); LISTING_CACHE.invalidate(full_path)
+                    logger.info(f"Uploaded '{file_storage.filename}' to workspace '{workspace_id}'")
 
             self._send_json_response(200, {'message': f"File(s) uploaded successfully."})
 
+        except UploadError as e:
+            self.close_connection = True
+            self._send_json_response(e.status, e.to_response())
         except Exception as e:
             logger.error(f"File upload failed: {e}", exc_info=True)
+            # The request body may be partly unread; the connection cannot be reused.
+            self.close_connection = True
             self._send_json_response(500, {'error': f'Server error during file upload: {e}'})
+        finally:
+            if staging: staging.cleanup()
+
+    def _handle_create_upload_session(self):
+        try:
+            content_length = int(self.headers['Content-Length'])
+            if content_length == 0: return self._send_json_response(400, {'error': 'Request body is empty.'})
+            body = json.loads(self.rfile.read(content_length))
+            path_str, size = body.get('path'), body.get('size')
+            if not path_str or not isinstance(size, int): return self._send_json_response(400, {'error': "Request body must contain 'path' and an integer 'size'."})
+            session = create_session(_resolve_path("/app/workspace", path_str), _workspace_root(path_str), size)
+            self._send_json_response(201, session.status())
+        except UploadError as e: self._send_json_response(e.status, e.to_response())
+        except Exception as e:
+            logger.error(f"Error creating upload session: {e}", exc_info=True)
+            self._send_json_response(500, {'error': str(e)})
+
+    def _handle_get_upload_session(self, upload_id):
+        try: self._send_json_response(200, get_session(upload_id).status())
+        except UploadError as e: self._send_json_response(e.status, e.to_response())
+
+    def _handle_upload_chunk(self, upload_id, parsed_path):
+        try:
+            if self.headers.get('Content-Length') is None: raise UploadError(411, 'Upload chunks require a Content-Length header.')
+            try: offset = int(parse_qs(parsed_path.query).get("offset", [None])[0])
+            except (TypeError, ValueError): raise UploadError(400, "Missing or invalid 'offset' query parameter.")
+            target_path = get_session(upload_id).target_path
+            result = write_chunk(upload_id, self.rfile, offset, int(self.headers['Content-Length']))
+            if result["complete"]: PREVIEW_CACHE.invalidate(target_path); LISTING_CACHE.invalidate(target_path)
+            self._send_json_response(200, result)
+        except UploadError as e:
+            # The chunk may be partly unread; the connection cannot be reused.
+            self.close_connection = True
+            self._send_json_response(e.status, e.to_response())
+        except Exception as e:
+            logger.error(f"Error writing chunk of upload session {upload_id}: {e}", exc_info=True)
+            self.close_connection = True
+            self._send_json_response(500, {'error': str(e)})
+
+    def _handle_cancel_upload_session(self, upload_id):
+        try:
+            cancel_session(upload_id)
+            self._send_json_response(200, {'message': f"Upload session '{upload_id}' cancelled."})
+        except UploadError as e: self._send_json_response(e.status, e.to_response())
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTPServer that serves each accepted connection on a fixed pool of worker threads."""
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_workers: int):
+        super().__init__(server_address, handler_class)
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="file-server")
+        self._open_connections = 0
+        self._connections_lock = threading.Lock()
+
+    def has_waiting_connections(self) -> bool:
+        """True if accepted connections are queued because every worker is busy."""
+        return self._open_connections > self.max_workers
+
+    def process_request(self, request, client_address):
+        with self._connections_lock: self._open_connections += 1
+        self._executor.submit(self._process_request_in_worker, request, client_address)
+
+    def _process_request_in_worker(self, request, client_address):
+        try: self.finish_request(request, client_address)
+        except Exception: self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._connections_lock: self._open_connections -= 1
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 
 def run_http_server():
-    httpd = HTTPServer((os.getenv("BACKEND_HOST", "0.0.0.0"), int(os.getenv("FILE_SERVER_PORT", 8766))), WorkspaceHTTPHandler)
-    logger.info(f"Starting HTTP file server on port {httpd.server_port}")
+    httpd = ThreadPoolHTTPServer((os.getenv("BACKEND_HOST", "0.0.0.0"), int(os.getenv("FILE_SERVER_PORT", 8766))), WorkspaceHTTPHandler, max(1, int(os.getenv("FILE_SERVER_WORKERS", "16"))))
+    logger.info(f"Starting HTTP file server on port {httpd.server_port} with {httpd.max_workers} worker threads")
     httpd.serve_forever()
 
 
@@ -461,6 +715,7 @@ NODE_NAME_MAPPING = {
     "Site_Foreman": "Site Foreman",
     "Project_Supervisor": "Project Supervisor",
     "Correction_Planner": "Correction Planner",
+    "Step_Scheduler": "Step Scheduler",
     "Handyman": "Handyman",
     "Worker": "Worker",
     "Editor": "Editor"
@@ -499,6 +754,26 @@ async def agent_execution_wrapper(input_state, config):
                     "task_id": task_id
                 })
             
+            # --- Token streaming of the Editor's answer, tagged with a per-answer sequence number ---
+            if event_type == "on_custom_event" and node_name == "final_answer_chunk":
+                chunk = event.get("data", {})
+                await broadcast_event({
+                    "type": "final_answer_chunk",
+                    "data": chunk.get("content", ""),
+                    "seq": chunk.get("seq", 0),
+                    "task_id": task_id
+                })
+                continue
+
+            # --- The Chief Architect's plan while it is being written ---
+            if event_type == "on_custom_event" and node_name == "plan_partial":
+                await broadcast_event({
+                    "type": "plan_partial",
+                    "plan": event.get("data", {}).get("plan", []),
+                    "task_id": task_id
+                })
+                continue
+
             if event_type == "on_chain_end" and node_name == "Correction_Planner":
                 new_plan = event.get("data", {}).get("output", {}).get("plan")
                 if new_plan:
@@ -512,6 +787,8 @@ async def agent_execution_wrapper(input_state, config):
         current_state = agent_graph.get_state(config)
         if current_state.next and "human_in_the_loop_node" in current_state.next:
             logger.info(f"Task '{task_id}': Paused for human approval.")
+            # Keep the paused checkpoint through compaction so the plan can still be approved later.
+            if isinstance(agent_graph.checkpointer, SqliteCheckpointSaver): agent_graph.checkpointer.pin_checkpoint(current_state.config)
             await broadcast_event({"type": "plan_approval_request", "plan": current_state.values.get("plan"), "task_id": task_id})
         else:
             final_state = agent_graph.get_state(config)
@@ -611,6 +888,8 @@ async def handle_task_delete(data):
     if not (task_id := data.get("task_id")): return
     logger.info(f"Task '{task_id}': Received delete task request.")
     if task_id in RUNNING_AGENTS: RUNNING_AGENTS[task_id].cancel()
+    BACKGROUND_JOBS.cancel_task_jobs(task_id)
+    if isinstance(agent_graph.checkpointer, SqliteCheckpointSaver): await agent_graph.checkpointer.adelete_thread(task_id)
     _safe_delete_workspace(task_id)
 
 async def message_router(websocket):
@@ -639,6 +918,8 @@ async def message_router(websocket):
 async def main():
     http_thread = threading.Thread(target=run_http_server, daemon=True)
     http_thread.start()
+    if isinstance(agent_graph.checkpointer, SqliteCheckpointSaver):
+        asyncio.create_task(run_compaction_loop(agent_graph.checkpointer, float(os.getenv("CHECKPOINT_COMPACTION_INTERVAL", "600"))))
     async with websockets.serve(message_router, os.getenv("BACKEND_HOST", "0.0.0.0"), int(os.getenv("BACKEND_PORT", 8765))):
         logger.info("Mentor::i server is running.")
         await asyncio.Future()
@@ -0,0 +1,187 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Append-Only State Reducers
+#
+# `GraphState` used `lambda x, y: x + y` for `messages`/`history` and
+# `{**x, **y}` for `step_outputs`. Every node update copied everything
+# accumulated so far, which is quadratic over a long plan with corrections.
+#
+# Components:
+# 1. `AppendOnlyLog`: An immutable, chunked sequence. Appending copies at most
+#    one partially filled chunk of CHUNK_SIZE items; all full chunks are
+#    shared with the previous version (and, in the SQLite checkpointer,
+#    stored once and shared between checkpoints).
+# 2. `OverlayMapping`: An immutable mapping made of stacked update layers.
+#    Layers are folded together like a binary counter, so a merge copies
+#    O(log n) items amortized and a lookup walks O(log n) layers.
+# 3. `append_reducer` / `merge_reducer`: The reducers used in `GraphState`.
+#    They accept plain lists/dicts (initial values, old checkpoints) on
+#    either side.
+#
+# Run `python -m backend.state_reducers` for a micro-benchmark comparing the
+# per-update cost against the old list/dict reducers.
+# -----------------------------------------------------------------------------
+
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, List, Optional
+
+CHUNK_SIZE = 64
+
+
+@dataclass(frozen=True, eq=False)
+class AppendOnlyLog(Sequence):
+    """
+    Immutable sequence stored as a chain of chunks. Every node in `prefix`
+    holds a full chunk; only `chunk` (the newest) may be partially filled.
+    """
+    prefix: Optional["AppendOnlyLog"] = None
+    chunk: tuple = ()
+    length: int = 0
+
+    def __post_init__(self):
+        # Deserialized instances may receive lists.
+        if not isinstance(self.chunk, tuple): object.__setattr__(self, "chunk", tuple(self.chunk))
+        if not self.length: object.__setattr__(self, "length", (self.prefix.length if self.prefix else 0) + len(self.chunk))
+
+    @classmethod
+    def from_iterable(cls, items: Iterable[Any]) -> "AppendOnlyLog":
+        return cls().extend(items)
+
+    @classmethod
+    def from_chunks(cls, full_chunks: List[Iterable[Any]], tail: Iterable[Any] = ()) -> "AppendOnlyLog":
+        """Rebuilds a log from its full chunks (oldest first) and the partial tail chunk."""
+        log = None
+        for chunk in full_chunks:
+            chunk = tuple(chunk); log = cls(log, chunk, (log.length if log else 0) + len(chunk))
+        tail = tuple(tail)
+        if tail or log is None: log = cls(log, tail, (log.length if log else 0) + len(tail))
+        return log
+
+    def extend(self, items: Iterable[Any]) -> "AppendOnlyLog":
+        """Returns a new log with `items` appended. Costs O(CHUNK_SIZE + len(items))."""
+        items = tuple(items); log = self
+        while items:
+            if len(log.chunk) < CHUNK_SIZE:
+                taken, items = items[:CHUNK_SIZE - len(log.chunk)], items[CHUNK_SIZE - len(log.chunk):]
+                log = AppendOnlyLog(log.prefix, log.chunk + taken, log.length + len(taken))
+            else:
+                taken, items = items[:CHUNK_SIZE], items[CHUNK_SIZE:]
+                log = AppendOnlyLog(log, taken, log.length + len(taken))
+        return log
+
+    def nodes(self) -> List["AppendOnlyLog"]:
+        """Returns the chunk nodes, oldest first."""
+        nodes, node = [], self
+        while node is not None and (node.chunk or node.prefix is not None):
+            nodes.append(node); node = node.prefix
+        nodes.reverse(); return nodes
+
+    def full_nodes(self) -> List["AppendOnlyLog"]:
+        return [node for node in self.nodes() if len(node.chunk) == CHUNK_SIZE]
+
+    def tail(self) -> tuple:
+        """The items of the newest chunk if it is not full yet, else ()."""
+        return self.chunk if len(self.chunk) < CHUNK_SIZE else ()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[Any]:
+        for node in self.nodes(): yield from node.chunk
+
+    def __getitem__(self, index):
+        if isinstance(index, slice): return list(self)[index]
+        if index < 0: index += self.length
+        if not 0 <= index < self.length: raise IndexError("AppendOnlyLog index out of range")
+        node = self
+        while index < node.length - len(node.chunk): node = node.prefix
+        return node.chunk[index - (node.length - len(node.chunk))]
+
+    def __add__(self, other: Iterable[Any]) -> "AppendOnlyLog":
+        return self.extend(other)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (AppendOnlyLog, list, tuple)): return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"AppendOnlyLog({self.length} items)"
+
+
+@dataclass(frozen=True, eq=False)
+class OverlayMapping(Mapping):
+    """
+    Immutable mapping stored as a stack of update layers, oldest first. A
+    merge pushes a layer and folds it into the layer below while that one is
+    not at least twice its size, so there are O(log n) layers and a merge
+    copies O(log n) items amortized.
+    """
+    layers: tuple = ()
+
+    def __post_init__(self):
+        if not isinstance(self.layers, tuple): object.__setattr__(self, "layers", tuple(self.layers))
+
+    def merge(self, updates: Mapping) -> "OverlayMapping":
+        if not updates: return self
+        layers = list(self.layers) + [dict(updates)]
+        while len(layers) > 1 and len(layers[-1]) * 2 >= len(layers[-2]):
+            newer = layers.pop(); layers[-1] = {**layers[-1], **newer}
+        return OverlayMapping(tuple(layers))
+
+    def to_dict(self) -> dict:
+        merged = {}
+        for layer in self.layers: merged.update(layer)
+        return merged
+
+    def __getitem__(self, key):
+        for layer in reversed(self.layers):
+            if key in layer: return layer[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.to_dict())
+
+    def __len__(self) -> int:
+        return len(self.to_dict())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Mapping): return NotImplemented
+        return self.to_dict() == dict(other)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"OverlayMapping({self.to_dict()!r})"
+
+
+def append_reducer(left: Optional[Iterable[Any]], right: Optional[Iterable[Any]]) -> AppendOnlyLog:
+    """Reducer for append-only channels (`messages`, `history`)."""
+    log = left if isinstance(left, AppendOnlyLog) else AppendOnlyLog.from_iterable(left or ())
+    return log.extend(right) if right else log
+
+
+def merge_reducer(left: Optional[Mapping], right: Optional[Mapping]) -> OverlayMapping:
+    """Reducer for key-merged channels (`step_outputs`)."""
+    mapping = left if isinstance(left, OverlayMapping) else OverlayMapping((dict(left),) if left else ())
+    return mapping.merge(right) if right else mapping
+
+
+if __name__ == "__main__":
+    # Micro-benchmark: cost of one update at increasing run lengths.
+    import timeit
+
+    def _per_update_us(reducer, initial, update, run_length: int, samples: int = 200) -> float:
+        state = initial
+        for i in range(run_length): state = reducer(state, update(i))
+        timer = timeit.Timer(lambda: reducer(state, update(run_length)))
+        return min(timer.repeat(repeat=5, number=samples)) / samples * 1e6
+
+    print(f"{'run length':>10} | {'list x + y':>12} | {'AppendOnlyLog':>13} | {'dict {**x, **y}':>15} | {'OverlayMapping':>14}   (microseconds per update)")
+    for run_length in (100, 1000, 10000, 50000):
+        print(f"{run_length:>10} | "
+              f"{_per_update_us(lambda x, y: x + y, [], lambda i: [f'record {i}'], run_length):>12.2f} | "
+              f"{_per_update_us(append_reducer, [], lambda i: [f'record {i}'], run_length):>13.2f} | "
+              f"{_per_update_us(lambda x, y: {**x, **y}, {}, lambda i: {i: f'output {i}'}, run_length):>15.2f} | "
+              f"{_per_update_us(merge_reducer, {}, lambda i: {i: f'output {i}'}, run_length):>14.2f}")
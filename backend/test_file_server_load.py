@@ -0,0 +1,142 @@
+# -----------------------------------------------------------------------------
+# Load Test Script for the HTTP File Server (Phase 19 - Streaming Downloads)
+#
+# Goal:
+# Show that large workspace downloads no longer block the small API requests
+# (workspace listings, tool list, model query) that the UI makes all the time.
+#
+# How it Works:
+# 1. DOWNLOADERS: `--downloads` threads repeatedly fetch a large workspace
+#    file from `/api/workspace/raw` for the whole run.
+# 2. PROBES: `--clients` threads send `--requests` small API requests each
+#    over one keep-alive connection and record every request's latency.
+# 3. REPORT: p50/p90/p99/max latency of the probes and the download
+#    throughput. With the old single-threaded server, p99 is roughly the time
+#    of a whole download; with the thread pool it stays in milliseconds.
+# 4. MEMORY: With `--server-pid`, the server's resident memory is sampled
+#    from /proc during the run. Streamed downloads keep the growth far below
+#    the file size times the number of parallel downloads.
+# 5. RANGES: Before the run, a `Range` request is checked for a correct
+#    `206 Partial Content` response.
+#
+# How to Test:
+# 1. Start the backend (`python -m backend.server`, or docker-compose).
+# 2. Put a large file in a workspace, e.g.
+#    `head -c 200M /dev/urandom > /app/workspace/<task_id>/big.bin`
+# 3. Run: `python3 backend/test_file_server_load.py --file <task_id>/big.bin`
+#    - Add `--probe-path "/api/workspace/items?path=<task_id>"` to probe the
+#      workspace listing instead of the tool list.
+#    - Add `--server-pid $(pgrep -f backend.server)` on the server host to
+#      report its peak memory growth.
+# 4. Compare against `FILE_SERVER_WORKERS=1` to see the blocking behavior.
+# -----------------------------------------------------------------------------
+import argparse
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import quote
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values: return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def read_rss_bytes(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"): return int(line.split()[1]) * 1024
+    return 0
+
+
+def memory_sampler(pid, stop_event, samples):
+    while not stop_event.is_set():
+        try: samples.append(read_rss_bytes(pid))
+        except OSError: return
+        time.sleep(0.05)
+
+
+def check_range_request(host, port, file_path):
+    """Fetches bytes 100-199 and the last 10 bytes, and checks the 206 responses."""
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    for range_header, expected_length in (("bytes=100-199", 100), ("bytes=-10", 10)):
+        connection.request("GET", f"/api/workspace/raw?path={quote(file_path)}", headers={"Range": range_header})
+        response = connection.getresponse(); body = response.read()
+        ok = response.status == 206 and len(body) == expected_length and response.getheader("Content-Range", "").startswith("bytes ")
+        print(f"Range {range_header}: {response.status} {response.getheader('Content-Range')} ({len(body)} bytes) {'OK' if ok else 'UNEXPECTED'}")
+    connection.close()
+
+
+def download_loop(host, port, file_path, stop_event, stats, lock):
+    """Downloads `file_path` over and over on one keep-alive connection until stopped."""
+    connection = http.client.HTTPConnection(host, port, timeout=300)
+    while not stop_event.is_set():
+        try:
+            connection.request("GET", f"/api/workspace/raw?path={quote(file_path)}")
+            response = connection.getresponse(); received = 0
+            while (chunk := response.read(1 << 20)): received += len(chunk)
+            with lock:
+                stats["downloads"] += 1; stats["bytes"] += received
+                if received != int(response.getheader("Content-Length", received)): stats["errors"] += 1
+        except (OSError, http.client.HTTPException) as e:
+            with lock: stats["errors"] += 1
+            print(f"Download failed: {e}"); connection.close(); connection = http.client.HTTPConnection(host, port, timeout=300)
+    connection.close()
+
+
+def probe_loop(host, port, probe_path, request_count, latencies, lock):
+    """Sends `request_count` small requests on one keep-alive connection and records their latency."""
+    connection = http.client.HTTPConnection(host, port, timeout=300)
+    for _ in range(request_count):
+        started = time.perf_counter()
+        try:
+            connection.request("GET", probe_path); response = connection.getresponse(); response.read()
+        except (OSError, http.client.HTTPException) as e:
+            print(f"Probe failed: {e}"); connection.close(); connection = http.client.HTTPConnection(host, port, timeout=300); continue
+        with lock: latencies.append(time.perf_counter() - started)
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the Mentor::i HTTP file server.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--file", required=True, help="Workspace-relative path of a large file, e.g. '<task_id>/big.bin'.")
+    parser.add_argument("--downloads", type=int, default=8, help="Number of parallel downloaders.")
+    parser.add_argument("--clients", type=int, default=4, help="Number of parallel probe clients.")
+    parser.add_argument("--requests", type=int, default=200, help="Probe requests per client.")
+    parser.add_argument("--probe-path", default="/api/tools")
+    parser.add_argument("--server-pid", type=int, help="PID of the backend server, to sample its memory (same host only).")
+    args = parser.parse_args()
+    check_range_request(args.host, args.port, args.file)
+
+    stop_event, lock = threading.Event(), threading.Lock()
+    download_stats, latencies = {"downloads": 0, "bytes": 0, "errors": 0}, []
+    downloaders = [threading.Thread(target=download_loop, args=(args.host, args.port, args.file, stop_event, download_stats, lock), daemon=True) for _ in range(args.downloads)]
+    probes = [threading.Thread(target=probe_loop, args=(args.host, args.port, args.probe_path, args.requests, latencies, lock)) for _ in range(args.clients)]
+
+    memory_samples = []
+    if args.server_pid:
+        baseline_rss = read_rss_bytes(args.server_pid)
+        threading.Thread(target=memory_sampler, args=(args.server_pid, stop_event, memory_samples), daemon=True).start()
+    started = time.perf_counter()
+    for thread in downloaders: thread.start()
+    time.sleep(0.5)  # Let the downloads occupy the server first.
+    for thread in probes: thread.start()
+    for thread in probes: thread.join()
+    stop_event.set(); elapsed = time.perf_counter() - started
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    print(f"\n{len(latencies_ms)} probe requests to {args.probe_path} with {args.downloads} parallel downloads of {args.file}")
+    if latencies_ms:
+        print(f"  p50 {percentile(latencies_ms, 0.50):8.1f} ms | p90 {percentile(latencies_ms, 0.90):8.1f} ms | "
+              f"p99 {percentile(latencies_ms, 0.99):8.1f} ms | max {latencies_ms[-1]:8.1f} ms | mean {statistics.mean(latencies_ms):8.1f} ms")
+    print(f"  {download_stats['downloads']} downloads completed, {download_stats['bytes'] / elapsed / (1 << 20):.1f} MiB/s, {download_stats['errors']} error(s)")
+    if memory_samples:
+        print(f"  server RSS: {baseline_rss / (1 << 20):.1f} MiB before, {max(memory_samples) / (1 << 20):.1f} MiB peak "
+              f"(+{(max(memory_samples) - baseline_rss) / (1 << 20):.1f} MiB with {args.downloads} parallel downloads)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,151 @@
 # -----------------------------------------------------------------------------
-# Mentor::i Tools Package Initializer (Phase 14.2: Tool Forge Removed)
+# Mentor::i Tools Package Initializer (Phase 17 - Cached Tool Registry)
 #
-# This version fixes a NameError caused by a syntax error in the previous
-# version.
+# This version stops the agent from re-importing every tool module on every
+# call to `get_available_tools()`, which happened several times per graph node.
 #
 # Key Architectural Changes:
-# 1. Syntax Correction: Removed the invalid `[cite: 462]` text that was
-#    causing a `NameError` during module loading.
+# 1. `ToolRegistry`: Loaded tools are kept in memory. A module is only
+#    (re)imported when its file's mtime or size changes, and modules whose
+#    file disappeared are dropped. New files (e.g. `custom_*.py` generated by
+#    the Tool Forge) are picked up on the next scan.
+# 2. Throttled Scans: The directory is re-scanned at most once every
+#    `TOOL_REGISTRY_SCAN_INTERVAL` seconds, so the hot path is a dict access.
+#    `invalidate()` forces a re-scan (used by the Tool Forge endpoint).
+# 3. Observability: `version` is bumped whenever the set of tools changes and
+#    `stats()` exposes hit/miss/reload counters.
 # -----------------------------------------------------------------------------
 
 import os
 import importlib
 import logging
-import json
+import threading
+import time
 from langchain_core.tools import BaseTool
-import sys
-from typing import Type
+from typing import Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-# --- Module Cache for Live Reloading ---
-_MODULE_CACHE = {}
+TOOL_REGISTRY_SCAN_INTERVAL = float(os.getenv("TOOL_REGISTRY_SCAN_INTERVAL", "2.0"))
+
+
+def _extract_tools(module) -> List[BaseTool]:
+    """Returns the tool objects exported by a module via `tools` or `tool`."""
+    if hasattr(module, 'tools') and isinstance(getattr(module, 'tools'), list):
+        return [t for t in getattr(module, 'tools') if isinstance(t, BaseTool)]
+    if hasattr(module, 'tool') and isinstance(getattr(module, 'tool'), BaseTool):
+        return [getattr(module, 'tool')]
+    return []
+
+
+class ToolRegistry:
+    """
+    In-memory registry of the Python tools found in the 'tools' directory.
+    Each module is keyed by its file's (mtime, size) fingerprint and only
+    re-imported when that fingerprint changes.
+    """
+
+    def __init__(self, tools_dir: str, scan_interval: float = TOOL_REGISTRY_SCAN_INTERVAL):
+        self.tools_dir = tools_dir
+        self.scan_interval = scan_interval
+        self.version = 0
+        self._lock = threading.Lock()
+        self._modules = {}
+        self._fingerprints: Dict[str, Tuple[int, int]] = {}
+        self._tools_by_file: Dict[str, List[BaseTool]] = {}
+        self._tools: List[BaseTool] = []
+        self._tool_map: Dict[str, BaseTool] = {}
+        self._last_scan: Optional[float] = None
+        self._stats = {"hits": 0, "misses": 0, "reloads": 0, "load_errors": 0}
+
+    def _scan_directory(self) -> Dict[str, Tuple[int, int]]:
+        fingerprints = {}
+        with os.scandir(self.tools_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".py") and not entry.name.startswith("__") and entry.is_file():
+                    stat = entry.stat()
+                    fingerprints[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return fingerprints
+
+    def _load_module(self, filename: str) -> List[BaseTool]:
+        module_name = f"backend.tools.{filename[:-3]}"
+        try:
+            if module_name in self._modules:
+                module = importlib.reload(self._modules[module_name])
+                logger.debug(f"Reloaded module: {module_name}")
+            else:
+                module = importlib.import_module(module_name)
+                logger.debug(f"Imported new module: {module_name}")
+            self._modules[module_name] = module
+            self._stats["reloads"] += 1
+            tools = _extract_tools(module)
+            for tool_instance in tools:
+                logger.info(f"Discovered engine tool: '{tool_instance.name}' from {filename}")
+            return tools
+        except Exception as e:
+            self._stats["load_errors"] += 1
+            logger.error(f"Failed to load or reload tool(s) from {filename}: {e}", exc_info=True)
+            return []
+
+    def _refresh(self):
+        fingerprints = self._scan_directory()
+        self._last_scan = time.monotonic()
+        if fingerprints == self._fingerprints:
+            return False
+
+        for filename in set(self._fingerprints) - set(fingerprints):
+            logger.info(f"Tool module '{filename}' was removed. Unregistering its tools.")
+            self._tools_by_file.pop(filename, None)
+            self._modules.pop(f"backend.tools.{filename[:-3]}", None)
+
+        for filename, fingerprint in fingerprints.items():
+            if self._fingerprints.get(filename) != fingerprint:
+                self._tools_by_file[filename] = self._load_module(filename)
+
+        self._fingerprints = fingerprints
+        self._tools = [tool for filename in sorted(self._tools_by_file) for tool in self._tools_by_file[filename]]
+        self._tool_map = {tool.name: tool for tool in self._tools}
+        self.version += 1
+        logger.info(f"Tool registry updated (version {self.version}). Found {len(self._tools)} total tools.")
+        return True
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if self._last_scan is not None and time.monotonic() - self._last_scan < self.scan_interval:
+                self._stats["hits"] += 1
+                return
+            if self._refresh(): self._stats["misses"] += 1
+            else: self._stats["hits"] += 1
+
+    def invalidate(self):
+        """Forces the next lookup to re-scan the tools directory."""
+        with self._lock:
+            self._last_scan = None
+
+    def get_tools(self) -> List[BaseTool]:
+        self._ensure_fresh()
+        return list(self._tools)
+
+    def get_tool_map(self) -> Dict[str, BaseTool]:
+        self._ensure_fresh()
+        return self._tool_map
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "version": self.version, "tools": len(self._tools)}
+
+
+TOOL_REGISTRY = ToolRegistry(os.path.dirname(__file__))
 
 
 def get_available_tools():
     """
-    Scans the 'tools' directory, imports all modules, and returns a fresh
-    list of all discovered Python-based tool objects.
+    Returns the list of all discovered Python-based tool objects, re-importing
+    only the tool modules whose files changed since the last scan.
     """
-    all_tools = []
-    
-    # --- Load Python "Engine" Tools ---
-    tools_dir = os.path.dirname(__file__)
-    logger.info(f"Dynamically scanning for Python tools in: {tools_dir}")
-
-    for filename in os.listdir(tools_dir):
-        if filename.endswith(".py") and not filename.startswith("__"):
-            module_name = f"backend.tools.{filename[:-3]}"
-            try:
-                if module_name in _MODULE_CACHE:
-                    module = importlib.reload(_MODULE_CACHE[module_name])
-                    logger.debug(f"Reloaded module: {module_name}")
-                else:
-                    module = importlib.import_module(module_name)
-                    logger.debug(f"Imported new module: {module_name}")
-                
-                # MODIFIED: Corrected line that was causing the NameError
-                _MODULE_CACHE[module_name] = module
-                
-                if hasattr(module, 'tools') and isinstance(getattr(module, 'tools'), list):
-                    tool_list = getattr(module, 'tools')
-                    for tool_instance in tool_list:
-                        if isinstance(tool_instance, BaseTool):
-                            logger.info(f"Discovered engine tool: '{tool_instance.name}' from {filename}")
-                            all_tools.append(tool_instance)
-                
-                elif hasattr(module, 'tool') and isinstance(getattr(module, 'tool'), BaseTool):
-                    tool_instance = getattr(module, 'tool')
-                    logger.info(f"Discovered engine tool: '{tool_instance.name}' from {filename}")
-                    all_tools.append(tool_instance)
-
-            except Exception as e:
-                logger.error(f"Failed to load or reload tool(s) from {filename}: {e}", exc_info=True)
-
-    logger.info(f"Live scan complete. Found {len(all_tools)} total tools.")
-    return all_tools
+    return TOOL_REGISTRY.get_tools()
+
+
+def get_tool_map() -> Dict[str, BaseTool]:
+    """Returns a name -> tool mapping of all discovered tools."""
+    return TOOL_REGISTRY.get_tool_map()
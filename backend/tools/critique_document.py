@@ -5,6 +5,9 @@
 # to the tool's explicit Pydantic input schema. The agent's worker node
 # already provides this argument; this change makes the tool's "contract"
 # aware of it, allowing LangChain's validation to pass.
+#
+# The critique step uses the shared client from `backend/llm_factory.py`
+# instead of building a new LLM client on every call.
 # -----------------------------------------------------------------------------
 
 import os
@@ -18,11 +21,10 @@ import docx
 # --- LangChain & Pydantic Core ---
 from langchain_core.tools import StructuredTool
 from pydantic import BaseModel, Field
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.chat_models import ChatOllama
 
 # --- Local Imports ---
 from .file_system import _resolve_path
+from ..llm_factory import invoke_tool_llm
 
 logger = logging.getLogger(__name__)
 
@@ -96,17 +98,6 @@ def critique_document(file: str, critique_prompt: str, workspace_path: str) -> s
 
     # --- LLM Critique Step ---
     try:
-        llm_id = os.getenv("EDITOR_LLM_ID", "gemini::gemini-1.5-pro-latest")
-        provider, model_name = llm_id.split("::")
-        logger.info(f"critique_document tool is using Editor LLM: {llm_id}")
-
-        if provider == "gemini":
-            llm = ChatGoogleGenerativeAI(model=model_name, google_api_key=os.getenv("GOOGLE_API_KEY"))
-        elif provider == "ollama":
-            llm = ChatOllama(model=model_name, base_url=os.getenv("OLLAMA_BASE_URL"))
-        else:
-            return f"Error: Unsupported LLM provider '{provider}' specified in EDITOR_LLM_ID."
-
         prompt = f"""
 You are an expert critic and editor. Your task is to provide a detailed, qualitative critique of the following document based *only* on the user's specific instructions.
 
@@ -120,9 +111,9 @@ You are an expert critic and editor. Your task is to provide a detailed, qualita
 
 Provide your critique. Structure your response clearly and address all aspects of the user's instructions.
 """
-        response = llm.invoke(prompt)
+        response_content = invoke_tool_llm(prompt, role="critique_document")
         logger.info(f"Successfully generated critique for file '{filename}'.")
-        return response.content
+        return response_content
 
     except Exception as e:
         logger.error(f"An error occurred during LLM critique: {e}", exc_info=True)
@@ -5,6 +5,8 @@
 # 1.  The `else` block now attempts to read any unrecognized file extension as
 #     plain text instead of skipping it.
 # 2.  This makes the tool more versatile for formats like .csv, .md, .py, etc.
+# 3.  The synthesis step uses the shared client from `backend/llm_factory.py`
+#     instead of building a new LLM client on every call.
 # -----------------------------------------------------------------------------
 
 import os
@@ -18,11 +20,10 @@ import openpyxl
 
 # --- LangChain & Pydantic Core ---
 from langchain_core.tools import StructuredTool
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.chat_models import ChatOllama
 
 # --- Local Imports ---
 from .file_system import _resolve_path
+from ..llm_factory import invoke_tool_llm
 
 logger = logging.getLogger(__name__)
 
@@ -119,17 +120,6 @@ def query_files(files: List[str], question: str, workspace_path: str) -> str:
     
     # --- LLM Synthesis Step ---
     try:
-        llm_id = os.getenv("EDITOR_LLM_ID", "gemini::gemini-1.5-pro-latest")
-        provider, model_name = llm_id.split("::")
-        logger.info(f"query_files tool is using Editor LLM: {llm_id}")
-
-        if provider == "gemini":
-            llm = ChatGoogleGenerativeAI(model=model_name, google_api_key=os.getenv("GOOGLE_API_KEY"))
-        elif provider == "ollama":
-            llm = ChatOllama(model=model_name, base_url=os.getenv("OLLAMA_BASE_URL"))
-        else:
-            return f"Error: Unsupported LLM provider '{provider}' specified in EDITOR_LLM_ID."
-
         prompt = f"""
 You are an expert research assistant. Your task is to answer a specific question based ONLY on the provided text context from one or more documents.
 
@@ -143,9 +133,9 @@ You are an expert research assistant. Your task is to answer a specific question
 
 Based solely on the context above, provide a comprehensive answer to the user's question. If the context does not contain the answer, state that clearly. Do not use any external knowledge.
 """
-        response = llm.invoke(prompt)
+        response_content = invoke_tool_llm(prompt, role="query_files")
         logger.info("Successfully synthesized an answer using the Editor LLM.")
-        return response.content
+        return response_content
 
     except Exception as e:
         logger.error(f"An error occurred during LLM synthesis: {e}", exc_info=True)
@@ -0,0 +1,343 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Streaming and Resumable Uploads
+#
+# `/upload` used to hand the request to Werkzeug's `parse_form_data`, which
+# spooled every file to memory or a temporary file before `FileStorage.save`
+# copied it a second time into the workspace, with no size limit at all.
+#
+# Components:
+# 1. `check_upload_size`: Rejects an upload before its body is read if it is
+#    larger than UPLOAD_MAX_BYTES or would push the workspace above
+#    WORKSPACE_QUOTA_BYTES (`UploadError` with status 413). The declared sizes
+#    of the workspace's pending resumable uploads count as used, and the
+#    quota is checked again (under the workspace's lock, see
+#    `workspace_quota`) before a file is moved into the workspace. Each
+#    workspace's usage is measured at most every WORKSPACE_USAGE_TTL_SECONDS
+#    and updated in between as uploads are placed.
+# 2. `StagedFileFactory`: A Werkzeug `stream_factory` that writes each file
+#    part straight into a hidden temporary file in the destination directory;
+#    `commit` moves it into place with `os.replace` (no second copy).
+# 3. Upload sessions: `create_session` / `write_chunk` / `get_session` /
+#    `cancel_session` implement chunked, resumable uploads. Chunks are
+#    appended to `<id>.part` in UPLOAD_STAGING_DIR at an explicit offset; a
+#    client that lost a chunk asks for the current offset and continues from
+#    there. Session metadata is persisted next to the part file, so uploads
+#    survive a server restart until UPLOAD_SESSION_TTL_SECONDS of inactivity.
+#
+# Configuration (optional, see `.env.example`):
+# - UPLOAD_MAX_BYTES: Largest accepted upload (request body or session size).
+# - WORKSPACE_QUOTA_BYTES: Disk space one task workspace may use (0 = no quota).
+# - WORKSPACE_USAGE_TTL_SECONDS: How long a measured workspace size is reused.
+# - UPLOAD_STAGING_DIR: Where resumable uploads are assembled. It must be on
+#   the same filesystem as the workspaces for `os.replace` to move the file,
+#   which is why it defaults to a hidden directory in the workspace volume;
+#   listings never show it.
+# - UPLOAD_SESSION_TTL_SECONDS: Idle time after which a session is discarded.
+# -----------------------------------------------------------------------------
+
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024 ** 3)))
+WORKSPACE_QUOTA_BYTES = int(os.getenv("WORKSPACE_QUOTA_BYTES", str(10 * 1024 ** 3)))
+UPLOAD_STAGING_DIR = os.getenv("UPLOAD_STAGING_DIR", "/app/workspace/.uploads")
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+WORKSPACE_USAGE_TTL_SECONDS = float(os.getenv("WORKSPACE_USAGE_TTL_SECONDS", "60"))
+UPLOAD_COPY_CHUNK_BYTES = 1024 * 1024
+# Uploaded files get the permissions `open()` would have given them, not mkstemp's 0600.
+UPLOADED_FILE_MODE = 0o644
+
+# Multipart file parts are staged next to their destination under this prefix.
+STAGED_UPLOAD_PREFIX = ".upload-"
+
+_UPLOAD_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+_session_locks: Dict[str, threading.Lock] = {}
+_session_locks_guard = threading.Lock()
+
+
+class UploadError(Exception):
+    """An upload that cannot be accepted; `status` is the HTTP status to answer with."""
+
+    def __init__(self, status: int, message: str, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+    def to_response(self) -> dict:
+        return {"error": str(self), **self.details}
+
+
+def directory_usage(path: str) -> int:
+    """Total size of the regular files below `path` (symlinks, staged uploads and UPLOAD_STAGING_DIR are skipped)."""
+    total, pending, staging_dir = 0, [path], os.path.abspath(UPLOAD_STAGING_DIR)
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.name.startswith(STAGED_UPLOAD_PREFIX): continue
+                        if entry.is_dir(follow_symlinks=False):
+                            if os.path.abspath(entry.path) != staging_dir: pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False): total += entry.stat(follow_symlinks=False).st_size
+                    except OSError: continue
+        except OSError: continue
+    return total
+
+
+def _existing_size(path: str) -> int:
+    try: return os.path.getsize(path) if os.path.isfile(path) else 0
+    except OSError: return 0
+
+
+@dataclass
+class WorkspaceUsage:
+    """
+    Last measured size of one workspace plus the declared sizes of its pending
+    resumable uploads. Only use it inside `workspace_quota`.
+    """
+    path: str
+    lock: threading.RLock = field(default_factory=threading.RLock)
+    used_bytes: int = 0
+    measured_at: float = float("-inf")
+    reservations: Dict[str, int] = field(default_factory=dict)
+
+    def check(self, incoming_bytes: int, replaced_paths=(), exclude_upload_id: Optional[str] = None):
+        """
+        Raises `UploadError(413)` if `incoming_bytes` would take the workspace
+        above the quota. Files in `replaced_paths` (files the upload
+        overwrites) do not count as used.
+        """
+        if WORKSPACE_QUOTA_BYTES <= 0: return
+        usage = self.used_bytes + sum(size for upload_id, size in self.reservations.items() if upload_id != exclude_upload_id)
+        usage -= sum(_existing_size(path) for path in replaced_paths if os.path.abspath(path).startswith(self.path + os.sep))
+        if usage + incoming_bytes > WORKSPACE_QUOTA_BYTES:
+            raise UploadError(413, f"Upload of {incoming_bytes} bytes exceeds the workspace quota ({usage} of {WORKSPACE_QUOTA_BYTES} bytes used or reserved by pending uploads).",
+                              quota_bytes=WORKSPACE_QUOTA_BYTES, used_bytes=usage)
+
+    def record_write(self, target_path: str, size: int):
+        """Accounts for `size` bytes about to replace whatever is at `target_path`."""
+        self.used_bytes += size - _existing_size(target_path)
+
+
+_workspace_usage: Dict[str, WorkspaceUsage] = {}
+_workspace_usage_guard = threading.Lock()
+_reservations_loaded = False
+
+
+def _load_reservations():
+    """Registers the pending sessions an earlier server process left in UPLOAD_STAGING_DIR."""
+    try: entries = list(os.scandir(UPLOAD_STAGING_DIR))
+    except FileNotFoundError: return
+    for entry in entries:
+        upload_id, _, extension = entry.name.partition(".")
+        if extension != "json" or not _UPLOAD_ID_PATTERN.fullmatch(upload_id): continue
+        try:
+            with open(entry.path) as f: metadata = json.load(f)
+            workspace_path = os.path.abspath(metadata["workspace_path"])
+            _workspace_usage.setdefault(workspace_path, WorkspaceUsage(workspace_path)).reservations[upload_id] = int(metadata["size"])
+        except (OSError, ValueError, KeyError, TypeError): continue
+
+
+def _usage_entry(workspace_path: str) -> WorkspaceUsage:
+    global _reservations_loaded
+    workspace_path = os.path.abspath(workspace_path)
+    with _workspace_usage_guard:
+        if not _reservations_loaded: _load_reservations(); _reservations_loaded = True
+        return _workspace_usage.setdefault(workspace_path, WorkspaceUsage(workspace_path))
+
+
+def _release_reservation(upload_id: str):
+    with _workspace_usage_guard: entries = list(_workspace_usage.values())
+    for usage in entries:
+        with usage.lock: usage.reservations.pop(upload_id, None)
+
+
+@contextmanager
+def workspace_quota(workspace_path: str):
+    """
+    Holds the quota lock of one workspace and yields its `WorkspaceUsage`.
+    The workspace is measured first, outside the lock, if the last
+    measurement is older than WORKSPACE_USAGE_TTL_SECONDS.
+    """
+    usage = _usage_entry(workspace_path)
+    if WORKSPACE_QUOTA_BYTES > 0 and time.monotonic() - usage.measured_at > WORKSPACE_USAGE_TTL_SECONDS:
+        measured_at = time.monotonic(); used_bytes = directory_usage(usage.path)
+        with usage.lock:
+            if measured_at > usage.measured_at: usage.used_bytes, usage.measured_at = used_bytes, measured_at
+    with usage.lock: yield usage
+
+
+def check_upload_size(workspace_path: Optional[str], incoming_bytes: int, replaced_paths=()):
+    """
+    Raises `UploadError(413)` if `incoming_bytes` exceed the upload limit or,
+    when `workspace_path` is given, the workspace quota.
+    """
+    if incoming_bytes > UPLOAD_MAX_BYTES:
+        raise UploadError(413, f"Upload of {incoming_bytes} bytes exceeds the limit of {UPLOAD_MAX_BYTES} bytes.", max_bytes=UPLOAD_MAX_BYTES)
+    if WORKSPACE_QUOTA_BYTES <= 0 or not workspace_path: return
+    with workspace_quota(workspace_path) as usage: usage.check(incoming_bytes, replaced_paths)
+
+
+def copy_request_body(source, destination, length: int) -> int:
+    """Copies exactly `length` bytes from the request stream to `destination` in bounded chunks."""
+    remaining = length
+    while remaining > 0:
+        chunk = source.read(min(UPLOAD_COPY_CHUNK_BYTES, remaining))
+        if not chunk: raise UploadError(400, f"The request body ended after {length - remaining} of {length} bytes.")
+        destination.write(chunk); remaining -= len(chunk)
+    return length
+
+
+def _place(temp_path: str, target_path: str):
+    os.chmod(temp_path, UPLOADED_FILE_MODE); os.replace(temp_path, target_path)
+
+
+class StagedFileFactory:
+    """
+    Werkzeug `stream_factory` that streams every file part of a multipart
+    request into a hidden temporary file in `directory`.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._files: List = []
+
+    def __call__(self, total_content_length=None, content_type=None, filename=None, content_length=None):
+        staged = tempfile.NamedTemporaryFile(dir=self.directory, prefix=STAGED_UPLOAD_PREFIX, suffix=".part", delete=False)
+        self._files.append(staged)
+        return staged
+
+    @staticmethod
+    def staged_size(file_storage) -> int:
+        file_storage.stream.flush(); return os.fstat(file_storage.stream.fileno()).st_size
+
+    def commit(self, file_storage, target_path: str):
+        """Moves the part behind `file_storage` to `target_path`."""
+        staged = file_storage.stream
+        staged.flush(); staged.close()
+        _place(staged.name, target_path)
+
+    def cleanup(self):
+        """Closes and removes every staged file that was not committed."""
+        for staged in self._files:
+            try: staged.close()
+            except OSError: pass
+            try: os.remove(staged.name)
+            except FileNotFoundError: pass
+            except OSError as e: logger.warning(f"Could not remove staged upload '{staged.name}': {e}")
+
+
+@dataclass
+class UploadSession:
+    upload_id: str
+    target_path: str
+    workspace_path: str
+    size: int
+    created_at: float
+
+    @property
+    def part_path(self) -> str:
+        return os.path.join(UPLOAD_STAGING_DIR, f"{self.upload_id}.part")
+
+    @property
+    def offset(self) -> int:
+        try: return os.path.getsize(self.part_path)
+        except FileNotFoundError: return 0
+
+    def status(self) -> dict:
+        return {"upload_id": self.upload_id, "offset": self.offset, "size": self.size, "complete": False}
+
+
+def _metadata_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_STAGING_DIR, f"{upload_id}.json")
+
+
+def _session_lock(upload_id: str) -> threading.Lock:
+    with _session_locks_guard: return _session_locks.setdefault(upload_id, threading.Lock())
+
+
+def _discard(upload_id: str):
+    for path in (os.path.join(UPLOAD_STAGING_DIR, f"{upload_id}.part"), _metadata_path(upload_id)):
+        try: os.remove(path)
+        except FileNotFoundError: pass
+    _release_reservation(upload_id)
+    with _session_locks_guard: _session_locks.pop(upload_id, None)
+
+
+def purge_expired_sessions():
+    """Removes sessions (and orphaned parts) that have not received a chunk within the TTL."""
+    cutoff = time.time() - UPLOAD_SESSION_TTL_SECONDS
+    try: entries = list(os.scandir(UPLOAD_STAGING_DIR))
+    except FileNotFoundError: return
+    for entry in entries:
+        upload_id, _, extension = entry.name.partition(".")
+        if extension not in ("part", "json") or not _UPLOAD_ID_PATTERN.fullmatch(upload_id): continue
+        try:
+            if entry.stat().st_mtime < cutoff: _discard(upload_id); logger.info(f"Discarded expired upload session {upload_id}.")
+        except OSError: continue
+
+
+def create_session(target_path: str, workspace_path: str, size: int) -> UploadSession:
+    """Starts a resumable upload of `size` bytes to `target_path` after checking the limits."""
+    if size < 0: raise UploadError(400, "'size' must not be negative.")
+    if not os.path.isdir(os.path.dirname(target_path)): raise UploadError(404, "The destination directory does not exist.")
+    purge_expired_sessions(); check_upload_size(None, size)
+    with workspace_quota(workspace_path) as usage:
+        usage.check(size, replaced_paths=(target_path,))
+        os.makedirs(UPLOAD_STAGING_DIR, exist_ok=True)
+        session = UploadSession(uuid.uuid4().hex, target_path, usage.path, size, time.time())
+        open(session.part_path, "wb").close()
+        fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_STAGING_DIR, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f: json.dump(asdict(session), f)
+        os.replace(tmp_path, _metadata_path(session.upload_id))
+        usage.reservations[session.upload_id] = size
+    logger.info(f"Started upload session {session.upload_id} for '{target_path}' ({size} bytes).")
+    return session
+
+
+def get_session(upload_id: str) -> UploadSession:
+    if not _UPLOAD_ID_PATTERN.fullmatch(upload_id or ""): raise UploadError(404, f"Unknown upload session '{upload_id}'.")
+    try:
+        with open(_metadata_path(upload_id)) as f: return UploadSession(**json.load(f))
+    except (FileNotFoundError, ValueError, TypeError): raise UploadError(404, f"Unknown upload session '{upload_id}'.")
+
+
+def write_chunk(upload_id: str, source, offset: int, length: int) -> dict:
+    """
+    Appends `length` bytes from `source` at `offset`, which must equal the
+    bytes received so far (409 with the current offset otherwise). When the
+    last byte arrives the file is moved to its destination.
+    """
+    with _session_lock(upload_id):
+        session = get_session(upload_id); current = session.offset
+        if offset != current: raise UploadError(409, f"Expected a chunk at offset {current}, got {offset}.", offset=current, size=session.size)
+        if offset + length > session.size: raise UploadError(413, f"The chunk ends at byte {offset + length}, beyond the declared size of {session.size} bytes.", offset=current, size=session.size)
+        # Bytes of an interrupted chunk are kept; the client resumes from the new `offset`.
+        with open(session.part_path, "r+b") as f: f.seek(offset); copy_request_body(source, f, length)
+        os.utime(_metadata_path(upload_id))
+        if offset + length < session.size: return session.status()
+        if not os.path.isdir(os.path.dirname(session.target_path)): raise UploadError(409, "The destination directory no longer exists.")
+        with workspace_quota(session.workspace_path) as usage:
+            # The workspace may have grown (e.g. through the agent's tools) since the session was created.
+            try: usage.check(session.size, replaced_paths=(session.target_path,), exclude_upload_id=upload_id)
+            except UploadError: _discard(upload_id); raise
+            usage.record_write(session.target_path, session.size)
+            _place(session.part_path, session.target_path); _discard(upload_id)
+        logger.info(f"Completed upload session {upload_id}: '{session.target_path}' ({session.size} bytes).")
+        return {"upload_id": upload_id, "offset": session.size, "size": session.size, "complete": True}
+
+
+def cancel_session(upload_id: str):
+    with _session_lock(upload_id):
+        get_session(upload_id); _discard(upload_id)
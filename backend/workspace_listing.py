@@ -0,0 +1,150 @@
+# -----------------------------------------------------------------------------
+# Mentor::i Workspace Listings
+#
+# `/api/workspace/items` used to call `os.listdir` and then `os.path.isdir`
+# and `os.path.getsize` per entry, and returned every entry in one response,
+# so opening a `.venv` or `node_modules` folder stalled the explorer.
+#
+# Components:
+# 1. `list_directory`: One `os.scandir` pass; the entry type comes from the
+#    directory entry itself and only files are stat'ed (for size and mtime).
+#    Results are sorted (`name`, `size`, `mtime` or `type` = folders first)
+#    and paginated with `offset`/`limit`.
+# 2. Recursive mode: Walks the tree breadth-first up to `depth` levels and
+#    returns a flat list with workspace-relative paths. Directories matching
+#    WORKSPACE_LISTING_IGNORE (e.g. `.venv`, `__pycache__`) are skipped, as
+#    are symlinked directories, and the walk stops after
+#    WORKSPACE_LISTING_MAX_ENTRIES entries (`truncated` in the result).
+# 3. `ListingCache`: The sorted listing of a directory is kept for
+#    WORKSPACE_LISTING_CACHE_TTL seconds, so paging through it does not rescan
+#    the directory. Entries are dropped when the server writes below the
+#    directory (`invalidate`) or when the directory's mtime changes (files
+#    created or removed by the agent's tools; for recursive listings only the
+#    top directory is checked, the TTL bounds the rest).
+#
+# Internal directories (the blob store, UPLOAD_STAGING_DIR and staged
+# multipart uploads) are never listed.
+# -----------------------------------------------------------------------------
+
+import os
+import time
+import fnmatch
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from .blob_store import BLOB_DIR_NAME
+from .uploads import STAGED_UPLOAD_PREFIX, UPLOAD_STAGING_DIR
+
+WORKSPACE_LISTING_IGNORE = tuple(pattern.strip() for pattern in os.getenv("WORKSPACE_LISTING_IGNORE", ".venv,venv,__pycache__,.git,node_modules,.mypy_cache,.pytest_cache").split(",") if pattern.strip())
+WORKSPACE_LISTING_CACHE_TTL = float(os.getenv("WORKSPACE_LISTING_CACHE_TTL", "2"))
+WORKSPACE_LISTING_MAX_ENTRIES = int(os.getenv("WORKSPACE_LISTING_MAX_ENTRIES", "20000"))
+WORKSPACE_LISTING_MAX_DEPTH = 10
+SORT_KEYS = ("type", "name", "size", "mtime")
+_STAGING_DIR = os.path.abspath(UPLOAD_STAGING_DIR)
+
+
+def _is_internal(entry: os.DirEntry) -> bool:
+    return entry.name == BLOB_DIR_NAME or entry.name.startswith(STAGED_UPLOAD_PREFIX) or os.path.abspath(entry.path) == _STAGING_DIR
+
+
+def _is_ignored(name: str, ignore_patterns: Tuple[str, ...]) -> bool:
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in ignore_patterns)
+
+
+def _entry_item(entry: os.DirEntry, relative_path: Optional[str] = None) -> dict:
+    try: is_dir = entry.is_dir()
+    except OSError: is_dir = False
+    size, mtime = 0, None
+    try:
+        stat_result = entry.stat() if not is_dir else None
+        if stat_result: size, mtime = stat_result.st_size, stat_result.st_mtime
+    except OSError: pass
+    item = {"name": entry.name, "type": "directory" if is_dir else "file", "size": size, "mtime": mtime}
+    if relative_path is not None: item["path"] = relative_path
+    return item
+
+
+def _scan(directory: str, recursive: bool, depth: int, ignore_patterns: Tuple[str, ...]) -> Tuple[List[dict], bool]:
+    """Returns the (unsorted) items below `directory` and whether the walk was cut at the entry limit."""
+    items: List[dict] = []; pending = deque([(directory, "", 1)])
+    while pending:
+        current, prefix, level = pending.popleft()
+        try: entries = os.scandir(current)
+        except OSError:
+            if current == directory: raise
+            continue
+        with entries:
+            for entry in entries:
+                if _is_internal(entry) or (recursive and _is_ignored(entry.name, ignore_patterns)): continue
+                if len(items) >= WORKSPACE_LISTING_MAX_ENTRIES: return items, True
+                relative_path = f"{prefix}{entry.name}"
+                item = _entry_item(entry, relative_path if recursive else None); items.append(item)
+                if recursive and item["type"] == "directory" and level < depth and not entry.is_symlink():
+                    pending.append((entry.path, relative_path + "/", level + 1))
+    return items, False
+
+
+def _sort(items: List[dict], sort: str, descending: bool) -> List[dict]:
+    key_name = (lambda item: item.get("path", item["name"]).casefold())
+    if sort == "type": key = lambda item: (item["type"] != "directory", key_name(item))
+    elif sort == "name": key = key_name
+    else: key = lambda item: (item[sort] or 0, key_name(item))
+    return sorted(items, key=key, reverse=descending)
+
+
+class ListingCache:
+    """Short-lived cache of sorted directory listings, validated by the directory's mtime."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[tuple, Tuple[float, int, List[dict], bool]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, mtime_ns: int) -> Optional[Tuple[List[dict], bool]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            stored_at, stored_mtime_ns, items, truncated = entry
+            if time.monotonic() - stored_at > self.ttl or stored_mtime_ns != mtime_ns:
+                del self._entries[key]; return None
+            return items, truncated
+
+    def put(self, key: tuple, mtime_ns: int, items: List[dict], truncated: bool):
+        if self.ttl <= 0: return
+        with self._lock:
+            now = time.monotonic()
+            for stale_key in [k for k, entry in self._entries.items() if now - entry[0] > self.ttl]: del self._entries[stale_key]
+            self._entries[key] = (now, mtime_ns, items, truncated)
+
+    def invalidate(self, path: str):
+        """Drops the listings of every directory that contains `path` (or lies below it)."""
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [k for k in self._entries if path.startswith(k[0].rstrip(os.sep) + os.sep) or k[0] == path or k[0].startswith(path + os.sep)]:
+                del self._entries[key]
+
+
+LISTING_CACHE = ListingCache(WORKSPACE_LISTING_CACHE_TTL)
+
+
+def list_directory(directory: str, offset: int = 0, limit: Optional[int] = None, sort: str = "type", descending: bool = False,
+                   recursive: bool = False, depth: int = 1, ignore_patterns: Tuple[str, ...] = WORKSPACE_LISTING_IGNORE) -> dict:
+    """
+    Returns `{"items", "total", "offset", "limit", "has_more", "truncated"}`
+    for one page of `directory`'s listing. Raises ValueError for invalid
+    options and OSError if the directory cannot be read.
+    """
+    if sort not in SORT_KEYS: raise ValueError(f"'sort' must be one of: {', '.join(SORT_KEYS)}.")
+    if offset < 0 or (limit is not None and limit < 0): raise ValueError("'offset' and 'limit' must not be negative.")
+    depth = max(1, min(depth, WORKSPACE_LISTING_MAX_DEPTH)) if recursive else 1
+    directory = os.path.abspath(directory)
+    key = (directory, sort, descending, recursive, depth, tuple(ignore_patterns) if recursive else ())
+    mtime_ns = os.stat(directory).st_mtime_ns
+    cached = LISTING_CACHE.get(key, mtime_ns)
+    if cached is None:
+        items, truncated = _scan(directory, recursive, depth, tuple(ignore_patterns))
+        cached = (_sort(items, sort, descending), truncated); LISTING_CACHE.put(key, mtime_ns, *cached)
+    items, truncated = cached
+    page = items[offset:] if limit is None else items[offset:offset + limit]
+    return {"items": page, "total": len(items), "offset": offset, "limit": limit, "has_more": offset + len(page) < len(items), "truncated": truncated}
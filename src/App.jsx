@@ -47,7 +47,20 @@ const InlineEditor = ({ item, onConfirm, onCancel }) => {
 };
 
 
-const FilePreviewer = ({ currentPath, file, isLoading, content, rawFileUrl }) => {
+// --- NEW: Shows how much of a large file is loaded and fetches the next window ---
+const PreviewWindowFooter = ({ fileWindow, isLoadingMore, onLoadMore }) => {
+    if (!fileWindow || fileWindow.loadedLines >= fileWindow.totalLines) return null;
+    return (
+        <div class="sticky bottom-0 flex items-center justify-between gap-2 p-2 bg-card/90 border-t border-border text-xs text-muted-foreground">
+            <span>Showing {fileWindow.loadedLines.toLocaleString()} of {fileWindow.totalLines.toLocaleString()} lines</span>
+            <button onClick={onLoadMore} disabled={isLoadingMore} class="px-2 py-1 rounded-md bg-secondary text-foreground hover:bg-secondary/80 disabled:opacity-50">
+                {isLoadingMore ? 'Loading...' : 'Load more'}
+            </button>
+        </div>
+    );
+};
+
+const FilePreviewer = ({ currentPath, file, isLoading, content, rawFileUrl, fileWindow, isLoadingMore, onLoadMore }) => {
     if (isLoading) {
         return <div class="flex items-center justify-center h-full"><LoaderIcon class="h-8 w-8 text-primary" /></div>;
     }
@@ -90,14 +103,18 @@ const FilePreviewer = ({ currentPath, file, isLoading, content, rawFileUrl }) =>
                         ))}
                     </tbody>
                 </table>
+                <PreviewWindowFooter fileWindow={fileWindow} isLoadingMore={isLoadingMore} onLoadMore={onLoadMore} />
             </div>
         );
     }
     
     return (
-        <pre class="h-full w-full text-sm text-muted-foreground font-mono">
-            <code>{content}</code>
-        </pre>
+        <div class="h-full w-full">
+            <pre class="w-full text-sm text-muted-foreground font-mono">
+                <code>{content}</code>
+            </pre>
+            <PreviewWindowFooter fileWindow={fileWindow} isLoadingMore={isLoadingMore} onLoadMore={onLoadMore} />
+        </div>
     );
 };
 
@@ -218,10 +235,35 @@ export function App() {
                 const eventType = event.type;
                 if (eventType === 'plan_approval_request') {
                     setIsAwaitingApproval(true);
-                    runContainer.children.push({ type: 'architect_plan', steps: event.plan, isAwaitingApproval: true });
+                    // Replace the plan streamed while it was being written with the final one.
+                    const streamingPlanIndex = runContainer.children.findIndex(c => c.type === 'architect_plan' && c.isStreaming);
+                    const approvalPlan = { type: 'architect_plan', steps: event.plan, isAwaitingApproval: true };
+                    if (streamingPlanIndex !== -1) runContainer.children[streamingPlanIndex] = approvalPlan;
+                    else runContainer.children.push(approvalPlan);
+                } else if (eventType === 'plan_partial') {
+                    // The Chief Architect's plan as it is being written (read-only until approval is requested).
+                    const streamingPlanIndex = runContainer.children.findIndex(c => c.type === 'architect_plan' && c.isStreaming);
+                    const partialPlan = { type: 'architect_plan', steps: event.plan, isAwaitingApproval: false, isStreaming: true };
+                    if (streamingPlanIndex !== -1) runContainer.children[streamingPlanIndex] = partialPlan;
+                    else runContainer.children.push(partialPlan);
+                } else if (eventType === 'final_answer_chunk') {
+                    // Streamed Editor tokens: append in sequence order to a provisional final answer card.
+                    const lastChild = runContainer.children[runContainer.children.length - 1];
+                    if (lastChild?.type === 'final_answer' && lastChild.isStreaming) {
+                        if (event.seq >= lastChild.nextSeq) {
+                            runContainer.children[runContainer.children.length - 1] = { ...lastChild, content: lastChild.content + event.data, nextSeq: event.seq + 1 };
+                        }
+                    } else {
+                        runContainer.children.push({ type: 'final_answer', content: event.data, isStreaming: true, nextSeq: event.seq + 1 });
+                    }
                 } else if (eventType === 'direct_answer' || eventType === 'final_answer') {
                     setIsAwaitingApproval(false);
-                    runContainer.children.push({ type: eventType, content: event.data });
+                    const lastChild = runContainer.children[runContainer.children.length - 1];
+                    if (eventType === 'final_answer' && lastChild?.type === 'final_answer' && lastChild.isStreaming) {
+                        runContainer.children[runContainer.children.length - 1] = { type: eventType, content: event.data };
+                    } else {
+                        runContainer.children.push({ type: eventType, content: event.data });
+                    }
                     runContainer.isComplete = true;
                 } else if (eventType === 'plan_updated') {
                     if (runContainer) {
@@ -488,7 +530,7 @@ export function App() {
                                 <CopyButton textToCopy={workspace.fileContent} />
                             </div>
                             <div class="flex-grow bg-background/50 rounded-md overflow-auto flex items-center justify-center">
-                                <FilePreviewer file={workspace.selectedFile} isLoading={workspace.isFileLoading} content={workspace.fileContent} rawFileUrl={`http://${window.location.hostname}:8766/api/workspace/raw?path=${workspace.currentPath}/${workspace.selectedFile.name}`} />
+                                <FilePreviewer file={workspace.selectedFile} isLoading={workspace.isFileLoading} content={workspace.fileContent} fileWindow={workspace.fileWindow} isLoadingMore={workspace.isLoadingMore} onLoadMore={workspace.loadMoreFileContent} rawFileUrl={`http://${window.location.hostname}:8766/api/workspace/raw?path=${workspace.currentPath}/${workspace.selectedFile.name}`} />
                             </div>
                         </div>
                     ) : (
@@ -535,7 +577,12 @@ export function App() {
                                                 </div>
                                             </li> 
                                         );
-                                    })} 
+                                    })}
+                                    {workspace.items.length < workspace.itemsTotal && (
+                                        <li class="p-2 -ml-2 -mr-2">
+                                            <button onClick={workspace.loadMoreItems} class="text-xs text-muted-foreground hover:text-foreground">Show more ({(workspace.itemsTotal - workspace.items.length).toLocaleString()} remaining)</button>
+                                        </li>
+                                    )}
                                  </ul> 
                                 )}
                              </div>
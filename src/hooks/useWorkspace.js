@@ -3,16 +3,64 @@ import { useState, useRef, useCallback } from 'preact/hooks';
 
 // --- NEW: Use the window's hostname to determine the backend API address ---
 const API_BASE_URL = `http://${window.location.hostname}:8766`;
+// --- NEW: Large files are previewed one window of lines at a time ---
+const PREVIEW_PAGE_LINES = 1000;
+// --- NEW: Directory listings are fetched in pages, sorted by the server (folders first) ---
+const LISTING_PAGE_SIZE = 500;
+
+// --- NEW: Large files are uploaded in resumable chunks instead of one multipart request ---
+const RESUMABLE_UPLOAD_THRESHOLD = 32 * 1024 * 1024;
+const UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024;
+const UPLOAD_CHUNK_RETRIES = 3;
+
+const uploadFileResumable = async (file, destinationPath) => {
+    const sessionResponse = await fetch(`${API_BASE_URL}/api/uploads`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ path: destinationPath, size: file.size }),
+    });
+    if (!sessionResponse.ok) throw new Error((await sessionResponse.json()).error || 'Could not start the upload');
+    let { upload_id: uploadId, offset, complete } = await sessionResponse.json();
+    let failures = 0;
+    while (!complete) {
+        try {
+            const response = await fetch(`${API_BASE_URL}/api/uploads/${uploadId}?offset=${offset}`, {
+                method: 'PUT',
+                body: file.slice(offset, Math.min(offset + UPLOAD_CHUNK_BYTES, file.size)),
+            });
+            const data = await response.json();
+            // 409 means the server has a different offset (e.g. a chunk arrived partially); continue from there.
+            if (!response.ok && response.status !== 409) throw new Error(data.error || 'Chunk upload failed');
+            ({ offset, complete = false } = data);
+            failures = 0;
+        } catch (err) {
+            if (++failures > UPLOAD_CHUNK_RETRIES) {
+                await fetch(`${API_BASE_URL}/api/uploads/${uploadId}`, { method: 'DELETE' }).catch(() => {});
+                throw err;
+            }
+            const statusResponse = await fetch(`${API_BASE_URL}/api/uploads/${uploadId}`).catch(() => null);
+            if (statusResponse?.ok) ({ offset } = await statusResponse.json());
+        }
+    }
+};
+
+const readPreviewWindow = (response) => ({
+    totalLines: parseInt(response.headers.get('X-Total-Lines') || '0', 10),
+    loadedLines: parseInt(response.headers.get('X-Line-Offset') || '0', 10) + parseInt(response.headers.get('X-Line-Count') || '0', 10),
+});
 
 export const useWorkspace = (initialPath) => {
     const [items, setItems] = useState([]);
     const [currentPath, setCurrentPath] = useState(initialPath || '');
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState(null);
+    const [itemsTotal, setItemsTotal] = useState(0);
 
     const [selectedFile, setSelectedFile] = useState(null);
     const [fileContent, setFileContent] = useState('');
     const [isFileLoading, setIsFileLoading] = useState(false);
+    const [fileWindow, setFileWindow] = useState(null);
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
 
     const [isDragOver, setIsDragOver] = useState(false);
     const dragCounter = useRef(0);
@@ -23,33 +71,47 @@ export const useWorkspace = (initialPath) => {
         setLoading(true);
         setError(null);
         try {
-            // --- MODIFIED: Use dynamic base URL ---
-            const response = await fetch(`${API_BASE_URL}/api/workspace/items?path=${path}`);
+            // --- MODIFIED: Fetch the first page; the server sorts folders first, then by name ---
+            const response = await fetch(`${API_BASE_URL}/api/workspace/items?path=${path}&sort=type&limit=${LISTING_PAGE_SIZE}`);
             if (!response.ok) {
                 const errorData = await response.json();
                 throw new Error(errorData.error || 'Failed to fetch items');
             }
             const data = await response.json();
-            const sortedItems = (data.items || []).sort((a, b) => {
-                if (a.type === 'directory' && b.type !== 'directory') return -1;
-                if (a.type !== 'directory' && b.type === 'directory') return 1;
-                return a.name.localeCompare(b.name);
-            });
-            setItems(sortedItems);
+            setItems(data.items || []);
+            setItemsTotal(data.total || 0);
         } catch (err) {
             console.error("Failed to fetch workspace items:", err);
             setError(err.message);
             setItems([]);
+            setItemsTotal(0);
         } finally {
             setLoading(false);
         }
     }, []);
 
+    // --- NEW: Appends the next page of the current directory ---
+    const loadMoreItems = async () => {
+        const loadedItems = items.filter(item => !item.isEditing && !item.isLoading).length;
+        if (!currentPath || loadedItems >= itemsTotal) return;
+        try {
+            const response = await fetch(`${API_BASE_URL}/api/workspace/items?path=${currentPath}&sort=type&offset=${loadedItems}&limit=${LISTING_PAGE_SIZE}`);
+            if (!response.ok) throw new Error((await response.json()).error || 'Failed to fetch items');
+            const data = await response.json();
+            setItems(prev => [...prev, ...(data.items || [])]);
+            setItemsTotal(data.total || 0);
+        } catch (err) {
+            console.error("Failed to fetch more workspace items:", err);
+            setError(err.message);
+        }
+    };
+
     const selectAndFetchFile = async (file) => {
         if (!currentPath || !file) return;
 
         setSelectedFile(file);
         setFileContent('');
+        setFileWindow(null);
 
         const extension = file.name.split('.').pop().toLowerCase();
         const isImage = ['png', 'jpg', 'jpeg', 'gif', 'svg', 'webp'].includes(extension);
@@ -69,6 +131,7 @@ export const useWorkspace = (initialPath) => {
             }
             const textContent = await response.text();
             setFileContent(textContent);
+            setFileWindow(readPreviewWindow(response));
         } catch (err) {
             console.error("Failed to fetch file content:", err);
             setFileContent(`Error loading file: ${err.message}`);
@@ -77,6 +140,27 @@ export const useWorkspace = (initialPath) => {
         }
     };
 
+    // --- NEW: Appends the next window of lines to the preview ---
+    const loadMoreFileContent = async () => {
+        if (!selectedFile || !fileWindow || fileWindow.loadedLines >= fileWindow.totalLines || isLoadingMore) return;
+        setIsLoadingMore(true);
+        try {
+            const response = await fetch(`${API_BASE_URL}/file-content?path=${currentPath}&filename=${selectedFile.name}&offset=${fileWindow.loadedLines}&limit=${PREVIEW_PAGE_LINES}`);
+            if (!response.ok) {
+                const errorData = await response.json();
+                throw new Error(errorData.error || 'Failed to fetch file content');
+            }
+            const textContent = await response.text();
+            setFileContent(prev => prev + textContent);
+            setFileWindow(readPreviewWindow(response));
+        } catch (err) {
+            console.error("Failed to fetch more file content:", err);
+            setError(err.message);
+        } finally {
+            setIsLoadingMore(false);
+        }
+    };
+
     const handleNavigation = (item) => {
         if (item.type === 'directory') {
             const newPath = `${currentPath}/${item.name}`;
@@ -195,8 +279,12 @@ export const useWorkspace = (initialPath) => {
             formData.append('file', file);
             formData.append('workspace_id', currentPath);
             try {
-                // --- MODIFIED: Use dynamic base URL ---
-                const response = await fetch(`${API_BASE_URL}/upload`, { method: 'POST', body: formData });
+                if (file.size >= RESUMABLE_UPLOAD_THRESHOLD) {
+                    await uploadFileResumable(file, `${currentPath}/${file.name}`);
+                    return;
+                }
+                // --- MODIFIED: The workspace is also sent in the URL so the server can check the quota before reading the body ---
+                const response = await fetch(`${API_BASE_URL}/upload?workspace_id=${encodeURIComponent(currentPath)}`, { method: 'POST', body: formData });
                 if (!response.ok) throw new Error((await response.json()).error || 'File upload failed');
             } catch (err) {
                 console.error(`File upload error for ${file.name}:`, err);
@@ -229,7 +317,7 @@ export const useWorkspace = (initialPath) => {
     };
 
     return {
-        items, currentPath, loading, error, selectedFile, setSelectedFile, fileContent, isFileLoading, isDragOver, fileInputRef,
+        items, itemsTotal, loadMoreItems, currentPath, loading, error, selectedFile, setSelectedFile, fileContent, isFileLoading, fileWindow, isLoadingMore, loadMoreFileContent, isDragOver, fileInputRef,
         setCurrentPath, fetchFiles, handleNavigation, handleBreadcrumbNav, deleteItem,
         uploadFiles, handleDragEnter, handleDragLeave, handleDragOver, handleDrop, resetWorkspaceViews,
         startInlineCreate, startInlineRename, handleConfirmName,